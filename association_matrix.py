@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Food x metabolite association matrix
+Exports the per-food correlations as a matrix with one row per food and one
+column per canonical metabolite ID. The signed array holds positive minus
+negative correlations and the evidence array holds the number of correlations
+behind each cell. Both are plain .npy files, stored dense or in CSR form, next
+to text sidecars with the row and column labels and a JSON manifest. Readers
+open the arrays memory-mapped, so several processes on one node share the same
+pages instead of each parsing the interface JSON.
+"""
+
+import argparse
+import json
+import os
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+from interface_store import load_interface_file
+from json_stream import atomic_write
+from metabolite_normalizer import MetaboliteNormalizer, canonical_id_for, default_normalizer
+
+MATRIX_FORMATS = ("dense", "csr")
+CORRELATION_SIGNS = {"Positive": 1, "Negative": -1}
+MANIFEST_SUFFIX = ".json"
+
+def _array_paths(prefix: str, matrix_format: str) -> Dict[str, str]:
+    names = ("signed", "evidence") + (("indptr", "indices") if matrix_format == "csr" else ())
+    return {name: f"{prefix}.{name}.npy" for name in names}
+
+class AssociationMatrix:
+    """
+    Signed food x metabolite matrix with evidence counts
+    In dense form signed and evidence are foods x metabolites arrays; in CSR
+    form they hold the nonzero cells of each row, located by indptr and indices.
+    """
+
+    def __init__(self, foods: List[str], metabolites: List[str], signed: np.ndarray,
+                 evidence: np.ndarray, indptr: Optional[np.ndarray] = None,
+                 indices: Optional[np.ndarray] = None):
+        self.foods = foods
+        self.metabolites = metabolites
+        self.signed = signed
+        self.evidence = evidence
+        self.indptr = indptr
+        self.indices = indices
+        self.format = "dense" if indptr is None else "csr"
+        self._food_rows = {food: row for row, food in enumerate(foods)}
+        self._metabolite_columns = {metabolite: column for column, metabolite in enumerate(metabolites)}
+
+    @property
+    def shape(self):
+        return len(self.foods), len(self.metabolites)
+
+    @classmethod
+    def build(cls, data: Dict[str, Any],
+              normalizer: Optional[MetaboliteNormalizer] = None) -> "AssociationMatrix":
+        """
+        Build the CSR matrix from interface data ({'foods': [...]})
+        Correlations an expert has rejected (verified is False) are left out.
+        Names without an exact or synonym match keep a column of their own,
+        keyed the same way as canonical IDs, so a fuzzy guess never merges two
+        distinct metabolites into one column.
+        """
+        normalizer = normalizer or default_normalizer()
+        foods: Dict[str, Dict[int, List[int]]] = {}
+        metabolites: Dict[str, int] = {}
+
+        for food in data.get("foods", []):
+            # A food listed twice gets a single row
+            row = foods.setdefault(food["name"], {})
+            for correlation in food.get("correlations", []):
+                sign = CORRELATION_SIGNS.get(correlation.get("correlationType"))
+                name = correlation.get("metabolite")
+                if sign is None or correlation.get("verified") is False or not name:
+                    continue
+                metabolite = normalizer.normalize(name).exact_id or canonical_id_for(name)
+                cell = row.setdefault(metabolites.setdefault(metabolite, len(metabolites)), [0, 0])
+                cell[0] += sign
+                cell[1] += 1
+
+        indptr = np.zeros(len(foods) + 1, dtype=np.int64)
+        indices, signed, evidence = [], [], []
+        for row, cells in enumerate(foods.values()):
+            for column in sorted(cells):
+                indices.append(column)
+                signed.append(cells[column][0])
+                evidence.append(cells[column][1])
+            indptr[row + 1] = len(indices)
+        return cls(list(foods), list(metabolites), np.array(signed, dtype=np.int32),
+                   np.array(evidence, dtype=np.int32), indptr, np.array(indices, dtype=np.int32))
+
+    def to_dense(self) -> "AssociationMatrix":
+        if self.format == "dense":
+            return self
+        signed = np.zeros(self.shape, dtype=np.int32)
+        evidence = np.zeros(self.shape, dtype=np.int32)
+        rows = np.repeat(np.arange(len(self.foods)), np.diff(self.indptr))
+        signed[rows, self.indices] = self.signed
+        evidence[rows, self.indices] = self.evidence
+        return AssociationMatrix(self.foods, self.metabolites, signed, evidence)
+
+    def row(self, food: str) -> Dict[str, Dict[str, int]]:
+        """Nonzero cells of one food: {metabolite: {'signed': ..., 'evidence': ...}}"""
+        row = self._food_rows[food]
+        if self.format == "csr":
+            start, end = self.indptr[row], self.indptr[row + 1]
+            columns = self.indices[start:end]
+            signed, evidence = self.signed[start:end], self.evidence[start:end]
+        else:
+            columns = np.flatnonzero(self.evidence[row])
+            signed, evidence = self.signed[row, columns], self.evidence[row, columns]
+        return {self.metabolites[column]: {"signed": int(s), "evidence": int(e)}
+                for column, s, e in zip(columns, signed, evidence)}
+
+    def column(self, metabolite: str) -> Dict[str, Dict[str, int]]:
+        """Nonzero cells of one metabolite: {food: {'signed': ..., 'evidence': ...}}"""
+        column = self._metabolite_columns[metabolite]
+        if self.format == "csr":
+            positions = np.flatnonzero(self.indices == column)
+            rows = np.searchsorted(self.indptr, positions, side="right") - 1
+            signed, evidence = self.signed[positions], self.evidence[positions]
+        else:
+            rows = np.flatnonzero(self.evidence[:, column])
+            signed, evidence = self.signed[rows, column], self.evidence[rows, column]
+        return {self.foods[row]: {"signed": int(s), "evidence": int(e)}
+                for row, s, e in zip(rows, signed, evidence)}
+
+    def save(self, prefix: str, matrix_format: str = "csr") -> str:
+        """
+        Write the arrays, label sidecars and manifest under prefix; returns the
+        manifest path
+        """
+        if matrix_format not in MATRIX_FORMATS:
+            raise ValueError(f"Unknown matrix format: {matrix_format}")
+        if matrix_format == "csr" and self.format != "csr":
+            raise ValueError("A dense matrix cannot be saved in CSR form")
+        matrix = self.to_dense() if matrix_format == "dense" else self
+
+        arrays = {name: getattr(matrix, name) for name in _array_paths(prefix, matrix_format)}
+        for name, path in _array_paths(prefix, matrix_format).items():
+            _write_atomic(path, lambda f, values=arrays[name]: np.save(f, np.ascontiguousarray(values)))
+        _write_labels(f"{prefix}.foods.txt", self.foods)
+        _write_labels(f"{prefix}.metabolites.txt", self.metabolites)
+
+        # The manifest is written last, so a reader that finds it finds complete arrays
+        manifest = {
+            "version": 1,
+            "format": matrix_format,
+            "shape": list(self.shape),
+            "nonzero": int(len(self.indices)) if self.format == "csr" else int(np.count_nonzero(self.evidence)),
+            "arrays": {name: os.path.basename(path) for name, path in _array_paths(prefix, matrix_format).items()},
+            "foods": os.path.basename(f"{prefix}.foods.txt"),
+            "metabolites": os.path.basename(f"{prefix}.metabolites.txt")
+        }
+        manifest_file = prefix + MANIFEST_SUFFIX
+        _write_atomic(manifest_file, lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8")))
+        return manifest_file
+
+def _write_atomic(path: str, write):
+    with atomic_write(path, 'wb') as f:
+        write(f)
+
+def _write_labels(path: str, labels: List[str]):
+    _write_atomic(path, lambda f: f.write("".join(f"{label}\n" for label in labels).encode("utf-8")))
+
+def _read_labels(path: str) -> List[str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f]
+
+def load_association_matrix(manifest_file: str, mmap: bool = True) -> AssociationMatrix:
+    """Open a saved matrix; with mmap the arrays are read-only memory maps"""
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get("version") != 1:
+        raise ValueError(f"Unsupported association matrix version: {manifest.get('version')}")
+
+    directory = os.path.dirname(os.path.abspath(manifest_file))
+    arrays = {name: np.load(os.path.join(directory, filename), mmap_mode="r" if mmap else None)
+              for name, filename in manifest["arrays"].items()}
+    return AssociationMatrix(_read_labels(os.path.join(directory, manifest["foods"])),
+                             _read_labels(os.path.join(directory, manifest["metabolites"])),
+                             arrays["signed"], arrays["evidence"],
+                             arrays.get("indptr"), arrays.get("indices"))
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the correlations as a food x metabolite association matrix')
+    parser.add_argument('--data', default='expert_interface_data.json',
+                       help='Interface data to export (JSON, .fmcol or .sqlite)')
+    parser.add_argument('--output', default='association_matrix',
+                       help='Output prefix for the arrays, label files and manifest (default: association_matrix)')
+    parser.add_argument('--format', choices=MATRIX_FORMATS, default='csr',
+                       help='Store the matrix dense or in CSR form (default: csr)')
+
+    args = parser.parse_args()
+
+    matrix = AssociationMatrix.build(load_interface_file(args.data))
+    manifest_file = matrix.save(args.output, args.format)
+    foods, metabolites = matrix.shape
+    print(f"Saved {foods} foods x {metabolites} metabolites ({len(matrix.indices)} nonzero cells, "
+          f"{args.format}) to {manifest_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the prompt -> inference -> parse -> export pipeline
+Runs each pipeline stage against a deterministic fake backend at several food
+counts and reports p50/p95 latency, foods per second and peak RSS. Results are
+written to a JSON baseline so throughput regressions show up in diffs.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Callable, Optional
+
+from food_metabolite_analyzer import FoodMetaboliteAnalyzer
+from generate_comprehensive_correlations import METABOLITE_CATEGORIES, REAL_REFERENCES_DATABASE
+from execution_policy import ExecutionPolicy
+from llama_backends import LlamaBackend
+from llama_integration import LlamaIntegration
+
+DEFAULT_SIZES = [150, 1500, 15000]
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+METABOLITES = [metabolite for metabolites in METABOLITE_CATEGORIES.values() for metabolite in metabolites]
+FOOD_IN_PROMPT = re.compile(r'the food item "([^"]*)"')
+
+class FakeBackend(LlamaBackend):
+    """
+    Deterministic stand-in for a Llama backend
+    The same prompt always produces the same response, built from the
+    reference and metabolite lists in the format the prompt asks for, after a
+    configurable simulated latency.
+    """
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, correlations_per_food: int = 20):
+        super().__init__({"model_path": "fake-benchmark-model"})
+        self.latency = latency
+        self.correlations_per_food = correlations_per_food
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        match = FOOD_IN_PROMPT.search(prompt)
+        food = match.group(1) if match else "this food"
+        rng = random.Random(zlib.crc32(prompt.encode("utf-8")))
+
+        blocks = [f"Based on my analysis of the scientific literature, I found the following correlations for {food}:"]
+        for metabolite in rng.sample(METABOLITES, self.correlations_per_food):
+            ref = rng.choice(REAL_REFERENCES_DATABASE)
+            direction = rng.choice(["Positive", "Negative"])
+            change = "increase" if direction == "Positive" else "decrease"
+            blocks.append(f"Reference: {ref['authors']} ({ref['year']}). {ref['title']}. {ref['journal']}\n"
+                          f"Metabolite: {metabolite}\n"
+                          f"Correlation Type: {direction}\n"
+                          f"Finding Description: {metabolite} levels in blood {change} after {food} consumption\n"
+                          f"Relevant Quote: Consumption of {food} led to a significant {change} in "
+                          f"{metabolite.lower()} levels (p<0.05)")
+        return "\n\n".join(blocks)
+
+def synthetic_foods(count: int, foods_file: str = "foods.csv") -> List[str]:
+    """Return `count` distinct food names, cycling through foods.csv"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        base = FoodMetaboliteAnalyzer(foods_file).foods or ["food"]
+    return [base[i % len(base)] if i < len(base) else f"{base[i % len(base)]} #{i // len(base)}"
+            for i in range(count)]
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of the samples"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(samples: List[float], foods: int, total_seconds: float) -> Dict[str, float]:
+    """Latency percentiles (ms) and throughput for one stage"""
+    return {
+        "samples": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "foods_per_second": round(foods / total_seconds, 1) if total_seconds > 0 else None
+    }
+
+def time_each(fn: Callable[[Any], Any], items: List[Any]) -> List[float]:
+    """Time fn once per item"""
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def time_runs(fn: Callable[[], Any], repeats: int) -> List[float]:
+    """Time `repeats` runs of a whole-batch stage"""
+    return time_each(lambda _: fn(), list(range(repeats)))
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def run_size(count: int, latency: float = 0.0, repeats: int = 3) -> Dict[str, Any]:
+    """Benchmark every pipeline stage for `count` foods"""
+    foods = synthetic_foods(count)
+    stages = {}
+
+    with tempfile.TemporaryDirectory() as tmpdir, contextlib.redirect_stdout(io.StringIO()):
+        analyzer = FoodMetaboliteAnalyzer(os.devnull)
+        analyzer.foods = foods
+        # Prompts are memoized, so rendering is timed from an empty cache and
+        # from the cache the last cold run filled separately
+        timings = []
+        for _ in range(repeats):
+            analyzer.prompt_cache.clear()
+            timings.extend(time_runs(analyzer.generate_all_prompts, 1))
+        stages["generate_all_prompts"] = summarize(timings, count, sorted(timings)[len(timings) // 2])
+        timings = time_runs(analyzer.generate_all_prompts, repeats)
+        stages["generate_all_prompts_cached"] = summarize(timings, count, sorted(timings)[len(timings) // 2])
+        prompts = analyzer.generate_all_prompts()
+
+        integration = LlamaIntegration(os.path.join(tmpdir, "prompts.json"),
+                                       os.path.join(tmpdir, "correlations.json"),
+                                       backend=FakeBackend(latency),
+                                       policy=ExecutionPolicy(retry_attempts=0))
+        integration.prompts = prompts
+
+        responses = {}
+        def call(food):
+            responses[food] = integration.call_llama(food, prompts[food])
+        start = time.perf_counter()
+        timings = time_each(call, foods)
+        stages["call_llama"] = summarize(timings, count, time.perf_counter() - start)
+
+        correlations = {}
+        def parse(food):
+            parsed = integration.parse_llama_response(responses[food], food)
+            correlations[food] = {
+                'prompt': prompts[food],
+                'correlations': parsed,
+                'total_correlations': len(parsed),
+                'processed_at': '2024-01-01T00:00:00'
+            }
+        start = time.perf_counter()
+        timings = time_each(parse, foods)
+        stages["parse_llama_response"] = summarize(timings, count, time.perf_counter() - start)
+        del responses
+
+        timings = time_runs(lambda: integration.save_correlations(correlations), repeats)
+        stages["save_correlations"] = summarize(timings, count, sorted(timings)[len(timings) // 2])
+
+        timings = time_runs(lambda: integration.create_expert_interface_data(correlations), repeats)
+        stages["create_expert_interface_data"] = summarize(timings, count, sorted(timings)[len(timings) // 2])
+        integration.close()
+
+    return {"foods": count, "peak_rss_mb": peak_rss_mb(), "stages": stages}
+
+def run_benchmark(sizes: List[int], latency: float = 0.0, repeats: int = 3,
+                  isolate: bool = True) -> Dict[str, Any]:
+    """
+    Benchmark each size, by default in a fresh process so peak RSS is per size
+    """
+    results = []
+    for count in sizes:
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_size, count, latency, repeats).result()
+        else:
+            result = run_size(count, latency, repeats)
+        print_result(result)
+        results.append(result)
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(terse=True),
+            "latency_ms": latency * 1000,
+            "repeats": repeats
+        },
+        "results": results
+    }
+
+def print_result(result: Dict[str, Any]):
+    print(f"\n{result['foods']} foods (peak RSS {result['peak_rss_mb']} MB)")
+    print(f"  {'stage':<30} {'p50 ms':>10} {'p95 ms':>10} {'foods/s':>12}")
+    for stage, stats in result["stages"].items():
+        print(f"  {stage:<30} {stats['p50_ms']:>10.3f} {stats['p95_ms']:>10.3f} "
+              f"{stats['foods_per_second'] or 0:>12.1f}")
+
+def compare_with_baseline(report: Dict[str, Any], baseline_file: str):
+    """Print the throughput change of each stage against a saved baseline"""
+    try:
+        with open(baseline_file, 'r') as f:
+            baseline = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+
+    previous = {(r["foods"], stage): stats["foods_per_second"]
+                for r in baseline.get("results", []) for stage, stats in r["stages"].items()}
+    print(f"\nThroughput against {baseline_file}:")
+    for result in report["results"]:
+        for stage, stats in result["stages"].items():
+            before = previous.get((result["foods"], stage))
+            if before and stats["foods_per_second"]:
+                change = (stats["foods_per_second"] / before - 1) * 100
+                print(f"  {result['foods']:>6} foods  {stage:<30} {change:+7.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the food-metabolite pipeline stages')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                       help='Food counts to benchmark (default: 150 1500 15000)')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                       help='Simulated inference latency per call of the fake backend (default: 0)')
+    parser.add_argument('--repeats', type=int, default=3,
+                       help='Runs of each whole-batch stage (default: 3)')
+    parser.add_argument('--output', default=DEFAULT_BASELINE,
+                       help=f'Baseline JSON file to write (default: {DEFAULT_BASELINE})')
+    parser.add_argument('--compare', action='store_true',
+                       help='Compare against the existing baseline before overwriting it')
+    parser.add_argument('--no-save', action='store_true',
+                       help='Print the results without writing the baseline')
+
+    args = parser.parse_args()
+
+    print("Food-Metabolite Pipeline Benchmark")
+    print("=" * 50)
+
+    report = run_benchmark(args.sizes, args.latency_ms / 1000, args.repeats)
+
+    if args.compare:
+        compare_with_baseline(report, args.output)
+
+    if not args.no_save:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nSaved benchmark baseline to {args.output}")
+
+if __name__ == "__main__":
+    main()
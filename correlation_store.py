@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+SQLite store for food-metabolite correlations
+Foods, metabolites, references and correlations live in indexed tables, so a
+single food can be inserted or replaced without rewriting anything else, and
+questions such as "which foods are positively associated with metabolite X"
+are answered from an index. The JSON files used by the expert interface are
+exported from the store on demand.
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+DEFAULT_STORE_FILE = "correlations.sqlite"
+
+# Food and correlation fields with their own columns; anything else is kept
+# in the row's `extra` JSON so exports reproduce the original records
+FOOD_FIELDS = ('prompt', 'verified', 'expertNotes', 'processed_at', 'total_correlations')
+CORRELATION_FIELDS = ('reference', 'metabolite', 'correlationType', 'finding',
+                      'relevantQuote', 'verified', 'expertNotes')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS foods (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    prompt TEXT,
+    verified INTEGER,
+    expert_notes TEXT,
+    processed_at TEXT,
+    total_correlations INTEGER,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS metabolites (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS refs (
+    id INTEGER PRIMARY KEY,
+    citation TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS correlations (
+    id INTEGER PRIMARY KEY,
+    food_id INTEGER NOT NULL REFERENCES foods (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    metabolite_id INTEGER REFERENCES metabolites (id),
+    reference_id INTEGER REFERENCES refs (id),
+    correlation_type TEXT,
+    finding TEXT,
+    relevant_quote TEXT,
+    verified INTEGER,
+    expert_notes TEXT,
+    extra TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_correlations_food ON correlations (food_id, position);
+CREATE INDEX IF NOT EXISTS idx_correlations_metabolite ON correlations (metabolite_id, correlation_type);
+CREATE INDEX IF NOT EXISTS idx_correlations_type ON correlations (correlation_type);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def _to_flag(value: Any) -> Optional[int]:
+    return None if value is None else int(bool(value))
+
+def _from_flag(value: Optional[int]) -> Optional[bool]:
+    return None if value is None else bool(value)
+
+# Fields an expert may change through update_food / update_correlation, and their columns
+REVIEW_FIELDS = {'verified': 'verified', 'expertNotes': 'expert_notes'}
+
+SUMMARY_QUERY = """
+    SELECT foods.id, foods.name, COUNT(correlations.id),
+           COALESCE(SUM(correlations.verified = 1), 0),
+           COALESCE(SUM(correlations.id IS NOT NULL AND correlations.verified IS NULL), 0)
+    FROM foods LEFT JOIN correlations ON correlations.food_id = foods.id
+"""
+
+def _summary(row: Tuple) -> Dict[str, Any]:
+    food_id, name, total, verified, pending = row
+    return {'id': food_id, 'name': name, 'correlations': total, 'verified': verified, 'pending': pending}
+
+def _like(text: str) -> str:
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def _review_changes(changes: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    unknown = set(changes) - set(REVIEW_FIELDS)
+    if unknown:
+        raise ValueError(f"Fields cannot be updated: {', '.join(sorted(unknown))}")
+    # A stray string such as "no" must not be stored as a truthy verdict
+    if 'verified' in changes and changes['verified'] is not None and not isinstance(changes['verified'], bool):
+        raise ValueError("verified must be true, false or null")
+    if 'expertNotes' in changes and not isinstance(changes['expertNotes'], str):
+        raise ValueError("expertNotes must be a string")
+    assignments = ", ".join(f"{REVIEW_FIELDS[field]} = ?" for field in changes)
+    values = [_to_flag(value) if field == 'verified' else value for field, value in changes.items()]
+    return assignments, values
+
+def _extra(record: Dict[str, Any], known: Tuple[str, ...]) -> Optional[str]:
+    extra = {key: value for key, value in record.items() if key not in known}
+    return json.dumps(extra) if extra else None
+
+class CorrelationStore:
+    def __init__(self, store_file: str = DEFAULT_STORE_FILE):
+        self.store_file = store_file
+        # One connection is shared by the worker threads, so access is serialized
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(store_file, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _lookup_id(self, table: str, column: str, value: Optional[str]) -> Optional[int]:
+        """Return the row ID for a metabolite or reference, inserting it if new"""
+        if value is None:
+            return None
+        self._conn.execute(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", (value,))
+        return self._conn.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,)).fetchone()[0]
+
+    def upsert_food(self, food_name: str, food_data: Dict[str, Any]):
+        """
+        Insert or replace one food and its correlations
+        food_data may be a correlations entry ({'prompt', 'correlations', ...})
+        or an expert interface food entry; only this food's rows are touched.
+        """
+        with self._lock, self._conn:
+            self._upsert_food_unlocked(food_name, food_data)
+
+    def _upsert_food_unlocked(self, food_name: str, food_data: Dict[str, Any]):
+        known = FOOD_FIELDS + ('id', 'name', 'correlations')
+        self._conn.execute("""
+            INSERT INTO foods (name, prompt, verified, expert_notes, processed_at, total_correlations, extra)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                prompt = excluded.prompt, verified = excluded.verified,
+                expert_notes = excluded.expert_notes, processed_at = excluded.processed_at,
+                total_correlations = excluded.total_correlations, extra = excluded.extra
+        """, (food_name, food_data.get('prompt'), _to_flag(food_data.get('verified')),
+              food_data.get('expertNotes'), food_data.get('processed_at'),
+              food_data.get('total_correlations'), _extra(food_data, known)))
+        food_id = self._conn.execute("SELECT id FROM foods WHERE name = ?", (food_name,)).fetchone()[0]
+
+        self._conn.execute("DELETE FROM correlations WHERE food_id = ?", (food_id,))
+        rows = []
+        for position, correlation in enumerate(food_data.get('correlations', [])):
+            rows.append((
+                food_id, position,
+                self._lookup_id('metabolites', 'name', correlation.get('metabolite')),
+                self._lookup_id('refs', 'citation', correlation.get('reference')),
+                correlation.get('correlationType'), correlation.get('finding'),
+                correlation.get('relevantQuote'), _to_flag(correlation.get('verified')),
+                correlation.get('expertNotes'), _extra(correlation, CORRELATION_FIELDS)
+            ))
+        self._conn.executemany("""
+            INSERT INTO correlations (food_id, position, metabolite_id, reference_id, correlation_type,
+                                      finding, relevant_quote, verified, expert_notes, extra)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+    def import_interface_data(self, data: Dict[str, Any]):
+        """Upsert every food of an interface data dict and keep its metadata"""
+        with self._lock, self._conn:
+            for food in data.get('foods', []):
+                self._upsert_food_unlocked(food['name'], food)
+            if 'metadata' in data:
+                self._conn.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('interface', ?)",
+                                   (json.dumps(data['metadata']),))
+
+    def delete_food(self, food_name: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM foods WHERE name = ?", (food_name,))
+
+    def set_verification(self, food_name: str, position: int,
+                         verified: Optional[bool], expert_notes: Optional[str] = None):
+        """Record an expert's verdict on one correlation"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute("""
+                UPDATE correlations SET verified = ?, expert_notes = COALESCE(?, expert_notes)
+                WHERE food_id = (SELECT id FROM foods WHERE name = ?) AND position = ?
+            """, (_to_flag(verified), expert_notes, food_name, position))
+            if cursor.rowcount == 0:
+                raise KeyError(f"No correlation {position} for food {food_name!r}")
+
+    def food_names(self) -> List[str]:
+        """Foods in the order they were first stored"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT name FROM foods ORDER BY id")]
+
+    def foods_for_metabolite(self, metabolite: str,
+                             correlation_type: Optional[str] = None) -> List[str]:
+        """Foods with a correlation to the metabolite, optionally of one type (e.g. 'Positive')"""
+        query = """
+            SELECT DISTINCT foods.name FROM correlations
+            JOIN metabolites ON metabolites.id = correlations.metabolite_id
+            JOIN foods ON foods.id = correlations.food_id
+            WHERE metabolites.name = ?
+        """
+        params = [metabolite]
+        if correlation_type is not None:
+            query += " AND correlations.correlation_type = ?"
+            params.append(correlation_type)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query + " ORDER BY foods.id", params)]
+
+    def metabolites_for_food(self, food_name: str,
+                             correlation_type: Optional[str] = None) -> List[str]:
+        """Metabolites correlated with the food, optionally of one type"""
+        query = """
+            SELECT DISTINCT metabolites.name FROM correlations
+            JOIN metabolites ON metabolites.id = correlations.metabolite_id
+            WHERE correlations.food_id = (SELECT id FROM foods WHERE name = ?)
+        """
+        params = [food_name]
+        if correlation_type is not None:
+            query += " AND correlations.correlation_type = ?"
+            params.append(correlation_type)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query + " ORDER BY metabolites.name", params)]
+
+    def _food_rows(self, food_names: Optional[List[str]] = None,
+                   food_id: Optional[int] = None) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Read foods and their correlations back into the exported record shape
+        Either every food (ordered like food_names, if given) or the single
+        food with the given food_id.
+        """
+        food_filter, correlation_filter, params = "", "", ()
+        if food_id is not None:
+            food_filter, correlation_filter, params = " WHERE id = ?", " WHERE correlations.food_id = ?", (food_id,)
+
+        foods = {}
+        for food_id, name, prompt, verified, notes, processed_at, total, extra in self._conn.execute(
+                "SELECT id, name, prompt, verified, expert_notes, processed_at, "
+                "total_correlations, extra FROM foods" + food_filter + " ORDER BY id", params):
+            record = {'name': name, 'prompt': prompt, 'correlations': []}
+            for key, value in (('verified', _from_flag(verified)), ('expertNotes', notes),
+                               ('processed_at', processed_at), ('total_correlations', total)):
+                if value is not None:
+                    record[key] = value
+            record.update(json.loads(extra) if extra else {})
+            foods[food_id] = record
+
+        for food_id, reference, metabolite, corr_type, finding, quote, verified, notes, extra in self._conn.execute("""
+                SELECT correlations.food_id, refs.citation, metabolites.name, correlation_type,
+                       finding, relevant_quote, correlations.verified, correlations.expert_notes,
+                       correlations.extra
+                FROM correlations
+                LEFT JOIN refs ON refs.id = correlations.reference_id
+                LEFT JOIN metabolites ON metabolites.id = correlations.metabolite_id""" + correlation_filter + """
+                ORDER BY correlations.food_id, correlations.position""", params):
+            correlation = {key: value for key, value in (
+                ('reference', reference), ('metabolite', metabolite), ('correlationType', corr_type),
+                ('finding', finding), ('relevantQuote', quote)) if value is not None}
+            correlation['verified'] = _from_flag(verified)
+            if notes is not None:
+                correlation['expertNotes'] = notes
+            correlation.update(json.loads(extra) if extra else {})
+            foods[food_id]['correlations'].append(correlation)
+
+        rows = list(foods.items())
+        if food_names is not None:
+            by_name = {record['name']: (food_id, record) for food_id, record in rows}
+            rows = [by_name[name] for name in food_names if name in by_name]
+        return rows
+
+    def get_food(self, food_name: str) -> Optional[Dict[str, Any]]:
+        """Return one food with its correlations, or None if it is not stored"""
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM foods WHERE name = ?", (food_name,)).fetchone()
+            if row is None:
+                return None
+            rows = self._food_rows(food_id=row[0])
+        return rows[0][1]
+
+    def get_food_by_id(self, food_id: int) -> Optional[Dict[str, Any]]:
+        """Return one food, with its store ID, by ID"""
+        with self._lock:
+            rows = self._food_rows(food_id=food_id)
+        if not rows:
+            return None
+        return dict(rows[0][1], id=food_id)
+
+    def iter_foods(self) -> Iterator[Dict[str, Any]]:
+        """Yield the stored foods one at a time, in storage order, without loading them all"""
+        with self._lock:
+            food_ids = [row[0] for row in self._conn.execute("SELECT id FROM foods ORDER BY id")]
+        for food_id in food_ids:
+            food = self.get_food_by_id(food_id)
+            if food is not None:
+                yield food
+
+    def food_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM foods").fetchone()[0]
+
+    def food_page(self, offset: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        """Summaries (ID, name, correlation counts) of a page of foods, in storage order"""
+        with self._lock:
+            rows = self._conn.execute(SUMMARY_QUERY + " GROUP BY foods.id ORDER BY foods.id LIMIT ? OFFSET ?",
+                                      (limit, offset)).fetchall()
+        return [_summary(row) for row in rows]
+
+    def search_foods(self, text: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Summaries of the foods whose name or notes, or one of whose correlations'
+        metabolite, reference or notes, contain the text (case-insensitive)
+        """
+        pattern = _like(text)
+        with self._lock:
+            rows = self._conn.execute(SUMMARY_QUERY + """
+                WHERE foods.id IN (
+                    SELECT id FROM foods WHERE name LIKE :pattern ESCAPE '\\' OR expert_notes LIKE :pattern ESCAPE '\\'
+                    UNION
+                    SELECT correlations.food_id FROM correlations
+                    LEFT JOIN metabolites ON metabolites.id = correlations.metabolite_id
+                    LEFT JOIN refs ON refs.id = correlations.reference_id
+                    WHERE metabolites.name LIKE :pattern ESCAPE '\\' OR refs.citation LIKE :pattern ESCAPE '\\'
+                          OR correlations.expert_notes LIKE :pattern ESCAPE '\\')
+                GROUP BY foods.id ORDER BY foods.id LIMIT :limit""",
+                {'pattern': pattern, 'limit': limit}).fetchall()
+        return [_summary(row) for row in rows]
+
+    def update_food(self, food_id: int, changes: Dict[str, Any]):
+        """Apply an expert's changes ('verified', 'expertNotes') to one food"""
+        assignments, values = _review_changes(changes)
+        with self._lock, self._conn:
+            if not assignments:
+                # Nothing to write, but a missing food is still an error
+                assignments, values = "id = id", []
+            cursor = self._conn.execute(f"UPDATE foods SET {assignments} WHERE id = ?", values + [food_id])
+            if cursor.rowcount == 0:
+                raise KeyError(f"No food with ID {food_id}")
+
+    def update_correlation(self, food_id: int, position: int, changes: Dict[str, Any]):
+        """
+        Apply an expert's changes to one correlation; unlike set_verification
+        only the given fields are written, so 'verified' can be reset to None
+        """
+        assignments, values = _review_changes(changes)
+        with self._lock, self._conn:
+            if not assignments:
+                assignments, values = "id = id", []
+            cursor = self._conn.execute(f"UPDATE correlations SET {assignments} WHERE food_id = ? AND position = ?",
+                                        values + [food_id, position])
+            if cursor.rowcount == 0:
+                raise KeyError(f"No correlation {position} for food ID {food_id}")
+
+    def review_stats(self) -> Dict[str, int]:
+        """Food count and correlation counts by verification state"""
+        with self._lock:
+            foods = self._conn.execute("SELECT COUNT(*) FROM foods").fetchone()[0]
+            total, verified, rejected = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(verified = 1), 0), COALESCE(SUM(verified = 0), 0) "
+                "FROM correlations").fetchone()
+        return {'foods': foods, 'correlations': total, 'verified': verified,
+                'rejected': rejected, 'pending': total - verified - rejected}
+
+    def export_correlations(self, food_names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Export foods in the {food: {'prompt', 'correlations', ...}} shape of save_correlations"""
+        with self._lock:
+            rows = self._food_rows(food_names)
+        correlations = {}
+        for _, record in rows:
+            entry = dict(record)
+            del entry['name']
+            correlations[record['name']] = entry
+        return correlations
+
+    def export_interface_data(self, food_names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Export foods in the expert interface data shape"""
+        with self._lock:
+            rows = self._food_rows(food_names)
+            stored = self._conn.execute("SELECT value FROM metadata WHERE key = 'interface'").fetchone()
+        metadata = json.loads(stored[0]) if stored else {'created_at': datetime.now().isoformat()}
+        metadata['total_foods'] = len(rows)
+
+        foods = []
+        for i, (_, record) in enumerate(rows):
+            entry = {'id': i}
+            entry.update(record)
+            entry.setdefault('verified', False)
+            entry.setdefault('expertNotes', "")
+            foods.append(entry)
+        return {'foods': foods, 'metadata': metadata}
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of rows in each table"""
+        with self._lock:
+            return {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ('foods', 'metabolites', 'refs', 'correlations')}
+
+    def close(self):
+        """Close the underlying database"""
+        with self._lock:
+            self._conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Query, import and export the correlation store')
+    parser.add_argument('--store', default=DEFAULT_STORE_FILE,
+                       help=f'Correlation store database (default: {DEFAULT_STORE_FILE})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='Upsert the foods of an interface or correlations file')
+    import_parser.add_argument('input', help='expert_interface_data.json or llama_correlations.json')
+
+    export_parser = subparsers.add_parser('export', help='Export the store to JSON files')
+    export_parser.add_argument('--correlations', help='Write the llama_correlations.json shape to this file')
+    export_parser.add_argument('--interface', help='Write expert interface data to this file')
+
+    query_parser = subparsers.add_parser('query', help='Look up foods or metabolites')
+    query_parser.add_argument('--metabolite', help='List the foods correlated with this metabolite')
+    query_parser.add_argument('--food', help='List the metabolites correlated with this food')
+    query_parser.add_argument('--type', dest='correlation_type', help='Only this correlation type, e.g. Positive')
+
+    args = parser.parse_args()
+    # Imported here because interface_store itself writes to the correlation store
+    from interface_store import load_interface_file, save_interface_file
+    from json_stream import JSONObjectStream, write_json_stream
+    store = CorrelationStore(args.store)
+
+    if args.command == 'import':
+        data = load_interface_file(args.input)
+        if 'foods' in data:
+            store.import_interface_data(data)
+        else:
+            for food_name, food_data in data.get('correlations', {}).items():
+                store.upsert_food(food_name, food_data)
+        print(f"Imported {args.input} into {args.store}: {store.stats()}")
+    elif args.command == 'export':
+        if args.correlations:
+            correlations = store.export_correlations()
+            write_json_stream(args.correlations, {'generated_at': datetime.now().isoformat(),
+                                                  'total_foods': len(correlations),
+                                                  'correlations': JSONObjectStream(correlations.items())})
+            print(f"Exported {len(correlations)} foods to {args.correlations}")
+        if args.interface:
+            save_interface_file(store.export_interface_data(), args.interface)
+            print(f"Exported interface data to {args.interface}")
+    else:
+        if args.metabolite:
+            for food_name in store.foods_for_metabolite(args.metabolite, args.correlation_type):
+                print(food_name)
+        if args.food:
+            for metabolite in store.metabolites_for_food(args.food, args.correlation_type):
+                print(metabolite)
+
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Dietary exposure scoring from measured metabolite features
+Turns the per-food correlations of the interface data into a signed
+food x metabolite matrix (+1 for a positive correlation, -1 for a negative one)
+and scores every sample of a feature table (samples x metabolite features, CSV
+or Parquet) against it. Feature columns are matched to metabolites through the
+metabolite normalizer, by exact and synonym matches unless fuzzy matching is
+asked for, and the mapping can be saved for auditing. The table is streamed in
+chunks, and each chunk is scored with a single matrix product, so tables with
+tens of thousands of samples and thousands of features never have to fit in
+memory.
+"""
+
+import argparse
+import csv
+import importlib.util
+import itertools
+import time
+from typing import Dict, List, Any, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from association_matrix import AssociationMatrix, load_association_matrix
+from interface_store import load_interface_file
+from metabolite_normalizer import MetaboliteMatch, MetaboliteNormalizer, default_normalizer
+
+DEFAULT_CHUNK_SIZE = 2000
+
+class ExposureModel(NamedTuple):
+    foods: List[str]
+    metabolites: List[str]   # canonical metabolite IDs, the matrix columns
+    weights: np.ndarray      # foods x metabolites, positive minus negative correlations
+
+def build_exposure_model(data: Dict[str, Any],
+                         normalizer: Optional[MetaboliteNormalizer] = None) -> ExposureModel:
+    """Build the signed food x metabolite matrix from interface data"""
+    return exposure_model_from_matrix(AssociationMatrix.build(data, normalizer))
+
+def exposure_model_from_matrix(matrix: AssociationMatrix) -> ExposureModel:
+    return ExposureModel(matrix.foods, matrix.metabolites,
+                         np.asarray(matrix.to_dense().signed, dtype=np.float32))
+
+class FeatureTable:
+    """Chunked reader for a samples x features table in CSV or Parquet format"""
+
+    def __init__(self, path: str, id_column: Optional[str] = None, delimiter: str = ","):
+        self.path = path
+        self.delimiter = delimiter
+        self.is_parquet = path.endswith((".parquet", ".pq"))
+        if self.is_parquet:
+            # Parquet support is optional and needs pyarrow
+            if importlib.util.find_spec("pyarrow") is None:
+                raise ImportError("Reading Parquet feature tables requires pyarrow (pip install pyarrow)")
+            import pyarrow.parquet as pq
+            self.columns = pq.ParquetFile(path).schema_arrow.names
+        else:
+            with open(path, 'r', newline='') as f:
+                self.columns = next(csv.reader(f, delimiter=delimiter))
+        self.id_column = id_column or self.columns[0]
+        if self.id_column not in self.columns:
+            raise ValueError(f"Sample ID column {self.id_column!r} not found in {path}")
+        self.feature_columns = [column for column in self.columns if column != self.id_column]
+
+    def iter_chunks(self, features: List[str],
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """Yield (sample IDs, samples x features float32 array) chunks; missing values are NaN"""
+        if self.is_parquet:
+            yield from self._iter_parquet(features, chunk_size)
+        else:
+            yield from self._iter_csv(features, chunk_size)
+
+    def _iter_parquet(self, features: List[str], chunk_size: int):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(self.path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=[self.id_column] + features):
+            ids = [str(value) for value in batch.column(0).to_pylist()]
+            values = np.empty((batch.num_rows, len(features)), dtype=np.float32)
+            for j in range(len(features)):
+                values[:, j] = batch.column(j + 1).to_numpy(zero_copy_only=False)
+            yield ids, values
+
+    def _iter_csv(self, features: List[str], chunk_size: int):
+        id_position = self.columns.index(self.id_column)
+        positions = [self.columns.index(feature) for feature in features]
+        with open(self.path, 'r', newline='') as f:
+            next(f)
+            while True:
+                lines = list(itertools.islice(f, chunk_size))
+                if not lines:
+                    return
+                ids = [row[id_position] for row in csv.reader(lines, delimiter=self.delimiter)]
+                yield ids, self._parse_values(lines, positions)
+
+    def _parse_values(self, lines: List[str], positions: List[int]) -> np.ndarray:
+        if not positions:
+            return np.empty((len(lines), 0), dtype=np.float32)
+        try:
+            # Fast path: loadtxt parses in C but rejects empty fields
+            values = np.loadtxt(lines, delimiter=self.delimiter, usecols=positions,
+                                dtype=np.float32, ndmin=2, quotechar='"')
+        except ValueError:
+            values = np.genfromtxt(lines, delimiter=self.delimiter, usecols=positions,
+                                   dtype=np.float32, filling_values=np.nan, missing_values="")
+        return values.reshape(len(lines), len(positions))
+
+def _prepare(values: np.ndarray, log2: bool) -> np.ndarray:
+    if log2:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = np.where(values > 0, np.log2(values), np.nan).astype(np.float32)
+    return values
+
+class FeatureStatistics:
+    """Streaming per-feature mean and standard deviation, ignoring missing values"""
+
+    def __init__(self, features: int):
+        self.count = np.zeros(features, dtype=np.float64)
+        self.total = np.zeros(features, dtype=np.float64)
+        self.total_squares = np.zeros(features, dtype=np.float64)
+
+    def update(self, values: np.ndarray):
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0).astype(np.float64)
+        self.count += present.sum(axis=0)
+        self.total += filled.sum(axis=0)
+        self.total_squares += (filled * filled).sum(axis=0)
+
+    def mean_std(self) -> Tuple[np.ndarray, np.ndarray]:
+        count = np.maximum(self.count, 1)
+        mean = self.total / count
+        variance = np.maximum(self.total_squares / count - mean * mean, 0)
+        std = np.sqrt(variance)
+        # Constant or empty features carry no signal; a unit std keeps them at zero
+        std[std == 0] = 1.0
+        return mean.astype(np.float32), std.astype(np.float32)
+
+def match_features(model: ExposureModel, feature_columns: List[str],
+                   normalizer: Optional[MetaboliteNormalizer] = None,
+                   fuzzy: bool = False) -> Tuple[List[str], np.ndarray, List[MetaboliteMatch]]:
+    """
+    Match feature columns to model metabolites and build the
+    features x foods projection; returns (matched columns, projection, the
+    match of every feature column). Only exact and synonym matches are used
+    unless fuzzy is set, since a fuzzy guess scores one metabolite as another
+    """
+    normalizer = normalizer or default_normalizer()
+    metabolite_index = {metabolite: i for i, metabolite in enumerate(model.metabolites)}
+    matches = normalizer.normalize_many(feature_columns)
+    matched, columns = [], []
+    for feature, match in zip(feature_columns, matches):
+        canonical_id = match.canonical_id if fuzzy else match.exact_id
+        if canonical_id in metabolite_index:
+            matched.append(feature)
+            columns.append(metabolite_index[canonical_id])
+
+    projection = model.weights[:, columns].T.copy()
+    if columns:
+        # Several columns measuring the same metabolite share its weight
+        counts = np.bincount(columns, minlength=len(model.metabolites))
+        projection /= counts[columns][:, None]
+    return matched, projection, matches
+
+def save_feature_mapping(mapping_file: str, matches: List[MetaboliteMatch], matched: List[str]):
+    """Write the feature -> canonical metabolite mapping with its scores for auditing"""
+    used = set(matched)
+    with open(mapping_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["feature", "canonical_id", "canonical_name", "score", "method", "used"])
+        for match in matches:
+            writer.writerow([match.query, match.canonical_id or "", match.canonical_name or "",
+                             match.score, match.method, match.query in used])
+
+def score_chunk(values: np.ndarray, projection: np.ndarray, mean: np.ndarray,
+                std: np.ndarray, markers: np.ndarray) -> np.ndarray:
+    """
+    Exposure scores for one chunk: the signed mean of the standardized levels
+    of each food's marker metabolites (missing values count as average)
+    """
+    standardized = np.nan_to_num((values - mean) / std, nan=0.0, posinf=0.0, neginf=0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (standardized @ projection) / markers
+
+def score_feature_table(input_file: str, output_file: str,
+                        data_file: str = "expert_interface_data.json",
+                        id_column: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        standardize: bool = True, log2: bool = False,
+                        min_markers: int = 1, matrix_file: Optional[str] = None,
+                        fuzzy: bool = False, mapping_file: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Score every sample of a feature table and stream the exposure scores to a
+    CSV file; a saved association matrix, if given, replaces the interface data,
+    and the feature mapping is written to mapping_file if given
+    """
+    if matrix_file:
+        model = exposure_model_from_matrix(load_association_matrix(matrix_file))
+    else:
+        model = build_exposure_model(load_interface_file(data_file))
+    table = FeatureTable(input_file, id_column)
+    matched, projection, matches = match_features(model, table.feature_columns, fuzzy=fuzzy)
+    print(f"Matched {len(matched)}/{len(table.feature_columns)} feature columns "
+          f"to {len(model.metabolites)} metabolites of {len(model.foods)} foods")
+    fuzzy_matches = [match for match in matches if match.method == "fuzzy"]
+    for match in fuzzy_matches:
+        print(f"  {'Used' if fuzzy else 'Skipped'} fuzzy match {match.query!r} -> "
+              f"{match.canonical_id} (score {match.score})")
+    if mapping_file:
+        save_feature_mapping(mapping_file, matches, matched)
+
+    # Foods with fewer measured markers than min_markers get no score
+    markers = np.abs(projection).sum(axis=0)
+    markers[markers < max(min_markers, 1e-9)] = np.nan
+
+    if standardize:
+        statistics = FeatureStatistics(len(matched))
+        for _, values in table.iter_chunks(matched, chunk_size):
+            statistics.update(_prepare(values, log2))
+        mean, std = statistics.mean_std()
+    else:
+        mean = np.zeros(len(matched), dtype=np.float32)
+        std = np.ones(len(matched), dtype=np.float32)
+
+    samples = 0
+    start = time.perf_counter()
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([table.id_column] + model.foods)
+        for ids, values in table.iter_chunks(matched, chunk_size):
+            scores = score_chunk(_prepare(values, log2), projection, mean, std, markers)
+            formatted = np.char.mod("%.4f", scores)
+            formatted[np.isnan(scores)] = ""
+            writer.writerows([sample_id] + row for sample_id, row in zip(ids, formatted.tolist()))
+            samples += len(ids)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "samples": samples,
+        "foods": len(model.foods),
+        "features": len(table.feature_columns),
+        "matched_features": len(matched),
+        "fuzzy_features": len(fuzzy_matches) if fuzzy else 0,
+        "scored_foods": int(np.count_nonzero(~np.isnan(markers))),
+        "seconds": round(elapsed, 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Infer dietary exposure scores from measured metabolite features')
+    parser.add_argument('features', help='Samples x features table (.csv, or .parquet with pyarrow installed)')
+    parser.add_argument('--output', default='dietary_exposure_scores.csv',
+                       help='Per-sample food score CSV (default: dietary_exposure_scores.csv)')
+    parser.add_argument('--data', default='expert_interface_data.json',
+                       help='Interface data with the per-food correlations (JSON, .fmcol or .sqlite)')
+    parser.add_argument('--matrix', default=None,
+                       help='Manifest of a saved association matrix to score against instead of --data')
+    parser.add_argument('--id-column', default=None,
+                       help='Sample ID column (default: the first column)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                       help=f'Samples read and scored at a time (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--log2', action='store_true',
+                       help='Log2-transform intensities before standardizing')
+    parser.add_argument('--no-standardize', action='store_true',
+                       help='Use the values as they are instead of z-scoring each feature (single pass)')
+    parser.add_argument('--min-markers', type=int, default=1,
+                       help='Minimum measured marker metabolites for a food to be scored (default: 1)')
+    parser.add_argument('--fuzzy', action='store_true',
+                       help='Also use fuzzy name matches (default: exact and synonym matches only)')
+    parser.add_argument('--mapping-output', default='dietary_exposure_mapping.csv',
+                       help='Feature -> metabolite mapping CSV with match scores '
+                            '(default: dietary_exposure_mapping.csv)')
+
+    args = parser.parse_args()
+
+    summary = score_feature_table(args.features, args.output, args.data, args.id_column,
+                                  args.chunk_size, not args.no_standardize, args.log2,
+                                  args.min_markers, args.matrix, args.fuzzy, args.mapping_output)
+    print(f"Scored {summary['samples']} samples for {summary['scored_foods']} foods "
+          f"in {summary['seconds']}s; scores saved to {args.output}, "
+          f"feature mapping to {args.mapping_output}")
+
+if __name__ == "__main__":
+    main()
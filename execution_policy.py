@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Execution policy for Llama calls
+Applies the PROCESSING_CONFIG settings to every backend call: a per-call
+deadline, retries with exponential backoff and jitter, a circuit breaker that
+stops calling a backend that keeps failing, and pacing that only slows down
+while the backend reports it is overloaded
+"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Any, Awaitable, Callable, Optional, TypeVar
+
+from llama_backends import BackendError, BackendOverloaded, BackendTimeout
+
+T = TypeVar("T")
+
+class CircuitOpenError(BackendError):
+    """Raised instead of calling a backend while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed calls and rejects calls
+    for `reset_timeout` seconds; after that one trial call is let through and
+    its outcome closes or re-opens the circuit
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """Return True if a call may be made now"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_progress:
+                return False
+            self._trial_in_progress = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_progress or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"Circuit breaker opened after {self.failures} consecutive failures, "
+                          f"pausing backend calls for {self.reset_timeout:.0f}s")
+                self.opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+    def release_trial(self):
+        """Give up a trial call without an outcome, e.g. when it was cancelled"""
+        with self._lock:
+            self._trial_in_progress = False
+
+class ExecutionPolicy:
+    def __init__(self, timeout: float = 300, retry_attempts: int = 3,
+                 base_delay: float = 2.0, max_delay: float = 60.0,
+                 failure_threshold: int = 5, reset_timeout: float = 60.0,
+                 rng: Optional[random.Random] = None):
+        self.timeout = timeout
+        self.retry_attempts = retry_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._rng = rng or random.Random()
+        self._pace_delay = 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, processing_config: Dict[str, Any]) -> "ExecutionPolicy":
+        """Build the policy from PROCESSING_CONFIG"""
+        return cls(
+            timeout=processing_config.get("timeout", 300),
+            retry_attempts=processing_config.get("retry_attempts", 3),
+            base_delay=processing_config.get("delay_between_calls", 2),
+            max_delay=processing_config.get("max_delay", 60),
+            failure_threshold=processing_config.get("circuit_breaker_threshold", 5),
+            reset_timeout=processing_config.get("circuit_breaker_reset", 60)
+        )
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given retry attempt"""
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _reserve_slot(self) -> float:
+        """Return how long to wait before the next call while pacing is active"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot)
+            self._next_slot = start + self._pace_delay
+            return start - now
+
+    def _on_overloaded(self, retry_after: Optional[float]):
+        """Widen the spacing between calls when the backend signals overload"""
+        with self._lock:
+            self._pace_delay = min(self.max_delay,
+                                   max(retry_after or 0.0, self._pace_delay * 2 or self.base_delay))
+            self._next_slot = max(self._next_slot, time.monotonic() + (retry_after or self._pace_delay))
+        print(f"Backend overloaded, spacing calls {self._pace_delay:.1f}s apart")
+
+    def _on_success(self):
+        """Relax the pacing again after a successful call"""
+        with self._lock:
+            self._pace_delay = self._pace_delay / 2 if self._pace_delay > 0.1 else 0.0
+
+    def call(self, fn: Callable[[float], T]) -> T:
+        """
+        Run fn(timeout) under the policy
+        fn is expected to raise BackendError (or a subclass) on failure and to
+        give up once the timeout it is passed has elapsed. Any other exception,
+        e.g. from a malformed response, counts as a failed attempt too.
+        """
+        last_error = None
+        for attempt in range(self.retry_attempts + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError("Circuit breaker is open, backend calls are paused")
+
+            time.sleep(self._reserve_slot())
+            try:
+                result = fn(self.timeout)
+            except BackendOverloaded as e:
+                self._on_overloaded(e.retry_after)
+                last_error = e
+            except Exception as e:
+                last_error = e
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            else:
+                self.breaker.record_success()
+                self._on_success()
+                return result
+
+            self.breaker.record_failure()
+            if attempt < self.retry_attempts:
+                delay = self.backoff_delay(attempt)
+                print(f"Llama call failed ({last_error}), retrying in {delay:.1f}s "
+                      f"({attempt + 1}/{self.retry_attempts})")
+                time.sleep(delay)
+
+        raise last_error
+
+    async def call_async(self, fn: Callable[[float], Awaitable[T]]) -> T:
+        """Async counterpart of call; fn(timeout) is awaited under the deadline"""
+        last_error = None
+        for attempt in range(self.retry_attempts + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError("Circuit breaker is open, backend calls are paused")
+
+            await asyncio.sleep(self._reserve_slot())
+            try:
+                result = await asyncio.wait_for(fn(self.timeout), self.timeout)
+            except asyncio.TimeoutError:
+                last_error = BackendTimeout(f"No complete response within {self.timeout}s")
+            except BackendOverloaded as e:
+                self._on_overloaded(e.retry_after)
+                last_error = e
+            except Exception as e:
+                last_error = e
+            except BaseException:
+                # Cancellation leaves no outcome, but must not hold the trial slot
+                self.breaker.release_trial()
+                raise
+            else:
+                self.breaker.record_success()
+                self._on_success()
+                return result
+
+            self.breaker.record_failure()
+            if attempt < self.retry_attempts:
+                delay = self.backoff_delay(attempt)
+                print(f"Llama call failed ({last_error}), retrying in {delay:.1f}s "
+                      f"({attempt + 1}/{self.retry_attempts})")
+                await asyncio.sleep(delay)
+
+        raise last_error
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Local HTTP API for the expert review interface
+Serves expert_interface.html and a small JSON API over a CorrelationStore, so
+the page loads foods a page at a time and fetches a food's correlations only
+when it is opened, instead of downloading and parsing the whole dataset:
+
+    GET   /stats                              food and verification counts
+    GET   /foods?offset=0&limit=100           food summaries, in order
+    GET   /foods/{id}                         one food with its correlations
+    GET   /foods/{id}/correlations            the food's correlations
+    GET   /search?q=text&limit=100            foods matching name, metabolite, reference or notes
+    PATCH /foods/{id}                         {"verified": ..., "expertNotes": ...}
+    PATCH /foods/{id}/correlations/{index}    {"verified": true|false|null, "expertNotes": ...}
+    GET   /export[?verified=1]                all data, or only verified correlations
+"""
+
+import argparse
+import json
+import os
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from correlation_store import CorrelationStore, DEFAULT_STORE_FILE
+from interface_store import load_interface_file, STORE_EXTENSIONS
+
+DEFAULT_PORT = 8000
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STATIC_TYPES = {".html": "text/html; charset=utf-8", ".js": "text/javascript; charset=utf-8",
+                ".css": "text/css; charset=utf-8", ".json": "application/json"}
+
+_FOOD = re.compile(r"^/foods/(\d+)$")
+_CORRELATIONS = re.compile(r"^/foods/(\d+)/correlations$")
+_CORRELATION = re.compile(r"^/foods/(\d+)/correlations/(\d+)$")
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _int_param(params: Dict[str, list], name: str, default: int, maximum: Optional[int] = None) -> int:
+    try:
+        value = int(params.get(name, [default])[0])
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer")
+    if value < 0:
+        raise HTTPError(400, f"{name} must not be negative")
+    return min(value, maximum) if maximum is not None else value
+
+class ExpertAPIHandler(BaseHTTPRequestHandler):
+    # Set on the server by create_server
+    store: CorrelationStore = None
+    static_dir: str = "."
+
+    def log_message(self, format, *args):
+        if getattr(self.server, "verbose", False):
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._dispatch(self._get)
+
+    def do_PATCH(self):
+        self._dispatch(self._patch)
+
+    def _dispatch(self, handler):
+        url = urlparse(self.path)
+        try:
+            result = handler(url.path, parse_qs(url.query))
+            if result is not None:
+                self._send_json(200, result)
+        except HTTPError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except KeyError as e:
+            self._send_json(404, {"error": str(e.args[0]) if e.args else "Not found"})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+
+    def _get(self, path: str, params: Dict[str, list]) -> Optional[Any]:
+        if path == "/stats":
+            return self.store.review_stats()
+        if path == "/foods":
+            offset = _int_param(params, "offset", 0)
+            limit = _int_param(params, "limit", DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+            return {"offset": offset, "total": self.store.food_count(),
+                    "foods": self.store.food_page(offset, limit)}
+        if path == "/search":
+            query = params.get("q", [""])[0].strip()
+            limit = _int_param(params, "limit", DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+            return {"query": query, "foods": self.store.search_foods(query, limit) if query else []}
+        if path == "/export":
+            return self._export(params.get("verified", ["0"])[0] not in ("0", ""))
+
+        match = _FOOD.match(path) or _CORRELATIONS.match(path)
+        if match:
+            food = self.store.get_food_by_id(int(match.group(1)))
+            if food is None:
+                raise HTTPError(404, f"No food with ID {match.group(1)}")
+            return food if match.re is _FOOD else food["correlations"]
+
+        self._send_static(path)
+        return None
+
+    def _patch(self, path: str, params: Dict[str, list]) -> Any:
+        changes = self._read_json()
+        match = _CORRELATION.match(path)
+        if match:
+            food_id, position = int(match.group(1)), int(match.group(2))
+            self.store.update_correlation(food_id, position, changes)
+            food = self.store.get_food_by_id(food_id)
+            if food is None or position >= len(food["correlations"]):
+                raise HTTPError(404, f"No correlation {position} for food ID {food_id}")
+            return food["correlations"][position]
+        match = _FOOD.match(path)
+        if match:
+            food_id = int(match.group(1))
+            self.store.update_food(food_id, changes)
+            food = self.store.get_food_by_id(food_id)
+            if food is None:
+                raise HTTPError(404, f"No food with ID {food_id}")
+            return {key: value for key, value in food.items() if key != "correlations"}
+        raise HTTPError(404, f"Unknown endpoint {path}")
+
+    def _export(self, verified_only: bool) -> Dict[str, Any]:
+        data = self.store.export_interface_data()
+        if not verified_only:
+            return data
+        # Same shape as the page's own "Export Verified Data"
+        foods = [{"name": food["name"],
+                  "correlations": [c for c in food["correlations"] if c.get("verified") is True]}
+                 for food in data["foods"]]
+        return {"foods": [food for food in foods if food["correlations"]]}
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise HTTPError(400, f"Invalid JSON body: {e}")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "The body must be a JSON object")
+        return body
+
+    def _send_json(self, status: int, payload: Any):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_static(self, path: str):
+        # Only plain files directly inside the static directory are served
+        name = os.path.basename(path) or "expert_interface.html"
+        file_path = os.path.join(self.static_dir, name)
+        content_type = STATIC_TYPES.get(os.path.splitext(name)[1])
+        if content_type is None or not os.path.isfile(file_path):
+            raise HTTPError(404, f"Not found: {path}")
+        with open(file_path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def open_review_store(data_file: str, store_file: str = DEFAULT_STORE_FILE,
+                      reimport: bool = False) -> CorrelationStore:
+    """
+    Open the store the server reviews; interface data is imported into it
+    only when the store is empty (or on reimport), so earlier reviews are kept
+    """
+    if data_file.endswith(STORE_EXTENSIONS):
+        return CorrelationStore(data_file)
+    store = CorrelationStore(store_file)
+    if reimport or store.food_count() == 0:
+        store.import_interface_data(load_interface_file(data_file))
+        print(f"Imported {data_file} into {store_file}")
+    return store
+
+def create_server(store: CorrelationStore, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                  static_dir: str = ".", verbose: bool = False) -> Tuple[ThreadingHTTPServer, type]:
+    handler = type("BoundExpertAPIHandler", (ExpertAPIHandler,),
+                   {"store": store, "static_dir": os.path.abspath(static_dir)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.verbose = verbose
+    return server, handler
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the expert interface with a paginated local API')
+    parser.add_argument('--data', default='expert_interface_data.json',
+                       help='Interface data to review (JSON, .fmcol, or a .sqlite store used directly)')
+    parser.add_argument('--store', default=DEFAULT_STORE_FILE,
+                       help=f'Store that holds the reviews (default: {DEFAULT_STORE_FILE})')
+    parser.add_argument('--reimport', action='store_true',
+                       help='Re-import --data into the store, replacing the stored foods and their reviews')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                       help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    args = parser.parse_args()
+
+    store = open_review_store(args.data, args.store, args.reimport)
+    server, _ = create_server(store, args.host, args.port,
+                              os.path.dirname(os.path.abspath(__file__)), args.verbose)
+    print(f"Serving {store.food_count()} foods at http://{args.host}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        store.close()
+
+if __name__ == "__main__":
+    main()
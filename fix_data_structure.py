@@ -5,8 +5,11 @@ Script to fix the corrupted expert_interface_data.json and regenerate it with pr
 
 import json
 import os
+import sys
 from typing import List, Dict, Any
 
+from interface_store import save_interface_file
+
 def create_comprehensive_correlations(food_name: str) -> List[Dict[str, Any]]:
     """Create comprehensive correlations with honest data structure"""
     
@@ -124,7 +127,7 @@ def load_foods_list() -> List[str]:
             "low-carb bars", "chicken liver", "turkey liver"
         ]
 
-def regenerate_expert_interface_data():
+def regenerate_expert_interface_data(output_file: str = "expert_interface_data.json"):
     """Regenerate the expert_interface_data.json with proper structure"""
     
     print("Loading foods list...")
@@ -162,11 +165,9 @@ def regenerate_expert_interface_data():
             print(f"Processed {i + 1}/{len(foods)} foods...")
     
     # Save the regenerated data
-    output_file = "expert_interface_data.json"
     print(f"Saving regenerated data to {output_file}...")
     
-    with open(output_file, 'w') as f:
-        json.dump(data, f, indent=2)
+    save_interface_file(data, output_file)
     
     print(f"✅ Successfully regenerated {output_file}")
     print(f"📊 Total foods: {len(data['foods'])}")
@@ -184,7 +185,8 @@ if __name__ == "__main__":
     print("=" * 70)
     
     try:
-        data = regenerate_expert_interface_data()
+        # An optional output path; a .fmcol suffix writes the compact format
+        data = regenerate_expert_interface_data(*sys.argv[1:2])
         print("\n🎉 Data regeneration completed successfully!")
         print("\nNext steps:")
         print("1. Commit the updated file: git add expert_interface_data.json")
@@ -7,15 +7,21 @@ AI-driven system to find scientific literature linking foods with metabolites in
 import csv
 import json
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 import requests
 from datetime import datetime
 
+from interface_store import save_interface_file
+from prompt_templates import DEFAULT_TEMPLATE, PromptCache, load_template
+
 class FoodMetaboliteAnalyzer:
-    def __init__(self, foods_file: str = "foods.csv"):
+    def __init__(self, foods_file: str = "foods.csv", template: str = DEFAULT_TEMPLATE):
         self.foods_file = foods_file
         self.foods = []
         self.correlations = {}
+        # Each food's prompt is rendered once and reused by every output
+        self.prompt_template = load_template(template)
+        self.prompt_cache = PromptCache()
         self.load_foods()
     
     def load_foods(self):
@@ -32,30 +38,7 @@ class FoodMetaboliteAnalyzer:
     
     def generate_llama_prompt(self, food: str) -> str:
         """Generate a prompt for Llama to find food-metabolite correlations"""
-        prompt = f"""You are a scientific literature researcher specializing in metabolomics and nutritional science. 
-
-Your task is to find ALL scientific papers, research articles, and references that mention the food item "{food}" in correlation with metabolites found in blood (plasma or serum).
-
-Please search for:
-1. Positive correlations (increased levels of metabolites when consuming {food})
-2. Negative correlations (decreased levels of metabolites when consuming {food})
-3. Any significant associations between {food} consumption and blood metabolite levels
-
-For each reference found, provide:
-- Full citation (authors, title, journal, year, DOI if available)
-- Specific metabolite(s) mentioned
-- Type of correlation (positive/negative/association)
-- Brief description of the finding
-- Relevant quote or sentence from the paper mentioning the correlation
-
-Focus ONLY on blood-based studies (plasma, serum, whole blood) and exclude urine, tissue, or other biospecimens.
-
-Format your response as a structured table with columns:
-Reference | Metabolite | Correlation Type | Finding Description | Relevant Quote
-
-Be comprehensive and thorough in your search. If you find multiple metabolites for the same food, list each correlation separately."""
-        
-        return prompt
+        return self.prompt_cache.food_prompt(self.prompt_template, food)
     
     def generate_all_prompts(self) -> Dict[str, str]:
         """Generate prompts for all foods"""
@@ -70,6 +53,7 @@ Be comprehensive and thorough in your search. If you find multiple metabolites f
         data = {
             "generated_at": datetime.now().isoformat(),
             "total_foods": len(self.foods),
+            "template": self.prompt_template.metadata(),
             "prompts": prompts
         }
         
@@ -81,34 +65,36 @@ Be comprehensive and thorough in your search. If you find multiple metabolites f
     
     def create_expert_interface_data(self) -> Dict[str, Any]:
         """Create data structure for the expert interface"""
-        interface_data = {
-            "foods": [],
+        interface_data = self._interface_data()
+        interface_data["foods"] = list(interface_data["foods"])
+        return interface_data
+    
+    def _interface_data(self) -> Dict[str, Any]:
+        """Interface data whose foods are generated lazily, for streaming to disk"""
+        return {
+            "foods": self._iter_interface_foods(),
             "correlations": {},
             "metadata": {
                 "created_at": datetime.now().isoformat(),
-                "total_foods": len(self.foods)
+                "total_foods": len(self.foods),
+                "prompt_template": self.prompt_template.metadata()
             }
         }
-        
-        for food in self.foods:
-            food_entry = {
-                "id": len(interface_data["foods"]),
+    
+    def _iter_interface_foods(self) -> Iterator[Dict[str, Any]]:
+        for i, food in enumerate(self.foods):
+            yield {
+                "id": i,
                 "name": food,
                 "prompt": self.generate_llama_prompt(food),
                 "correlations": [],
                 "verified": False,
                 "expert_notes": ""
             }
-            interface_data["foods"].append(food_entry)
-        
-        return interface_data
     
-    def save_interface_data(self, output_file: str = "expert_interface_data.json"):
-        """Save interface data for the web application"""
-        data = self.create_expert_interface_data()
-        
-        with open(output_file, 'w') as f:
-            json.dump(data, f, indent=2)
+    def save_interface_data(self, output_file: str = "expert_interface_data.json", compact: bool = False):
+        """Save interface data for the web application, streamed one food at a time"""
+        save_interface_file(self._interface_data(), output_file, indent=None if compact else 2)
         
         print(f"Saved interface data to {output_file}")
         return output_file
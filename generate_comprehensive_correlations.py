@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 """
 Generate comprehensive correlations with real scientific references for all foods
+Also generates seeded synthetic datasets of any size for load testing, streamed
+to disk block by block.
 """
 
+import argparse
 import json
 import random
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
+
+import numpy as np
+
+from interface_store import save_interface_file
+from json_stream import atomic_write
 
 # Comprehensive database of real scientific references
 REAL_REFERENCES_DATABASE = [
@@ -238,13 +246,13 @@ METABOLITE_CATEGORIES = {
     ]
 }
 
-def create_comprehensive_correlations(food_name: str) -> List[Dict[str, Any]]:
+def create_comprehensive_correlations(food_name: str, rng: random.Random = random) -> List[Dict[str, Any]]:
     """Create comprehensive correlations with real references for a food item"""
     
     correlations = []
     
     # Get random references for this food
-    food_refs = random.sample(REAL_REFERENCES_DATABASE, min(50, len(REAL_REFERENCES_DATABASE)))
+    food_refs = rng.sample(REAL_REFERENCES_DATABASE, min(50, len(REAL_REFERENCES_DATABASE)))
     
     # Create correlations for each metabolite category
     for category, metabolites in METABOLITE_CATEGORIES.items():
@@ -253,10 +261,10 @@ def create_comprehensive_correlations(food_name: str) -> List[Dict[str, Any]]:
                 break
                 
             # Randomly select positive or negative correlation
-            corr_type = random.choice(["Positive", "Negative"])
+            corr_type = rng.choice(["Positive", "Negative"])
             
             # Get a random reference
-            ref = random.choice(food_refs)
+            ref = rng.choice(food_refs)
             
             # Create realistic finding and quote based on correlation type
             if corr_type == "Positive":
@@ -292,9 +300,10 @@ def load_foods_list() -> List[str]:
         # Fallback food list
         return ["broccoli", "cabbage", "tomatoes", "carrots", "spinach", "kale", "blueberries", "strawberries", "oranges", "apples"]
 
-def generate_comprehensive_data():
+def generate_comprehensive_data(output_file: str = "expert_interface_data.json", seed: Optional[int] = None):
     """Generate comprehensive expert interface data with real references"""
     
+    rng = random.Random(seed)
     print("Loading foods list...")
     foods = load_foods_list()
     print(f"Found {len(foods)} foods")
@@ -318,7 +327,7 @@ def generate_comprehensive_data():
             "id": i,
             "name": food_name,
             "prompt": f"Find correlations between {food_name} consumption and blood metabolites",
-            "correlations": create_comprehensive_correlations(food_name),
+            "correlations": create_comprehensive_correlations(food_name, rng),
             "verified": False,
             "expertNotes": ""
         }
@@ -328,11 +337,9 @@ def generate_comprehensive_data():
             print(f"Processed {i + 1}/{len(foods)} foods...")
     
     # Save the comprehensive data
-    output_file = "expert_interface_data.json"
     print(f"Saving comprehensive data to {output_file}...")
     
-    with open(output_file, 'w') as f:
-        json.dump(data, f, indent=2)
+    save_interface_file(data, output_file)
     
     print(f"✅ Successfully generated {output_file}")
     print(f"📊 Total foods: {len(data['foods'])}")
@@ -343,12 +350,131 @@ def generate_comprehensive_data():
     
     return data
 
-if __name__ == "__main__":
+# Foods drawn per RNG block; fixed so that the output depends only on the seed
+SYNTHETIC_BLOCK_SIZE = 1024
+
+def _json_text(value: str) -> str:
+    """A string escaped for use inside a JSON string literal"""
+    return json.dumps(value)[1:-1]
+
+def _synthetic_fragments():
+    """
+    Pre-rendered JSON pieces of a correlation record: a prefix per reference
+    and, per correlation type and metabolite, the three pieces around the two
+    places the food name appears
+    """
+    references = []
+    for ref in REAL_REFERENCES_DATABASE:
+        reference = f"{ref['authors']} ({ref['year']}). {ref['title']}. {ref['journal']}"
+        link = f"https://doi.org/{ref['doi']}"
+        references.append(f'{{"reference": {json.dumps(reference)}, "link": {json.dumps(link)}, "metabolite": ')
+    metabolites = [name for names in METABOLITE_CATEGORIES.values() for name in names]
+    pieces = []
+    for corr_type, change, direction in (("Positive", "Increased", "increase"), ("Negative", "Reduced", "decrease")):
+        pieces.append([
+            (f'{json.dumps(metabolite)}, "correlationType": "{corr_type}", "finding": "'
+             f'{_json_text(f"{change} {metabolite.lower()} levels in blood after ")}',
+             f'{_json_text(" consumption")}", "relevantQuote": "{_json_text("Consumption of ")}',
+             f'{_json_text(f" led to a significant {direction} in {metabolite.lower()} levels (p<0.05)")}", '
+             f'"verified": null, "expertNotes": ""}}')
+            for metabolite in metabolites
+        ])
+    return references, pieces
+
+def synthetic_food_name(index: int, foods: List[str]) -> str:
+    """Food names cycle through the food list, numbered after the first pass"""
+    base = foods[index % len(foods)]
+    return base if index < len(foods) else f"{base} #{index // len(foods)}"
+
+def iter_synthetic_foods(food_count: int, correlations_per_food: int = 50,
+                         seed: int = 0) -> Iterator[str]:
+    """
+    Yield the JSON text of each synthetic food record
+    Metabolites, correlation types and references are drawn with NumPy for a
+    whole block of foods at once, and records are assembled from pre-rendered
+    fragments instead of being built as dicts and serialized.
+    """
+    # foods.csv lists some foods twice; synthetic names must stay distinct
+    foods = list(dict.fromkeys(load_foods_list()))
+    references, pieces = _synthetic_fragments()
+    metabolite_count = len(pieces[0])
+
+    for block_start in range(0, food_count, SYNTHETIC_BLOCK_SIZE):
+        size = min(SYNTHETIC_BLOCK_SIZE, food_count - block_start)
+        rng = np.random.default_rng([seed, block_start // SYNTHETIC_BLOCK_SIZE])
+        if correlations_per_food <= metabolite_count:
+            # Distinct metabolites per food: the first k of a random permutation
+            metabolite_ids = rng.random((size, metabolite_count)).argsort(axis=1)[:, :correlations_per_food]
+        else:
+            metabolite_ids = rng.integers(0, metabolite_count, (size, correlations_per_food))
+        type_ids = rng.integers(0, 2, (size, correlations_per_food))
+        reference_ids = rng.integers(0, len(references), (size, correlations_per_food))
+
+        for offset, (metabolite_row, type_row, reference_row) in enumerate(
+                zip(metabolite_ids.tolist(), type_ids.tolist(), reference_ids.tolist())):
+            index = block_start + offset
+            name = synthetic_food_name(index, foods)
+            food = _json_text(name)
+            records = []
+            for metabolite_id, type_id, reference_id in zip(metabolite_row, type_row, reference_row):
+                before, between, after = pieces[type_id][metabolite_id]
+                records.append(references[reference_id] + before + food + between + food + after)
+            prompt = json.dumps(f"Find correlations between {name} consumption and blood metabolites")
+            yield (f'{{"id": {index}, "name": {json.dumps(name)}, "prompt": {prompt}, '
+                   f'"correlations": [{", ".join(records)}], "verified": false, "expertNotes": ""}}')
+
+def write_synthetic_dataset(output_file: str, food_count: int, correlations_per_food: int = 50,
+                            seed: int = 0) -> Dict[str, Any]:
+    """
+    Stream a synthetic interface data file, one food per line, and return its
+    metadata; runs with the same arguments produce identical files
+    """
+    metadata = {
+        "created_at": "2025-08-19T12:00:00Z",
+        "total_foods": food_count,
+        "total_correlations": food_count * correlations_per_food,
+        "correlation_types": ["Positive", "Negative"],
+        "data_source": f"Synthetic load-testing data (seed {seed})",
+        "reference_count": len(REAL_REFERENCES_DATABASE),
+        "metabolite_categories": len(METABOLITE_CATEGORIES)
+    }
+
+    # Written to a temporary file first so readers never see a partial file
+    with atomic_write(output_file) as f:
+        f.write('{"foods": [\n')
+        for i, food in enumerate(iter_synthetic_foods(food_count, correlations_per_food, seed)):
+            f.write(food if i == 0 else ",\n" + food)
+        f.write(f'\n], "metadata": {json.dumps(metadata)}}}\n')
+    return metadata
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate expert interface data with real references, '
+                                                 'or a synthetic dataset for load testing')
+    parser.add_argument('output', nargs='?', default='expert_interface_data.json',
+                       help='Output file; a .fmcol suffix writes the compact format (default: expert_interface_data.json)')
+    parser.add_argument('--seed', type=int, default=None,
+                       help='Random seed for reproducible output (default: unseeded, 0 with --synthetic)')
+    parser.add_argument('--synthetic', type=int, metavar='FOODS', default=None,
+                       help='Stream a synthetic JSON dataset with this many foods instead')
+    parser.add_argument('--correlations-per-food', type=int, default=50,
+                       help='Correlations per synthetic food (default: 50)')
+
+    args = parser.parse_args()
+
+    if args.synthetic is not None:
+        if not args.output.endswith(".json"):
+            parser.error("synthetic datasets are streamed as JSON; use a .json output file")
+        metadata = write_synthetic_dataset(args.output, args.synthetic, args.correlations_per_food,
+                                           args.seed or 0)
+        print(f"✅ Wrote {metadata['total_foods']} foods / {metadata['total_correlations']} correlations "
+              f"to {args.output}")
+        return
+
     print("🔄 Generating comprehensive correlations with real references...")
     print("=" * 70)
     
     try:
-        data = generate_comprehensive_data()
+        data = generate_comprehensive_data(args.output, args.seed)
         print("\n🎉 Comprehensive data generation completed successfully!")
         print("\nNext steps:")
         print("1. Commit the updated file: git add expert_interface_data.json")
@@ -359,3 +485,6 @@ if __name__ == "__main__":
         print(f"❌ Error during generation: {e}")
         import traceback
         traceback.print_exc()
+
+if __name__ == "__main__":
+    main()
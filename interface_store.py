@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Compact columnar storage for expert interface data
+Every distinct value (food names, metabolites, references, findings, ...) is
+stored once in a value table and referenced by integer ID from per-field
+columns, one set of columns for foods and one for correlations. Files ending
+in COMPACT_EXTENSION use this format, paths ending in STORE_EXTENSIONS are
+upserted food by food into a CorrelationStore, and any other path is streamed
+as JSON (gzip- or zstd-compressed for .gz / .zst), so callers can switch
+formats by changing the file name.
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from typing import Dict, List, Any, Optional, Tuple
+
+from correlation_store import CorrelationStore
+from json_stream import JSONArrayStream, atomic_write, open_compressed, write_json_stream
+from metabolite_index import MetaboliteIndexBuilder, index_path_for, write_index
+from search_index import SearchIndexBuilder, search_index_path_for, source_hash
+
+COMPACT_EXTENSION = ".fmcol"
+STORE_EXTENSIONS = (".sqlite", ".db")
+MAGIC = b"FMCOL\x00\x00\x01"
+
+# Reserved value IDs: a field absent from a record, and a food's correlation
+# list, whose rows live in the correlation columns
+MISSING_ID = 0
+CORRELATIONS_ID = 1
+FIRST_VALUE_ID = 2
+
+# Column arrays are stored as little-endian unsigned 32-bit integers
+ID_TYPECODE = "I" if array("I").itemsize == 4 else "L"
+
+def is_compact_path(path: str) -> bool:
+    return path.endswith(COMPACT_EXTENSION)
+
+class _ValueTable:
+    """Assigns one ID per distinct JSON value"""
+
+    def __init__(self):
+        self.values: List[Any] = [None, None]
+        self._ids: Dict[Any, int] = {}
+
+    def id_for(self, value: Any) -> int:
+        # Scalars are keyed by type as well so that True, 1 and 1.0 stay
+        # distinct; lists and dicts are keyed by their JSON text
+        if isinstance(value, (list, dict)):
+            key = (type(value), json.dumps(value, sort_keys=True))
+        else:
+            key = (type(value), value)
+        value_id = self._ids.get(key)
+        if value_id is None:
+            value_id = self._ids[key] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+def _column_keys(records: List[Dict[str, Any]]) -> List[str]:
+    """Union of the record keys, in order of first appearance"""
+    keys = {}
+    for record in records:
+        for key in record:
+            keys.setdefault(key, None)
+    return list(keys)
+
+def _encode_columns(records: List[Dict[str, Any]], keys: List[str],
+                    table: _ValueTable) -> List[array]:
+    id_for = table.id_for
+    columns = []
+    for key in keys:
+        column = array(ID_TYPECODE, [MISSING_ID]) * len(records)
+        for row, record in enumerate(records):
+            if key in record:
+                column[row] = id_for(record[key])
+        columns.append(column)
+    return columns
+
+def _has_correlation_rows(food: Dict[str, Any]) -> bool:
+    correlations = food.get("correlations")
+    return isinstance(correlations, list) and all(type(c) is dict for c in correlations)
+
+def encode_interface_data(data: Dict[str, Any], level: int = 6) -> bytes:
+    """Encode interface data ({'foods': [...], ...}) into the compact format"""
+    foods = data.get("foods", [])
+    table = _ValueTable()
+
+    food_keys = _column_keys(foods)
+    food_columns = _encode_columns([{key: value for key, value in food.items()
+                                     if key != "correlations" or not _has_correlation_rows(food)}
+                                    for food in foods], food_keys, table)
+
+    correlation_rows = []
+    offsets = array(ID_TYPECODE, [0])
+    if "correlations" in food_keys:
+        column = food_columns[food_keys.index("correlations")]
+        for row, food in enumerate(foods):
+            if _has_correlation_rows(food):
+                column[row] = CORRELATIONS_ID
+                correlation_rows.extend(food["correlations"])
+            offsets.append(len(correlation_rows))
+    correlation_keys = _column_keys(correlation_rows)
+    correlation_columns = _encode_columns(correlation_rows, correlation_keys, table)
+
+    header = {
+        "version": 1,
+        "top_level": {key: (None if key == "foods" else value) for key, value in data.items()},
+        "foods": len(foods),
+        "correlations": len(correlation_rows),
+        "food_keys": food_keys,
+        "correlation_keys": correlation_keys
+    }
+
+    body = [json.dumps(table.values[FIRST_VALUE_ID:], ensure_ascii=False).encode("utf-8")]
+    for column in food_columns + ([offsets] if "correlations" in food_keys else []) + correlation_columns:
+        if sys.byteorder == "big":
+            column.byteswap()
+        body.append(column.tobytes())
+
+    # The value table is stored first, followed by the fixed-size columns
+    payload = struct.pack("<Q", len(body[0])) + b"".join(body)
+    header_bytes = json.dumps(header).encode("utf-8")
+    return MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes + zlib.compress(payload, level)
+
+def _decode_column(payload: memoryview, position: int, count: int) -> Tuple[array, int]:
+    column = array(ID_TYPECODE)
+    end = position + count * column.itemsize
+    column.frombytes(payload[position:end])
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column, end
+
+def _decode_records(keys: List[str], columns: List[array], values: List[Any],
+                    count: int) -> List[Dict[str, Any]]:
+    if not keys:
+        return [{} for _ in range(count)]
+    resolved = [[values[value_id] for value_id in column] for column in columns]
+    if all(MISSING_ID not in column for column in columns):
+        return [dict(zip(keys, row)) for row in zip(*resolved)]
+
+    records = []
+    for row, row_values in enumerate(zip(*resolved)):
+        records.append({key: value for key, value, column in zip(keys, row_values, columns)
+                        if column[row] != MISSING_ID})
+    return records
+
+def decode_interface_data(blob: bytes) -> Dict[str, Any]:
+    """Decode the compact format back to the interface data dict"""
+    if not blob.startswith(MAGIC):
+        raise ValueError("Not a compact interface data file")
+    position = len(MAGIC)
+    (header_length,) = struct.unpack_from("<I", blob, position)
+    position += 4
+    header = json.loads(blob[position:position + header_length])
+    if header.get("version") != 1:
+        raise ValueError(f"Unsupported compact interface data version: {header.get('version')}")
+    payload = memoryview(zlib.decompress(blob[position + header_length:]))
+
+    (values_length,) = struct.unpack_from("<Q", payload, 0)
+    values = [None, None] + json.loads(bytes(payload[8:8 + values_length]))
+    position = 8 + values_length
+
+    food_keys = header["food_keys"]
+    correlation_keys = header["correlation_keys"]
+    food_count, correlation_count = header["foods"], header["correlations"]
+
+    food_columns = []
+    for _ in food_keys:
+        column, position = _decode_column(payload, position, food_count)
+        food_columns.append(column)
+    offsets = None
+    if "correlations" in food_keys:
+        offsets, position = _decode_column(payload, position, food_count + 1)
+    correlation_columns = []
+    for _ in correlation_keys:
+        column, position = _decode_column(payload, position, correlation_count)
+        correlation_columns.append(column)
+
+    foods = _decode_records(food_keys, food_columns, values, food_count)
+    if offsets is not None:
+        correlations = _decode_records(correlation_keys, correlation_columns, values, correlation_count)
+        column = food_columns[food_keys.index("correlations")]
+        for row, food in enumerate(foods):
+            if column[row] == CORRELATIONS_ID:
+                food["correlations"] = correlations[offsets[row]:offsets[row + 1]]
+
+    data = header["top_level"]
+    data["foods"] = foods
+    return data
+
+def save_interface_file(data: Dict[str, Any], output_file: str, build_index: bool = True,
+                        indent: Optional[int] = 2):
+    """
+    Write interface data in the format selected by the file name, together
+    with its reverse metabolite index and, for JSON, the page's search index
+    JSON output is streamed food by food, so data["foods"] may be any iterable,
+    e.g. a generator; indent=None writes compact JSON.
+    """
+    if not _is_json_path(output_file):
+        if not isinstance(data.get("foods", []), list):
+            data = dict(data, foods=list(data["foods"]))
+        _write_interface_file(data, output_file)
+        if build_index:
+            write_index(data, output_file)
+        return
+
+    builders = (MetaboliteIndexBuilder(), SearchIndexBuilder()) if build_index else ()
+
+    def foods():
+        for food in data.get("foods", []):
+            for builder in builders:
+                builder.add_food(food)
+            yield food
+
+    fields = {key: (JSONArrayStream(foods()) if key == "foods" else value) for key, value in data.items()}
+    write_json_stream(output_file, fields, indent)
+    if builders:
+        metabolite_builder, search_builder = builders
+        metabolite_builder.finish().save(index_path_for(output_file))
+        # The page compares the content hash to tell whether the index belongs to the file it loaded
+        search_builder.finish(source_hash(output_file)).save(search_index_path_for(output_file))
+
+def _is_json_path(path: str) -> bool:
+    return not path.endswith(STORE_EXTENSIONS) and not is_compact_path(path)
+
+def _write_interface_file(data: Dict[str, Any], output_file: str):
+    if output_file.endswith(STORE_EXTENSIONS):
+        store = CorrelationStore(output_file)
+        store.import_interface_data(data)
+        store.close()
+        return
+
+    encoded = encode_interface_data(data)
+    # Write to a temporary file first so readers never see a partial file
+    with atomic_write(output_file, 'wb') as f:
+        f.write(encoded)
+
+def load_interface_file(input_file: str) -> Dict[str, Any]:
+    """Read interface data from a correlation store, the compact format or (compressed) JSON"""
+    if input_file.endswith(STORE_EXTENSIONS):
+        store = CorrelationStore(input_file)
+        data = store.export_interface_data()
+        store.close()
+        return data
+
+    with open_compressed(input_file, 'rb') as f:
+        blob = f.read()
+    if blob.startswith(MAGIC):
+        return decode_interface_data(blob)
+    return json.loads(blob)
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert expert interface data between JSON and the compact format')
+    parser.add_argument('input', help='Interface data file to read (JSON or compact)')
+    parser.add_argument('output', help=f'File to write; a {COMPACT_EXTENSION} suffix selects the compact format, '
+                                       f'.sqlite/.db the correlation store and .gz/.zst compressed JSON')
+    parser.add_argument('--compact-json', action='store_true',
+                       help='Write JSON output without indentation')
+
+    args = parser.parse_args()
+
+    data = load_interface_file(args.input)
+    save_interface_file(data, args.output, indent=None if args.compact_json else 2)
+    print(f"Converted {len(data.get('foods', []))} foods: {args.input} "
+          f"({os.path.getsize(args.input):,} bytes) -> {args.output} "
+          f"({os.path.getsize(args.output):,} bytes)")
+
+if __name__ == "__main__":
+    main()
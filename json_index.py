@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Lazy, indexed access to large JSON data files
+On first open the file is scanned once for the byte span of every top-level
+field and of every element of the top-level arrays and objects (the foods list,
+the correlations and prompts mappings, ...). The spans are saved in a sidecar,
+<name>.offsets.json, and reused while the file is unchanged. Afterwards
+foods[i] or correlations[name] seeks to its span and parses only that slice.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+from collections.abc import Mapping, Sequence
+from typing import Dict, List, Any, Iterator
+
+from interface_store import load_interface_file
+from json_stream import compression_for
+
+OFFSETS_SUFFIX = ".offsets.json"
+
+# Strings as single tokens (so brackets inside them are skipped), plus the
+# structural characters
+_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}:,]')
+_OPENING = {ord("["): "array", ord("{"): "object"}
+
+def offsets_path_for(json_file: str) -> str:
+    return os.path.splitext(json_file)[0] + OFFSETS_SUFFIX
+
+def scan_json_offsets(json_file: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Byte spans of the top-level fields of a JSON object and of the elements of
+    the top-level arrays and objects: {field: {"type", "span", "spans"[, "keys"]}}
+    """
+    fields: Dict[str, Dict[str, Any]] = {}
+    with open(json_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"{json_file} is empty")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            depth = 0
+            field = None          # Entry of the top-level field being read
+            key = None            # Last string seen at depth 1 or 2, a candidate key
+            element_start = None  # Start of the current element at depth 2
+            after_colon = False
+
+            for match in _TOKEN.finditer(data):
+                token = match.group()
+                first = token[0]
+                if first == 0x22:  # '"'
+                    if (depth == 1 or (depth == 2 and field["type"] == "object")) and not after_colon:
+                        key = match
+                    continue
+
+                if first == 0x3A:  # ':'
+                    if depth == 1:
+                        name = json.loads(key.group())
+                        field = fields[name] = {"type": "value", "span": [match.end(), None], "spans": []}
+                        after_colon = True
+                    elif depth == 2 and field["type"] == "object":
+                        field["keys"].append(json.loads(key.group()))
+                        element_start = match.end()
+                        after_colon = True
+                    continue
+
+                if first == 0x2C:  # ','
+                    if depth == 1:
+                        field["span"][1] = match.start()
+                        after_colon = False
+                    elif depth == 2:
+                        field["spans"].append([element_start, match.start()])
+                        element_start = match.end() if field["type"] == "array" else None
+                        after_colon = False
+                    continue
+
+                if first in _OPENING:
+                    depth += 1
+                    if depth == 2 and field is not None and after_colon:
+                        field["type"] = _OPENING[first]
+                        if field["type"] == "object":
+                            field["keys"] = []
+                        element_start = match.end() if field["type"] == "array" else None
+                        after_colon = False
+                    elif depth == 1 and first != ord("{"):
+                        raise ValueError(f"{json_file}: the top-level value must be an object")
+                    continue
+
+                # Closing bracket
+                if depth == 2 and element_start is not None:
+                    if data[element_start:match.start()].strip():
+                        field["spans"].append([element_start, match.start()])
+                    element_start = None
+                elif depth == 1 and field is not None:
+                    field["span"][1] = match.start()
+                depth -= 1
+                if depth == 1:
+                    after_colon = False
+
+            if depth != 0:
+                raise ValueError(f"{json_file}: unbalanced brackets, the file is truncated or invalid")
+    return fields
+
+def _load_offsets(json_file: str, stat: os.stat_result) -> Dict[str, Dict[str, Any]]:
+    """The sidecar offsets if they match the file, otherwise a fresh scan saved to the sidecar"""
+    offsets_file = offsets_path_for(json_file)
+    try:
+        with open(offsets_file, 'r') as f:
+            stored = json.load(f)
+        if stored.get("version") == 1 and stored["size"] == stat.st_size and stored["mtime_ns"] == stat.st_mtime_ns:
+            return stored["fields"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    fields = scan_json_offsets(json_file)
+    try:
+        with open(offsets_file, 'w') as f:
+            json.dump({"version": 1, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                       "fields": fields}, f, separators=(",", ":"))
+    except OSError:
+        # A read-only directory only costs a rescan next time
+        pass
+    return fields
+
+class _Slices:
+    """
+    Reads spans from a handle opened together with the index, so a file
+    replaced on disk later does not shift the spans under existing views
+    """
+
+    def __init__(self, json_file: str):
+        self._file = open(json_file, 'rb')
+        self._lock = threading.Lock()
+
+    def stat(self) -> os.stat_result:
+        return os.fstat(self._file.fileno())
+
+    def read(self, span: List[int]) -> bytes:
+        start, end = span
+        with self._lock:
+            self._file.seek(start)
+            return self._file.read(end - start)
+
+    def parse(self, span: List[int]) -> Any:
+        return json.loads(self.read(span))
+
+    def parse_many(self, spans: List[List[int]]) -> Iterator[Any]:
+        for span in spans:
+            yield json.loads(self.read(span))
+
+    def close(self):
+        self._file.close()
+
+class LazyJSONArray(Sequence):
+    """A top-level JSON array whose elements are parsed on access"""
+
+    def __init__(self, slices: _Slices, spans: List[List[int]]):
+        self._slices = slices
+        self._spans = spans
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self._slices.parse_many(self._spans[index]))
+        return self._slices.parse(self._spans[index])
+
+    def __iter__(self) -> Iterator[Any]:
+        return self._slices.parse_many(self._spans)
+
+class LazyJSONObject(Mapping):
+    """A top-level JSON object whose values are parsed on access"""
+
+    def __init__(self, slices: _Slices, keys: List[str], spans: List[List[int]]):
+        self._slices = slices
+        self._spans = dict(zip(keys, spans))
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._spans)
+
+    def __contains__(self, key) -> bool:
+        return key in self._spans
+
+    def __getitem__(self, key: str) -> Any:
+        return self._slices.parse(self._spans[key])
+
+    def values(self):
+        return list(self._slices.parse_many(list(self._spans.values())))
+
+    def items(self):
+        return list(zip(self._spans, self.values()))
+
+class IndexedJSON(Mapping):
+    """
+    Read-only view of a JSON object file: array and object fields are returned
+    as lazy views, other fields are parsed on access
+    """
+
+    def __init__(self, json_file: str):
+        self.json_file = json_file
+        self._slices = _Slices(json_file)
+        self._fields = _load_offsets(json_file, self._slices.stat())
+        self._views: Dict[str, Any] = {}
+
+    def close(self):
+        self._slices.close()
+
+    def __enter__(self) -> "IndexedJSON":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+
+    def __contains__(self, key) -> bool:
+        return key in self._fields
+
+    def __getitem__(self, key: str) -> Any:
+        field = self._fields[key]
+        if field["type"] == "value":
+            return self._slices.parse(field["span"])
+        if key not in self._views:
+            if field["type"] == "array":
+                self._views[key] = LazyJSONArray(self._slices, field["spans"])
+            else:
+                self._views[key] = LazyJSONObject(self._slices, field["keys"], field["spans"])
+        return self._views[key]
+
+def load_json(json_file: str):
+    """
+    Drop-in for json.load on a data file: an IndexedJSON view for
+    uncompressed JSON objects, and the fully parsed data for compressed files
+    """
+    if compression_for(json_file) is not None:
+        # Compressed streams cannot be seeked cheaply, so they are read whole
+        return load_interface_file(json_file)
+    return IndexedJSON(json_file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Index a large JSON data file and read single entries from it')
+    parser.add_argument('file', help='JSON data file, e.g. expert_interface_data.json')
+    parser.add_argument('field', nargs='?', help='Top-level field to read, e.g. foods or correlations')
+    parser.add_argument('item', nargs='?', help='Array index or object key within the field')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data = load_json(args.file)
+    opened = time.perf_counter() - start
+    if not args.field:
+        for key in data:
+            value = data[key]
+            size = f"{len(value)} entries" if isinstance(value, (Sequence, Mapping)) and \
+                not isinstance(value, str) else "value"
+            print(f"{key}\t{size}")
+    else:
+        value = data[args.field]
+        if args.item is not None:
+            value = value[int(args.item)] if isinstance(value, Sequence) else value[args.item]
+        print(json.dumps(value, indent=2))
+    print(f"Opened {args.file} in {opened * 1000:.1f} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
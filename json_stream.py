@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Streaming, atomic JSON output
+Writes a top-level JSON object whose large fields (the foods list, the
+correlations mapping) are serialized one item at a time from an iterable, so
+the complete document is never held in memory. Output goes to a temporary file
+next to the target and is renamed into place, so readers never see a partial
+file. Indented output is byte-identical to json.dump(..., indent=2). Paths
+ending in .gz are gzip-compressed and paths ending in .zst are zstd-compressed
+(zstd requires the zstandard package).
+"""
+
+import gzip
+import importlib.util
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+
+def compression_for(path: str) -> Optional[str]:
+    """Compression selected by the file name: 'gzip', 'zstd' or None"""
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1])
+
+def strip_compression_suffix(path: str) -> str:
+    """'data.json.gz' -> 'data.json'"""
+    root, extension = os.path.splitext(path)
+    return root if extension in COMPRESSION_SUFFIXES else path
+
+def open_compressed(path: str, mode: str = 'rb', compression: Optional[str] = None):
+    """Open a file, compressed or not, as chosen by its name or the compression argument"""
+    compression = compression or compression_for(path)
+    encoding = None if 'b' in mode else 'utf-8'
+    if compression == "gzip":
+        return gzip.open(path, mode if 'b' in mode else mode + 't', encoding=encoding)
+    if compression == "zstd":
+        if importlib.util.find_spec("zstandard") is None:
+            raise ImportError("zstd-compressed files require the zstandard package (pip install zstandard)")
+        import zstandard
+        return zstandard.open(path, mode, encoding=encoding)
+    return open(path, mode, encoding=encoding)
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'w', compression: Optional[str] = None):
+    """
+    Yield a file handle on a temporary file next to path and rename it into
+    place once the block completes; on error the temporary file is removed
+    """
+    # A named file in the target directory keeps the usual umask permissions
+    # and makes the final os.replace a same-filesystem rename
+    tmp_path = f"{path}.{uuid.uuid4().hex[:12]}.tmp"
+    try:
+        with open_compressed(tmp_path, mode, compression or compression_for(path)) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+class JSONArrayStream:
+    """A top-level field serialized as a JSON array, one item at a time"""
+
+    def __init__(self, items: Iterable[Any]):
+        self.items = items
+
+class JSONObjectStream:
+    """A top-level field serialized as a JSON object from (key, value) pairs"""
+
+    def __init__(self, pairs: Iterable[Tuple[str, Any]]):
+        self.pairs = pairs
+
+def _write_stream(f, stream, indent: Optional[int]):
+    is_object = isinstance(stream, JSONObjectStream)
+    opening, closing = ("{", "}") if is_object else ("[", "]")
+    if indent is None:
+        separator, item_separator, newline, inner = ":", ",", "", ""
+    else:
+        separator, item_separator, newline = ": ", ",", "\n"
+        inner = " " * (2 * indent)
+    dumps_kwargs = {"indent": indent} if indent is not None else {"separators": (",", ":")}
+
+    f.write(opening)
+    empty = True
+    for entry in (stream.pairs if is_object else stream.items):
+        f.write(newline + inner if empty else item_separator + newline + inner)
+        empty = False
+        if is_object:
+            key, value = entry
+            f.write(json.dumps(str(key)) + separator)
+        else:
+            value = entry
+        text = json.dumps(value, **dumps_kwargs)
+        # JSON strings cannot contain raw newlines, so this only re-indents structure
+        f.write(text.replace("\n", "\n" + inner) if indent is not None else text)
+    if not empty:
+        f.write(newline + " " * (indent or 0))
+    f.write(closing)
+
+def write_json_stream(output_file: str, fields: Dict[str, Any], indent: Optional[int] = 2,
+                      compression: Optional[str] = None):
+    """
+    Atomically write a JSON object to output_file; fields holding a
+    JSONArrayStream or JSONObjectStream are streamed item by item, and indent=None
+    writes compact JSON
+    """
+    with atomic_write(output_file, 'w', compression) as f:
+        if not fields:
+            f.write("{}")
+            return
+        newline = "" if indent is None else "\n" + " " * indent
+        separator = ":" if indent is None else ": "
+        for i, (key, value) in enumerate(fields.items()):
+            f.write(("{" if i == 0 else ",") + newline + json.dumps(str(key)) + separator)
+            if isinstance(value, (JSONArrayStream, JSONObjectStream)):
+                _write_stream(f, value, indent)
+            else:
+                text = json.dumps(value, **({"indent": indent} if indent is not None
+                                            else {"separators": (",", ":")}))
+                f.write(text.replace("\n", newline) if indent is not None else text)
+        f.write(("" if indent is None else "\n") + "}")
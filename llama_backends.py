@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""
+Inference backends for the Llama integration
+Each backend is built once from its LLAMA_CONFIG block and reused for the whole
+run: the llama-cpp model is loaded a single time, Ollama requests share a pooled
+HTTP session, and llama.cpp runs as one warm server process
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BACKEND_ORDER = ["python_bindings", "ollama", "command_line"]
+
+class BackendError(Exception):
+    """Raised when a backend cannot produce a response"""
+
+class BackendTimeout(BackendError):
+    """Raised when a generation does not finish before its deadline"""
+
+class BackendOverloaded(BackendError):
+    """Raised when a backend asks callers to slow down (HTTP 429/503)"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _check_http_response(response: requests.Response, backend: str):
+    """Raise the matching BackendError for an unsuccessful HTTP response"""
+    if response.status_code in (429, 503):
+        retry_after = response.headers.get("Retry-After")
+        raise BackendOverloaded(f"{backend} is overloaded (HTTP {response.status_code})",
+                                float(retry_after) if retry_after and retry_after.isdigit() else None)
+    response.raise_for_status()
+
+class LlamaBackend:
+    """Base class for inference backends"""
+    name = "base"
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.temperature = config.get("temperature", 0.7)
+        self.max_tokens = config.get("max_tokens", 2048)
+
+    @property
+    def model_id(self) -> str:
+        """Identifier of the model, used in cache keys"""
+        return self.config.get("model_path", "")
+
+    def cache_identity(self) -> Tuple[str, float, int]:
+        """Return the (model, temperature, max_tokens) triple that shapes a response"""
+        return self.model_id, self.temperature, self.max_tokens
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Generate a completion for the prompt, giving up after `timeout` seconds"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release the resources held by the backend"""
+
+class PythonBindingsBackend(LlamaBackend):
+    """llama-cpp-python bindings, with the model loaded once on first use"""
+    name = "python_bindings"
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self._llm = None
+        self._batch_ctx = None
+        self._batch_ctx_shape = (0, 0)
+        self._prefix = ""
+        self._prefix_state = None
+        self._prefix_tokens = []
+        # A llama-cpp context is not thread-safe, so generations are serialized
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_available(config: Dict[str, Any]) -> bool:
+        """Check that llama-cpp-python is installed and the model file exists"""
+        return (importlib.util.find_spec("llama_cpp") is not None
+                and os.path.exists(config.get("model_path", "")))
+
+    def _load(self):
+        if self._llm is None:
+            from llama_cpp import Llama
+            print(f"Loading model {self.model_id}...")
+            self._llm = Llama(
+                model_path=self.model_id,
+                n_ctx=self.config.get("n_ctx", 4096),
+                n_threads=self.config.get("n_threads", 4),
+                n_gpu_layers=self.config.get("n_gpu_layers", 0),
+                verbose=False
+            )
+        return self._llm
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        with self._lock:
+            return self._generate_unlocked(prompt, timeout)
+
+    def _generate_unlocked(self, prompt: str, timeout: Optional[float] = None) -> str:
+        from llama_cpp import StoppingCriteriaList
+
+        llm = self._load()
+        self._restore_prefix(llm, prompt)
+        deadline = time.monotonic() + timeout if timeout else None
+        stopping_criteria = StoppingCriteriaList(
+            [lambda input_ids, logits: deadline is not None and time.monotonic() > deadline])
+        # llama-cpp reuses the longest matching token prefix already in the KV
+        # cache, so only the food-specific suffix is evaluated here
+        response = llm(prompt, max_tokens=self.max_tokens, temperature=self.temperature,
+                       stopping_criteria=stopping_criteria)
+        if deadline is not None and time.monotonic() > deadline:
+            raise BackendTimeout(f"Generation did not finish within {timeout}s")
+        return response["choices"][0]["text"]
+
+    def set_shared_prefix(self, prefix: str):
+        """Register the text every prompt starts with, so its model state can be reused"""
+        with self._lock:
+            self._prefix = prefix
+            self._prefix_state = None
+            self._prefix_tokens = []
+
+    def _prefix_cache_path(self) -> Optional[str]:
+        """On-disk location of the saved prefix state, keyed by prefix text and model"""
+        cache_dir = self.config.get("prefix_cache_dir")
+        if not cache_dir:
+            return None
+        key = hashlib.sha256(json.dumps(
+            [self._prefix, self.model_id, self.config.get("n_ctx", 4096)]).encode("utf-8")).hexdigest()
+        return os.path.join(cache_dir, f"{key}.state")
+
+    def _restore_prefix(self, llm, prompt: str):
+        """Load the evaluated prefix into the context unless it is already there"""
+        if not self._prefix or not prompt.startswith(self._prefix):
+            return
+
+        if self._prefix_state is None:
+            self._prefix_state = self._build_prefix_state(llm)
+            if self._prefix_state is None:
+                return
+            self._prefix_tokens = list(self._prefix_state.input_ids[:self._prefix_state.n_tokens])
+
+        # input_ids keeps stale tokens past n_tokens, so only the evaluated part counts
+        n_prefix = len(self._prefix_tokens)
+        if llm.n_tokens < n_prefix or list(llm.input_ids[:n_prefix]) != self._prefix_tokens:
+            llm.load_state(self._prefix_state)
+
+    def _build_prefix_state(self, llm):
+        """Evaluate the shared prefix once, or load its state from the prefix cache"""
+        path = self._prefix_cache_path()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    state = pickle.load(f)
+                print(f"Loaded prompt prefix state from {path}")
+                return state
+            except Exception as e:
+                print(f"Could not load prompt prefix state from {path}: {e}")
+
+        # The last prefix token is dropped because it may merge with the food name
+        tokens = llm.tokenize(self._prefix.encode("utf-8"), add_bos=True)[:-1]
+        if not tokens:
+            return None
+
+        llm.reset()
+        llm.eval(tokens)
+        state = llm.save_state()
+        print(f"Evaluated shared prompt prefix ({len(tokens)} tokens)")
+
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + ".tmp", "wb") as f:
+                    pickle.dump(state, f)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                print(f"Could not save prompt prefix state to {path}: {e}")
+        return state
+
+    def generate_batch(self, prompts: List[str], timeout: Optional[float] = None) -> List[str]:
+        """
+        Generate completions for several prompts in one evaluation batch
+        The tokens the prompts share at the start are evaluated once and attached
+        to every sequence, so the common instruction preamble costs a single pass.
+        Falls back to one generation per prompt if the installed llama-cpp-python
+        does not expose the low-level batch API or the batch does not fit in
+        batch_n_ctx (default: n_ctx per prompt).
+        """
+        if len(prompts) <= 1:
+            return [self.generate(prompt, timeout) for prompt in prompts]
+
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            llm = self._load()
+            try:
+                return self._decode_batch(llm, prompts, deadline)
+            except BackendTimeout:
+                raise
+            except (AttributeError, BackendError) as e:
+                print(f"Batched decoding unavailable ({e}), generating prompts one at a time")
+                responses = []
+                for prompt in prompts:
+                    remaining = max(0.001, deadline - time.monotonic()) if deadline else None
+                    responses.append(self._generate_unlocked(prompt, remaining))
+                return responses
+
+    def _get_batch_context(self, llm, n_seq: int, n_ctx: int):
+        """Return a context sized for n_seq parallel sequences, reusing it between batches"""
+        import llama_cpp
+
+        max_seq, max_ctx = self._batch_ctx_shape
+        if self._batch_ctx is not None and max_seq >= n_seq and max_ctx >= n_ctx:
+            _clear_kv_cache(self._batch_ctx)
+            return self._batch_ctx
+
+        self._free_batch_context()
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_ctx
+        params.n_batch = n_ctx
+        params.n_ubatch = min(n_ctx, 512)
+        params.n_seq_max = n_seq
+        params.n_threads = self.config.get("n_threads", 4)
+        params.n_threads_batch = self.config.get("n_threads", 4)
+        ctx = llama_cpp.llama_new_context_with_model(llm.model, params)
+        if not ctx:
+            raise BackendError(f"Could not create a batch context for {n_seq} sequences")
+        self._batch_ctx = ctx
+        self._batch_ctx_shape = (n_seq, n_ctx)
+        return ctx
+
+    def _decode_batch(self, llm, prompts: List[str], deadline: Optional[float] = None) -> List[str]:
+        import llama_cpp
+
+        tokens = [llm.tokenize(prompt.encode("utf-8"), add_bos=True) for prompt in prompts]
+        n_seq = len(tokens)
+
+        # Every sequence needs at least one token of its own to produce logits
+        prefix_len = 0
+        shortest = min(len(seq) for seq in tokens)
+        while prefix_len < shortest - 1 and all(seq[prefix_len] == tokens[0][prefix_len] for seq in tokens):
+            prefix_len += 1
+
+        prompt_tokens = prefix_len + sum(len(seq) - prefix_len for seq in tokens)
+        n_ctx = self.config.get("batch_n_ctx", self.config.get("n_ctx", 4096) * n_seq)
+        if prompt_tokens + n_seq * self.max_tokens > n_ctx:
+            raise BackendError(f"Batch of {n_seq} prompts needs more than batch_n_ctx={n_ctx} tokens")
+
+        ctx = self._get_batch_context(llm, n_seq, n_ctx)
+        batch = llama_cpp.llama_batch_init(max(prompt_tokens, n_seq), 0, n_seq)
+        sampler = llama_cpp.llama_sampler_chain_init(llama_cpp.llama_sampler_chain_default_params())
+        if self.temperature > 0:
+            llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_temp(self.temperature))
+            llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_dist(llama_cpp.LLAMA_DEFAULT_SEED))
+        else:
+            llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_greedy())
+
+        try:
+            # The shared prefix is added once and tagged with every sequence id
+            batch.n_tokens = 0
+            for pos in range(prefix_len):
+                _batch_add(batch, tokens[0][pos], pos, range(n_seq), False)
+            logits_index = {}
+            for seq_id, seq in enumerate(tokens):
+                for pos in range(prefix_len, len(seq)):
+                    _batch_add(batch, seq[pos], pos, [seq_id], pos == len(seq) - 1)
+                logits_index[seq_id] = batch.n_tokens - 1
+            if llama_cpp.llama_decode(ctx, batch) != 0:
+                raise BackendError("llama_decode failed on the prompt batch")
+
+            n_past = [len(seq) for seq in tokens]
+            generated = [[] for _ in tokens]
+            for _ in range(self.max_tokens):
+                if deadline is not None and time.monotonic() > deadline:
+                    raise BackendTimeout(f"Batch of {n_seq} prompts did not finish before its deadline")
+                batch.n_tokens = 0
+                next_index = {}
+                for seq_id, index in logits_index.items():
+                    token = llama_cpp.llama_sampler_sample(sampler, ctx, index)
+                    if _is_end_of_generation(llm, token):
+                        continue
+                    generated[seq_id].append(token)
+                    _batch_add(batch, token, n_past[seq_id], [seq_id], True)
+                    next_index[seq_id] = batch.n_tokens - 1
+                    n_past[seq_id] += 1
+                if not next_index:
+                    break
+                logits_index = next_index
+                if llama_cpp.llama_decode(ctx, batch) != 0:
+                    raise BackendError("llama_decode failed while generating")
+        finally:
+            llama_cpp.llama_sampler_free(sampler)
+            llama_cpp.llama_batch_free(batch)
+
+        return [llm.detokenize(seq).decode("utf-8", errors="ignore") for seq in generated]
+
+    def _free_batch_context(self):
+        if self._batch_ctx is not None:
+            import llama_cpp
+            llama_cpp.llama_free(self._batch_ctx)
+            self._batch_ctx = None
+            self._batch_ctx_shape = (0, 0)
+
+    def close(self):
+        with self._lock:
+            self._free_batch_context()
+            self._llm = None
+
+def _batch_add(batch, token: int, pos: int, seq_ids, logits: bool):
+    """Append one token to a llama_batch, attached to the given sequences"""
+    index = batch.n_tokens
+    batch.token[index] = token
+    batch.pos[index] = pos
+    seq_ids = list(seq_ids)
+    batch.n_seq_id[index] = len(seq_ids)
+    for j, seq_id in enumerate(seq_ids):
+        batch.seq_id[index][j] = seq_id
+    batch.logits[index] = logits
+    batch.n_tokens += 1
+
+def _is_end_of_generation(llm, token: int) -> bool:
+    """Check for end-of-generation tokens (EOS, EOT) across llama-cpp versions"""
+    import llama_cpp
+
+    if hasattr(llama_cpp, "llama_token_is_eog"):
+        return bool(llama_cpp.llama_token_is_eog(llm.model, token))
+    return token == llm.token_eos()
+
+def _clear_kv_cache(ctx):
+    """Drop every sequence from a context's KV cache"""
+    import llama_cpp
+
+    if hasattr(llama_cpp, "llama_kv_cache_clear"):
+        llama_cpp.llama_kv_cache_clear(ctx)
+    else:
+        llama_cpp.llama_kv_self_clear(ctx)
+
+class OllamaBackend(LlamaBackend):
+    """Ollama HTTP API over a pooled keep-alive session"""
+    name = "ollama"
+
+    def __init__(self, config: Dict[str, Any], pool_size: int = 16):
+        super().__init__(config)
+        self.base_url = config.get("base_url", "http://localhost:11434").rstrip("/")
+        self.timeout = config.get("timeout", 300)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    @property
+    def model_id(self) -> str:
+        return f"ollama:{self.config.get('model', 'llama2')}"
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        try:
+            response = self._session.post(f"{self.base_url}/api/generate", json={
+                "model": self.config.get("model", "llama2"),
+                "prompt": prompt,
+                "stream": False,
+                "options": {
+                    "temperature": self.temperature,
+                    "num_predict": self.max_tokens
+                }
+            }, timeout=timeout or self.timeout)
+            _check_http_response(response, "Ollama")
+            return response.json()["response"]
+        except requests.Timeout as e:
+            raise BackendTimeout(f"Ollama request timed out: {e}") from e
+        except (requests.RequestException, KeyError, ValueError) as e:
+            raise BackendError(f"Ollama request failed: {e}") from e
+
+    def close(self):
+        self._session.close()
+
+class CommandLineBackend(LlamaBackend):
+    """
+    llama.cpp executables
+    In persistent mode the model is loaded once by a llama-server process that
+    stays warm for the whole run; otherwise the CLI is started for every prompt.
+    """
+    name = "command_line"
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.persistent = config.get("persistent", True)
+        self.timeout = config.get("timeout", 300)
+        self.port = config.get("server_port", 8080)
+        self._process = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_available(config: Dict[str, Any]) -> bool:
+        """Check that the configured executable can be found"""
+        key = "server_executable" if config.get("persistent", True) else "executable"
+        executable = config.get(key, "")
+        return bool(executable) and (shutil.which(executable) is not None or os.path.exists(executable))
+
+    def _start_server(self):
+        """Start the llama.cpp server once and wait until it reports healthy"""
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                return
+
+            cmd = [
+                self.config.get("server_executable", "llama-server"),
+                "--model", self.model_id,
+                "--ctx-size", str(self.config.get("context_size", 4096)),
+                "--host", "127.0.0.1",
+                "--port", str(self.port)
+            ] + list(self.config.get("server_args", []))
+            print(f"Starting llama.cpp server: {' '.join(cmd)}")
+            self._process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self._session = requests.Session()
+
+            deadline = time.monotonic() + self.config.get("startup_timeout", 120)
+            while time.monotonic() < deadline:
+                if self._process.poll() is not None:
+                    raise BackendError(f"llama.cpp server exited with code {self._process.returncode}")
+                try:
+                    if self._session.get(f"{self._server_url}/health", timeout=2).status_code == 200:
+                        return
+                except requests.RequestException:
+                    pass
+                time.sleep(0.5)
+
+            self._stop_server()
+            raise BackendError("llama.cpp server did not become healthy in time")
+
+    @property
+    def _server_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        if not self.persistent:
+            return self._generate_once(prompt, timeout)
+
+        self._start_server()
+        try:
+            response = self._session.post(f"{self._server_url}/completion", json={
+                "prompt": prompt,
+                "n_predict": self.max_tokens,
+                "temperature": self.temperature,
+                "cache_prompt": True
+            }, timeout=timeout or self.timeout)
+            _check_http_response(response, "llama.cpp server")
+            return response.json()["content"]
+        except requests.Timeout as e:
+            raise BackendTimeout(f"llama.cpp server request timed out: {e}") from e
+        except (requests.RequestException, KeyError, ValueError) as e:
+            raise BackendError(f"llama.cpp server request failed: {e}") from e
+
+    def _generate_once(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Run the llama.cpp CLI for a single prompt"""
+        cmd = [
+            self.config.get("executable", "llama"),
+            "--model", self.model_id,
+            "--prompt", prompt,
+            "--n-predict", str(self.max_tokens),
+            "--temp", str(self.temperature),
+            "--ctx-size", str(self.config.get("context_size", 4096))
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout or self.timeout)
+        except subprocess.TimeoutExpired as e:
+            raise BackendTimeout(f"llama.cpp command timed out: {e}") from e
+        except OSError as e:
+            raise BackendError(f"llama.cpp command failed: {e}") from e
+        if result.returncode != 0:
+            raise BackendError(f"llama.cpp exited with code {result.returncode}: {result.stderr.strip()}")
+        return result.stdout
+
+    def _stop_server(self):
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+            self._process = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def close(self):
+        with self._lock:
+            self._stop_server()
+
+BACKEND_CLASSES = {
+    "python_bindings": PythonBindingsBackend,
+    "ollama": OllamaBackend,
+    "command_line": CommandLineBackend
+}
+
+def create_backend(llama_config: Dict[str, Any], name: Optional[str] = None) -> Optional[LlamaBackend]:
+    """
+    Build the backend to use for a run
+    With a name, that backend is built regardless of its `enabled` flag;
+    otherwise the first enabled backend that is available on this machine is used.
+    Returns None when no backend can be built.
+    """
+    candidates = [name] if name else [key for key in BACKEND_ORDER
+                                      if llama_config.get(key, {}).get("enabled")]
+
+    for key in candidates:
+        if key not in BACKEND_CLASSES:
+            print(f"Unknown Llama backend: {key}")
+            continue
+
+        config = llama_config.get(key, {})
+        backend_class = BACKEND_CLASSES[key]
+        is_available = getattr(backend_class, "is_available", None)
+        if is_available is not None and not is_available(config):
+            print(f"Llama backend '{key}' is enabled but not available on this machine")
+            continue
+
+        print(f"Using Llama backend: {key}")
+        return backend_class(config)
+
+    return None
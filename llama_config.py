@@ -14,7 +14,8 @@ LLAMA_CONFIG = {
         "n_threads": 4,  # Number of CPU threads
         "n_gpu_layers": 0,  # Set to >0 if you have GPU
         "max_tokens": 2048,
-        "temperature": 0.7
+        "temperature": 0.7,
+        "prefix_cache_dir": ".llama_prefix_cache"  # Saved state of the shared prompt prefix (None to disable)
     },
     
     # Option 2: Ollama
@@ -33,7 +34,11 @@ LLAMA_CONFIG = {
         "model_path": "llama-2-13b-chat.gguf",  # Path to your model
         "max_tokens": 2048,
         "temperature": 0.7,
-        "context_size": 4096
+        "context_size": 4096,
+        "persistent": True,  # Keep one llama.cpp server running instead of one process per food
+        "server_executable": "llama-server",  # Path to the llama.cpp server executable
+        "server_port": 8080,
+        "server_args": []  # Extra server flags, e.g. ["--parallel", "4"]
     }
 }
 
@@ -42,7 +47,10 @@ PROCESSING_CONFIG = {
     "max_foods": 5,  # Number of foods to process for testing
     "timeout": 300,  # Timeout for Llama calls in seconds
     "retry_attempts": 3,  # Number of retry attempts if Llama fails
-    "delay_between_calls": 2  # Delay between food processing in seconds
+    "delay_between_calls": 2,  # Base delay in seconds for retry backoff and overload pacing
+    "max_delay": 60,  # Upper bound for backoff and pacing delays in seconds
+    "circuit_breaker_threshold": 5,  # Consecutive failures before backend calls are paused
+    "circuit_breaker_reset": 60  # Seconds to pause before trying the backend again
 }
 
 # Model Download URLs (for reference)
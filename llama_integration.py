@@ -4,14 +4,27 @@ Llama Integration for Food-Metabolite Correlation Analysis
 Uses Llama to generate correlations based on the prompts created by the analyzer
 """
 
+import asyncio
 import json
 import os
-import subprocess
-import time
-from typing import Dict, List, Any, Optional
+import queue
+import threading
+from collections.abc import ItemsView, Mapping, ValuesView
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Optional, Tuple, Iterator, Set, Callable
 from datetime import datetime
 import argparse
 
+from correlation_store import CorrelationStore
+from execution_policy import ExecutionPolicy
+from interface_store import save_interface_file, COMPACT_EXTENSION
+from json_index import IndexedJSON, load_json
+from json_stream import JSONObjectStream, write_json_stream
+from llama_backends import LlamaBackend, BACKEND_ORDER, create_backend
+from ollama_async import AsyncOllamaClient
+from response_parser import CorrelationStreamParser, parse_correlations
+from response_cache import ResponseCache, make_cache_key, DEFAULT_CACHE_FILE, DEFAULT_MAX_BYTES
+
 # Import configuration
 try:
     from llama_config import LLAMA_CONFIG, PROCESSING_CONFIG, get_model_path
@@ -22,21 +35,103 @@ except ImportError:
     def get_model_path():
         return "llama-2-7b-chat.gguf"
 
+class CheckpointEntries(Mapping):
+    """
+    Checkpointed results of a run, read from the checkpoint file on access
+    Only the byte offset of each food's entry is kept in memory, so the
+    results of a large run are streamed to the outputs one food at a time.
+    The entries stay readable while the checkpoint is appended to, but not
+    after a fresh run truncates it.
+    """
+
+    def __init__(self, checkpoint_file: str, offsets: Dict[str, int]):
+        self.checkpoint_file = checkpoint_file
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._offsets)
+
+    def __contains__(self, food_name) -> bool:
+        return food_name in self._offsets
+
+    def __getitem__(self, food_name: str) -> Dict[str, Any]:
+        offset = self._offsets[food_name]
+        with open(self.checkpoint_file, 'rb') as f:
+            return self._read(f, offset)
+
+    @staticmethod
+    def _read(f, offset: int) -> Dict[str, Any]:
+        f.seek(offset)
+        return json.loads(f.readline())['data']
+
+    def _iter_items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        # One handle for the whole pass instead of one per food
+        with open(self.checkpoint_file, 'rb') as f:
+            for food_name, offset in self._offsets.items():
+                yield food_name, self._read(f, offset)
+
+    def items(self):
+        return _CheckpointItems(self)
+
+    def values(self):
+        return _CheckpointValues(self)
+
+class _CheckpointItems(ItemsView):
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+class _CheckpointValues(ValuesView):
+    def __iter__(self):
+        return (entry for _, entry in self._mapping._iter_items())
+
 class LlamaIntegration:
     def __init__(self, prompts_file: str = "llama_prompts.json", 
-                 output_file: str = "llama_correlations.json"):
+                 output_file: str = "llama_correlations.json",
+                 cache: Optional[ResponseCache] = None,
+                 checkpoint_file: Optional[str] = None,
+                 backend: Optional[LlamaBackend] = None,
+                 backend_name: Optional[str] = None,
+                 policy: Optional[ExecutionPolicy] = None,
+                 store: Optional[CorrelationStore] = None,
+                 compact_json: bool = False):
         self.prompts_file = prompts_file
         self.output_file = output_file
+        # Indentation of the JSON outputs; None writes compact JSON
+        self.json_indent = None if compact_json else 2
+        self.checkpoint_file = checkpoint_file or os.path.splitext(output_file)[0] + ".checkpoint.jsonl"
+        self.cache = cache
+        self.store = store
+        self.backend = backend
+        self.backend_name = backend_name
+        self.ollama_config = LLAMA_CONFIG.get('ollama', {})
+        # Timeouts, retries, circuit breaking and pacing for every backend call
+        self.policy = policy or ExecutionPolicy.from_config(PROCESSING_CONFIG)
+        self._backend_resolved = backend is not None
+        self._backend_lock = threading.Lock()
         self.prompts = {}
+        # Open view of the prompts file, which self.prompts reads from; close()
+        # releases it and the next run reopens it, like the backend
+        self._prompts_view = None
+        self._prompts_released = False
+        # Hash of the template the prompts were rendered from, when the prompts file records it
+        self.template_hash = None
         self.correlations = {}
         self.load_prompts()
     
     def load_prompts(self):
         """Load prompts from the JSON file"""
+        self._close_prompts_view()
+        self._prompts_released = False
         try:
-            with open(self.prompts_file, 'r') as f:
-                data = json.load(f)
-                self.prompts = data.get('prompts', {})
+            # Prompts are parsed one food at a time, when they are used
+            data = load_json(self.prompts_file)
+            if isinstance(data, IndexedJSON):
+                self._prompts_view = data
+            self.prompts = data.get('prompts', {})
+            self.template_hash = (data.get('template') or {}).get('hash')
             print(f"Loaded {len(self.prompts)} prompts from {self.prompts_file}")
         except FileNotFoundError:
             print(f"Prompts file {self.prompts_file} not found. Please run the analyzer first.")
@@ -45,28 +140,142 @@ class LlamaIntegration:
             print(f"Error loading prompts: {e}")
             self.prompts = {}
     
+    def _close_prompts_view(self):
+        if self._prompts_view is not None:
+            self._prompts_view.close()
+            self._prompts_view = None
+    
+    def get_backend(self) -> Optional[LlamaBackend]:
+        """Build the configured backend on first use and reuse it afterwards"""
+        with self._backend_lock:
+            if not self._backend_resolved:
+                self.backend = create_backend(LLAMA_CONFIG, self.backend_name)
+                if self.backend is None:
+                    print("No Llama backend available, correlations will use the fallback method")
+                elif hasattr(self.backend, 'set_shared_prefix'):
+                    prefix = self.shared_prompt_prefix()
+                    if prefix:
+                        self.backend.set_shared_prefix(prefix)
+                self._backend_resolved = True
+            return self.backend
+    
+    def shared_prompt_prefix(self) -> str:
+        """
+        Return the text all loaded prompts start with: the general instructions
+        of the template, which puts the food-specific task at the end
+        """
+        if len(self.prompts) < 2:
+            return ""
+        return os.path.commonprefix(list(self.prompts.values()))
+    
+    def close(self):
+        """Release the backend (model, HTTP sessions or server process) and the prompts file"""
+        with self._backend_lock:
+            if self.backend is not None:
+                self.backend.close()
+        if self._prompts_view is not None:
+            self._close_prompts_view()
+            self.prompts = {}
+            self._prompts_released = True
+    
+    def _generation_settings(self) -> Tuple[str, float, int]:
+        """Return the model, temperature and max_tokens used for generation"""
+        backend = self.get_backend()
+        if backend is not None:
+            return backend.cache_identity()
+        settings = LLAMA_CONFIG.get('python_bindings', {})
+        return get_model_path(), settings.get('temperature', 0.7), settings.get('max_tokens', 2048)
+    
     def call_llama(self, food_name: str, prompt: str) -> Optional[str]:
         """
         Call Llama to get correlations for a specific food
+        Responses are looked up in the response cache first, if one is configured
+        """
+        return self._call_llama(food_name, prompt)[0]
+    
+    def _call_llama(self, food_name: str, prompt: str) -> Tuple[str, bool]:
+        """
+        Return (response, failed); failed is True when a configured backend
+        could not answer (timeout, exhausted retries, open circuit breaker or a
+        too short response) and the fallback correlations were used instead
         """
         try:
-            # Try to use Llama if available
-            if hasattr(self, 'llama') and self.llama is not None:
+            model_path, temperature, max_tokens = self._generation_settings()
+            cache_key = None
+            if self.cache is not None:
+                cache_key = make_cache_key(prompt, model_path, temperature, max_tokens)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached, False
+            
+            backend = self.get_backend()
+            if backend is not None:
                 try:
-                    # Use the existing Llama integration
-                    response = self.llama(prompt, max_tokens=2048, temperature=0.7, stop=["\n\n"])
+                    response = self.policy.call(lambda timeout: backend.generate(prompt, timeout))
                     if response and len(response.strip()) > 100:
-                        return response
+                        # Only real model output is cached, never the fallback
+                        if cache_key is not None:
+                            self.cache.put(cache_key, response)
+                        return response, False
                 except Exception as e:
                     print(f"Llama call failed: {e}")
             
             # Fallback: Generate comprehensive mock correlations for all foods
             print(f"Using fallback method for {food_name}...")
-            return self._generate_comprehensive_correlations(food_name)
+            return self._generate_comprehensive_correlations(food_name), backend is not None
             
         except Exception as e:
             print(f"Error calling Llama for {food_name}: {e}")
-            return self._generate_comprehensive_correlations(food_name)
+            return self._generate_comprehensive_correlations(food_name), True
+    
+    def call_llama_batch(self, items: List[Tuple[str, str]]) -> List[str]:
+        """
+        Call Llama for several (food_name, prompt) pairs at once
+        Backends with batched generation evaluate all uncached prompts together;
+        other backends fall back to one call_llama per food
+        """
+        return [response for response, _ in self._call_llama_batch(items)]
+    
+    def _call_llama_batch(self, items: List[Tuple[str, str]]) -> List[Tuple[str, bool]]:
+        """Batched counterpart of _call_llama, returning (response, failed) per item"""
+        backend = self.get_backend()
+        if backend is None or not hasattr(backend, 'generate_batch'):
+            return [self._call_llama(food_name, prompt) for food_name, prompt in items]
+        
+        responses = [None] * len(items)
+        failed = [False] * len(items)
+        cache_keys = [None] * len(items)
+        if self.cache is not None:
+            identity = backend.cache_identity()
+            for i, (_, prompt) in enumerate(items):
+                cache_keys[i] = make_cache_key(prompt, *identity)
+                responses[i] = self.cache.get(cache_keys[i])
+        
+        missing = [i for i, response in enumerate(responses) if response is None]
+        if missing:
+            try:
+                prompts = [items[i][1] for i in missing]
+                # A batch gets the per-call deadline once for every prompt in it
+                generated = self.policy.call(
+                    lambda timeout: backend.generate_batch(prompts, timeout * len(prompts)))
+            except Exception as e:
+                print(f"Batched Llama call failed: {e}")
+                generated = [None] * len(missing)
+            
+            # A batch that comes back short leaves its last prompts to the fallback
+            generated = list(generated or [])[:len(missing)]
+            generated += [None] * (len(missing) - len(generated))
+            for i, response in zip(missing, generated):
+                if response and len(response.strip()) > 100:
+                    if cache_keys[i] is not None:
+                        self.cache.put(cache_keys[i], response)
+                    responses[i] = response
+                else:
+                    print(f"Using fallback method for {items[i][0]}...")
+                    responses[i] = self._generate_comprehensive_correlations(items[i][0])
+                    failed[i] = True
+        
+        return list(zip(responses, failed))
     
     def _generate_comprehensive_correlations(self, food_name: str) -> str:
         """
@@ -143,42 +352,14 @@ Relevant Quote: "{quote}"
     def parse_llama_response(self, response: str, food_name: str) -> List[Dict[str, Any]]:
         """
         Parse the Llama response to extract structured correlation data
-        This is a basic parser - you may need to enhance it based on Llama's output format
+        Each blank-line separated block with Reference, Metabolite and
+        Correlation Type lines becomes one correlation
         """
-        correlations = []
-        
-        # Split response into sections (basic parsing)
-        sections = response.split('\n\n')
-        
-        for section in sections:
-            if 'Reference:' in section and 'Metabolite:' in section:
-                try:
-                    lines = section.strip().split('\n')
-                    correlation = {}
-                    
-                    for line in lines:
-                        line = line.strip()
-                        if line.startswith('Reference:'):
-                            correlation['reference'] = line.replace('Reference:', '').strip()
-                        elif line.startswith('Metabolite:'):
-                            correlation['metabolite'] = line.replace('Metabolite:', '').strip()
-                        elif line.startswith('Correlation Type:'):
-                            correlation['correlationType'] = line.replace('Correlation Type:', '').strip()
-                        elif line.startswith('Finding Description:'):
-                            correlation['finding'] = line.replace('Finding Description:', '').strip()
-                        elif line.startswith('Relevant Quote:'):
-                            correlation['relevantQuote'] = line.replace('Relevant Quote:', '').strip()
-                    
-                    # Only add if we have the essential fields
-                    if all(key in correlation for key in ['reference', 'metabolite', 'correlationType']):
-                        correlation['verified'] = None  # Not yet verified by expert
-                        correlation['expertNotes'] = ""
-                        correlations.append(correlation)
-                
-                except Exception as e:
-                    print(f"Error parsing correlation section: {e}")
-                    continue
-        
+        return self._finalize_correlations(parse_correlations(response), food_name)
+    
+    def _finalize_correlations(self, correlations: List[Dict[str, Any]],
+                               food_name: str) -> List[Dict[str, Any]]:
+        """Apply the fallback when parsing did not capture enough correlations"""
         # If parsing didn't work well, create structured correlations manually
         if len(correlations) < 15:  # Fallback if parsing didn't capture enough
             print(f"Parsing captured {len(correlations)} correlations, using fallback method...")
@@ -283,12 +464,14 @@ Relevant Quote: "{quote}"
         
         return base_correlations
     
-    def process_food(self, food_name: str, prompt: str) -> List[Dict[str, Any]]:
-        """Process a single food item with Llama"""
+    def process_food(self, food_name: str, prompt: str,
+                     response: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Process a single food item with Llama, or an already generated response"""
         print(f"\nProcessing {food_name}...")
         
         # Call Llama
-        response = self.call_llama(prompt, food_name)
+        if response is None:
+            response = self.call_llama(food_name, prompt)
         if not response:
             print(f"No response from Llama for {food_name}")
             return []
@@ -299,8 +482,46 @@ Relevant Quote: "{quote}"
         
         return correlations
     
-    def process_all_foods(self, max_foods: Optional[int] = None) -> Dict[str, Any]:
-        """Process all foods with Llama"""
+    def _process_entry(self, food_name: str, prompt: str, response: Optional[str] = None,
+                       failed: bool = False) -> Dict[str, Any]:
+        """
+        Process one food and build its entry for the correlations dict
+        Entries built from the fallback after a failed backend call are marked
+        with 'fallback': True, so a resumed run processes those foods again
+        """
+        try:
+            if response is None:
+                response, failed = self._call_llama(food_name, prompt)
+            correlations = self.process_food(food_name, prompt, response)
+            return self._entry(prompt, correlations, failed)
+        except Exception as e:
+            print(f"Error processing {food_name}: {e}")
+            return {
+                'prompt': prompt,
+                'correlations': [],
+                'error': str(e),
+                'processed_at': datetime.now().isoformat()
+            }
+    
+    def process_all_foods(self, max_foods: Optional[int] = None,
+                          workers: int = 1, resume: bool = False,
+                          async_mode: bool = False, batch_size: int = 1) -> Mapping[str, Any]:
+        """
+        Process all foods with Llama
+        With workers > 1 the prompts are sent to the backend from a thread pool,
+        keeping at most `workers` requests in flight at once. In async mode the
+        prompts are streamed to Ollama from an asyncio event loop instead, with
+        `workers` as the in-flight limit. With batch_size > 1 foods are sent to
+        the backend in batches of that size (batched generation with a shared
+        prefix on the llama-cpp backend). Every finished food
+        is appended to the checkpoint file straight away; with resume=True foods
+        already in the checkpoint are skipped, except those that only got the
+        fallback correlations because the backend failed and those whose
+        processing raised an error. Results are always returned in prompt-file
+        order, as a CheckpointEntries mapping read from the checkpoint.
+        """
+        if self._prompts_released:
+            self.load_prompts()
         if not self.prompts:
             print("No prompts loaded. Please check your prompts file.")
             return {}
@@ -309,64 +530,250 @@ Relevant Quote: "{quote}"
         if max_foods:
             foods_to_process = foods_to_process[:max_foods]
         
-        print(f"Processing {len(foods_to_process)} foods with Llama...")
+        if resume:
+            done = self.checkpointed_foods()
+            pending = [(food_name, prompt) for food_name, prompt in foods_to_process
+                       if food_name not in done]
+            print(f"Resuming from {self.checkpoint_file}: "
+                  f"{len(foods_to_process) - len(pending)} foods already processed")
+        else:
+            # A fresh run starts a fresh checkpoint
+            open(self.checkpoint_file, 'w').close()
+            pending = foods_to_process
         
-        all_correlations = {}
-        processed_count = 0
+        print(f"Processing {len(pending)} foods with Llama...")
         
+        if async_mode:
+            results = self._process_async(pending, workers)
+        elif batch_size > 1:
+            results = self._process_batched(pending, batch_size)
+        elif workers > 1:
+            results = self._process_concurrently(pending, workers)
+        else:
+            results = self._process_sequentially(pending)
+        
+        with open(self.checkpoint_file, 'a') as checkpoint:
+            for processed_count, (food_name, entry) in enumerate(results, 1):
+                checkpoint.write(json.dumps({'food': food_name, 'template': self.template_hash,
+                                             'data': entry}) + '\n')
+                checkpoint.flush()
+                if self.store is not None:
+                    self.store.upsert_food(food_name, entry)
+                print(f"Progress: {processed_count}/{len(pending)} foods processed")
+        
+        return self.merge_checkpoint([food_name for food_name, _ in foods_to_process])
+    
+    def _process_sequentially(self, foods_to_process: List[Tuple[str, str]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Process foods one at a time, yielding each result as soon as it is ready"""
         for food_name, prompt in foods_to_process:
+            yield food_name, self._process_entry(food_name, prompt)
+    
+    def _process_batched(self, foods_to_process: List[Tuple[str, str]],
+                         batch_size: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Process foods in batches, yielding each result once its batch is done"""
+        print(f"Using batches of {batch_size} foods")
+        for start in range(0, len(foods_to_process), batch_size):
+            batch = foods_to_process[start:start + batch_size]
+            responses = self._call_llama_batch(batch)
+            for (food_name, prompt), (response, failed) in zip(batch, responses):
+                yield food_name, self._process_entry(food_name, prompt, response, failed)
+    
+    def _process_concurrently(self, foods_to_process: List[Tuple[str, str]],
+                              workers: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Process foods on a thread pool, yielding results in completion order"""
+        print(f"Using {workers} concurrent workers")
+        
+        # The pool size is the in-flight limit, so no extra pacing is needed
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._process_entry, food_name, prompt): food_name
+                       for food_name, prompt in foods_to_process}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    
+    def _process_async(self, foods_to_process: List[Tuple[str, str]],
+                       max_in_flight: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Run the async Ollama client on a background loop, yielding results as they finish"""
+        print(f"Using async Ollama client with up to {max_in_flight} requests in flight")
+        results = queue.Queue()
+        
+        def run_loop():
             try:
-                correlations = self.process_food(food_name, prompt)
-                all_correlations[food_name] = {
-                    'prompt': prompt,
-                    'correlations': correlations,
-                    'processed_at': datetime.now().isoformat(),
-                    'total_correlations': len(correlations)
-                }
-                
-                processed_count += 1
-                print(f"Progress: {processed_count}/{len(foods_to_process)} foods processed")
-                
-                # Add a small delay between requests to avoid overwhelming the system
-                time.sleep(2)
-                
+                asyncio.run(self._run_async(foods_to_process, max_in_flight, results.put))
             except Exception as e:
-                print(f"Error processing {food_name}: {e}")
-                all_correlations[food_name] = {
-                    'prompt': prompt,
-                    'correlations': [],
-                    'error': str(e),
-                    'processed_at': datetime.now().isoformat()
-                }
-        
-        return all_correlations
-    
-    def save_correlations(self, correlations: Dict[str, Any]):
-        """Save correlations to JSON file"""
+                results.put(e)
+        
+        thread = threading.Thread(target=run_loop, daemon=True)
+        thread.start()
+        for _ in foods_to_process:
+            item = results.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        thread.join()
+    
+    async def _run_async(self, foods_to_process: List[Tuple[str, str]], max_in_flight: int,
+                         emit: Callable[[Tuple[str, Dict[str, Any]]], None]):
+        """Process every food concurrently; the client's semaphore bounds the requests"""
+        client = AsyncOllamaClient(self.ollama_config, max_in_flight)
+        
+        async def run_one(food_name: str, prompt: str):
+            emit((food_name, await self._process_entry_async(client, food_name, prompt)))
+        
+        try:
+            await asyncio.gather(*(run_one(food_name, prompt) for food_name, prompt in foods_to_process))
+        finally:
+            await client.close()
+    
+    async def _process_entry_async(self, client: AsyncOllamaClient,
+                                   food_name: str, prompt: str) -> Dict[str, Any]:
+        """Async counterpart of _process_entry"""
+        print(f"\nProcessing {food_name}...")
+        try:
+            correlations, failed = await self._stream_correlations(client, food_name, prompt)
+            print(f"Found {len(correlations)} correlations for {food_name}")
+            return self._entry(prompt, correlations, failed)
+        except Exception as e:
+            print(f"Error processing {food_name}: {e}")
+            return {
+                'prompt': prompt,
+                'correlations': [],
+                'error': str(e),
+                'processed_at': datetime.now().isoformat()
+            }
+    
+    async def _stream_correlations(self, client: AsyncOllamaClient, food_name: str,
+                                   prompt: str) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Stream one response from Ollama, parsing each section as soon as it is
+        complete; returns (correlations, failed) like _call_llama
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_cache_key(prompt, *client.cache_identity())
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return self.parse_llama_response(cached, food_name), False
+        
+        async def stream_once(timeout: float) -> Tuple[List[Dict[str, Any]], List[str]]:
+            parser = CorrelationStreamParser()
+            correlations = []
+            chunks = []
+            async for token in client.generate_stream(prompt):
+                chunks.append(token)
+                # Records come back as soon as the blank line closing their block arrives
+                correlations.extend(parser.feed(token))
+            correlations.extend(parser.close())
+            return correlations, chunks
+        
+        try:
+            correlations, chunks = await self.policy.call_async(stream_once)
+        except Exception as e:
+            print(f"Llama call failed: {e}")
+            correlations, chunks = [], []
+        
+        response = ''.join(chunks)
+        if len(response.strip()) <= 100:
+            print(f"Using fallback method for {food_name}...")
+            fallback = self._generate_comprehensive_correlations(food_name)
+            return self.parse_llama_response(fallback, food_name), True
+        
+        # Only real model output is cached, never the fallback
+        if cache_key is not None:
+            self.cache.put(cache_key, response)
+        
+        return self._finalize_correlations(correlations, food_name), False
+    
+    @staticmethod
+    def _entry(prompt: str, correlations: List[Dict[str, Any]], failed: bool) -> Dict[str, Any]:
+        entry = {
+            'prompt': prompt,
+            'correlations': correlations,
+            'processed_at': datetime.now().isoformat(),
+            'total_correlations': len(correlations)
+        }
+        if failed:
+            entry['fallback'] = True
+        return entry
+    
+    def checkpointed_foods(self) -> Set[str]:
+        """
+        Return the names of the foods already recorded in the checkpoint;
+        fallback entries from failed backend calls and entries of foods whose
+        processing raised do not count as done
+        """
+        return {food_name for food_name, (_, retry) in self._index_checkpoint().items()
+                if not retry}
+    
+    def _index_checkpoint(self) -> Dict[str, Tuple[int, bool]]:
+        """
+        Index the checkpoint file by food: the byte offset of the latest entry
+        for each food and whether it should be retried, i.e. it is a fallback
+        or error entry. Entries made from another prompt template are stale and
+        skipped, so a resumed run processes those foods again
+        """
+        index = {}
+        if not os.path.exists(self.checkpoint_file):
+            return index
+        
+        offset = 0
+        with open(self.checkpoint_file, 'rb') as f:
+            for line in f:
+                line_offset, offset = offset, offset + len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a partially written last line behind
+                    continue
+                template = record.get('template')
+                if template and self.template_hash and template != self.template_hash:
+                    continue
+                data = record['data']
+                index[record['food']] = (line_offset, bool(data.get('fallback') or 'error' in data))
+        return index
+    
+    def merge_checkpoint(self, food_names: Optional[List[str]] = None) -> CheckpointEntries:
+        """
+        Merge the checkpoint into a correlations mapping, ordered like the
+        prompts file; entries are read from the checkpoint as they are used
+        """
+        index = self._index_checkpoint()
+        if food_names is None:
+            food_names = [food_name for food_name in self.prompts if food_name in index]
+        return CheckpointEntries(self.checkpoint_file, {food_name: index[food_name][0]
+                                                        for food_name in food_names if food_name in index})
+    
+    def save_correlations(self, correlations: Mapping[str, Any]):
+        """Stream correlations to the JSON output file, one food at a time"""
         output_data = {
             'generated_at': datetime.now().isoformat(),
             'total_foods': len(correlations),
-            'correlations': correlations
+            'correlations': JSONObjectStream(correlations.items())
         }
         
-        with open(self.output_file, 'w') as f:
-            json.dump(output_data, f, indent=2)
+        write_json_stream(self.output_file, output_data, self.json_indent)
         
         print(f"Saved correlations to {self.output_file}")
     
     def create_expert_interface_data(self, correlations: Dict[str, Any]) -> Dict[str, Any]:
         """Create data structure compatible with the expert interface"""
-        interface_data = {
-            'foods': [],
+        interface_data = self._interface_data(correlations)
+        interface_data['foods'] = list(interface_data['foods'])
+        return interface_data
+    
+    def _interface_data(self, correlations: Mapping[str, Any]) -> Dict[str, Any]:
+        """Interface data whose foods are generated lazily, for streaming to disk"""
+        return {
+            'foods': self._iter_interface_foods(correlations),
             'metadata': {
                 'created_at': datetime.now().isoformat(),
                 'total_foods': len(correlations),
                 'source': 'llama_generated'
             }
         }
-        
+    
+    def _iter_interface_foods(self, correlations: Mapping[str, Any]) -> Iterator[Dict[str, Any]]:
         for i, (food_name, food_data) in enumerate(correlations.items()):
-            food_entry = {
+            yield {
                 'id': i,
                 'name': food_name,
                 'prompt': food_data['prompt'],
@@ -376,17 +783,11 @@ Relevant Quote: "{quote}"
                 'processed_at': food_data.get('processed_at', ''),
                 'total_correlations': food_data.get('total_correlations', 0)
             }
-            interface_data['foods'].append(food_entry)
-        
-        return interface_data
     
-    def save_interface_data(self, correlations: Dict[str, Any], 
+    def save_interface_data(self, correlations: Mapping[str, Any], 
                            output_file: str = "expert_interface_data.json"):
         """Save data in format compatible with the expert interface"""
-        interface_data = self.create_expert_interface_data(correlations)
-        
-        with open(output_file, 'w') as f:
-            json.dump(interface_data, f, indent=2)
+        save_interface_file(self._interface_data(correlations), output_file, indent=self.json_indent)
         
         print(f"Saved interface data to {output_file}")
         return output_file
@@ -400,7 +801,30 @@ def main():
     parser.add_argument('--max-foods', type=int, default=None,
                        help='Maximum number of foods to process (default: all)')
     parser.add_argument('--interface-output', default='expert_interface_data.json',
-                       help='Expert interface data file (default: expert_interface_data.json)')
+                       help=f'Expert interface data file; a {COMPACT_EXTENSION} suffix writes the compact format '
+                            '(default: expert_interface_data.json)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Number of foods sent to Llama concurrently (default: 1, sequential)')
+    parser.add_argument('--batch-size', type=int, default=1,
+                       help='Foods per batched generation call on the llama-cpp backend (default: 1)')
+    parser.add_argument('--async', dest='async_mode', action='store_true',
+                       help='Stream prompts to Ollama with the asyncio client; --workers sets the in-flight limit')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Always call Llama, bypassing the response cache')
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_FILE,
+                       help=f'Response cache database (default: {DEFAULT_CACHE_FILE})')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                       help='Maximum response cache size in MB before LRU eviction (default: 512)')
+    parser.add_argument('--backend', choices=BACKEND_ORDER, default=None,
+                       help='Inference backend to use (default: first enabled backend in llama_config.py)')
+    parser.add_argument('--checkpoint', default=None,
+                       help='Per-food checkpoint file (default: <output>.checkpoint.jsonl)')
+    parser.add_argument('--resume', action='store_true',
+                       help='Skip foods already recorded in the checkpoint from a previous run')
+    parser.add_argument('--store', default=None,
+                       help='Also upsert each processed food into this SQLite correlation store')
+    parser.add_argument('--compact-json', action='store_true',
+                       help='Write the JSON outputs without indentation; .gz/.zst output names compress them')
     
     args = parser.parse_args()
     
@@ -408,7 +832,14 @@ def main():
     print("=" * 60)
     
     # Initialize the integration
-    llama_integration = LlamaIntegration(args.prompts, args.output)
+    cache = None
+    if not args.no_cache:
+        cache = ResponseCache(args.cache_file, args.cache_max_mb * 1024 * 1024)
+    store = CorrelationStore(args.store) if args.store else None
+    llama_integration = LlamaIntegration(args.prompts, args.output, cache=cache,
+                                         checkpoint_file=args.checkpoint,
+                                         backend_name=args.backend, store=store,
+                                         compact_json=args.compact_json)
     
     if not llama_integration.prompts:
         print("No prompts available. Please run the analyzer first to generate prompts.")
@@ -416,7 +847,10 @@ def main():
     
     # Process foods with Llama
     print(f"\nStarting Llama processing...")
-    correlations = llama_integration.process_all_foods(args.max_foods)
+    correlations = llama_integration.process_all_foods(args.max_foods, workers=args.workers,
+                                                        resume=args.resume,
+                                                        async_mode=args.async_mode,
+                                                        batch_size=args.batch_size)
     
     if correlations:
         # Save raw correlations
@@ -440,6 +874,18 @@ def main():
         print(f"3. Have experts verify the correlations")
     else:
         print("No correlations generated. Please check your Llama setup and try again.")
+    
+    llama_integration.close()
+    
+    if store is not None:
+        print(f"\nCorrelation store {args.store}: {store.stats()}")
+        store.close()
+    
+    if cache is not None:
+        stats = cache.stats()
+        print(f"\nResponse cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['entries']} entries, {stats['bytes'] / (1024 * 1024):.1f} MB in {args.cache_file})")
+        cache.close()
 
 if __name__ == "__main__":
     main()
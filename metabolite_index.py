@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Reverse metabolite -> food index
+Maps each normalized metabolite name, and the canonical metabolite ID it
+resolves to, to the foods, correlation types and references that mention it,
+so metabolite features seen in plasma can be traced back to foods without
+scanning every correlation. The index is written next to the interface data
+whenever it is saved, as <name>.metabolite_index.json.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Any, Iterable, NamedTuple, Optional, Tuple
+
+from json_stream import strip_compression_suffix
+from metabolite_normalizer import default_normalizer, name_variants, normalize_metabolite_name
+
+INDEX_SUFFIX = ".metabolite_index.json"
+# Version 1 indexes also posted fuzzy canonical IDs and are rebuilt
+INDEX_VERSION = 2
+
+def index_keys(name: str) -> List[str]:
+    """
+    Keys a metabolite is indexed under: its normalized name variants and, if
+    the name is an exact or synonym match of a known metabolite, that
+    metabolite's canonical ID (a fuzzy guess would post it under another one)
+    """
+    keys = name_variants(name)
+    canonical_id = default_normalizer().normalize(name).exact_id
+    if canonical_id is not None and canonical_id not in keys:
+        keys.append(canonical_id)
+    return keys
+
+class FoodLink(NamedTuple):
+    food: str
+    correlation_type: str
+    reference: str
+    metabolite: str
+
+def index_path_for(interface_file: str) -> str:
+    return os.path.splitext(strip_compression_suffix(interface_file))[0] + INDEX_SUFFIX
+
+class MetaboliteIndex:
+    """
+    Inverted index stored as string tables plus postings
+    Each posting is [food, correlation type, reference, metabolite name], every
+    element an index into the matching table.
+    """
+
+    def __init__(self, foods: List[str], correlation_types: List[str], references: List[str],
+                 metabolites: List[str], postings: Dict[str, List[List[int]]]):
+        self.foods = foods
+        self.correlation_types = correlation_types
+        self.references = references
+        self.metabolites = metabolites
+        self.postings = postings
+        self._decoded: Dict[Tuple[str, Optional[str]], Tuple[FoodLink, ...]] = {}
+
+    @classmethod
+    def build(cls, data: Dict[str, Any]) -> "MetaboliteIndex":
+        """Build the index from interface data ({'foods': [...]})"""
+        builder = MetaboliteIndexBuilder()
+        for food in data.get("foods", []):
+            builder.add_food(food)
+        return builder.finish()
+
+    def save(self, index_file: str):
+        with open(index_file, 'w') as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "foods": self.foods,
+                "correlation_types": self.correlation_types,
+                "references": self.references,
+                "metabolites": self.metabolites,
+                "postings": self.postings
+            }, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, index_file: str) -> "MetaboliteIndex":
+        with open(index_file, 'r') as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported metabolite index version: {data.get('version')}")
+        return cls(data["foods"], data["correlation_types"], data["references"],
+                   data["metabolites"], data["postings"])
+
+    def lookup(self, metabolite: str, correlation_type: Optional[str] = None) -> Tuple[FoodLink, ...]:
+        """Return the (food, correlation type, reference) links for a metabolite name"""
+        key = (normalize_metabolite_name(metabolite), correlation_type)
+        links = self._decoded.get(key)
+        if links is None:
+            postings = self.postings.get(key[0])
+            if postings is None:
+                # Synonyms are found through the canonical metabolite ID
+                canonical_id = default_normalizer().normalize(metabolite).exact_id
+                postings = self.postings.get(canonical_id, ()) if canonical_id else ()
+            # Postings are decoded once per key and type, so repeated queries are dict lookups
+            links = self._decoded[key] = tuple(
+                FoodLink(self.foods[food_id], self.correlation_types[type_id],
+                         self.references[reference_id], self.metabolites[metabolite_id])
+                for food_id, type_id, reference_id, metabolite_id in postings
+                if correlation_type is None or self.correlation_types[type_id] == correlation_type)
+        return links
+
+    def lookup_many(self, metabolites: Iterable[str],
+                    correlation_type: Optional[str] = None) -> Dict[str, Tuple[FoodLink, ...]]:
+        """Answer a batch of metabolite queries"""
+        return {metabolite: self.lookup(metabolite, correlation_type) for metabolite in metabolites}
+
+    def foods_for(self, metabolite: str, correlation_type: Optional[str] = None) -> List[str]:
+        """Distinct foods linked to a metabolite, in interface order"""
+        return list(dict.fromkeys(link.food for link in self.lookup(metabolite, correlation_type)))
+
+class MetaboliteIndexBuilder:
+    """Builds a MetaboliteIndex one food at a time, e.g. while the foods are streamed to disk"""
+
+    def __init__(self):
+        self._tables = {"foods": {}, "correlation_types": {}, "references": {}, "metabolites": {}}
+        self._postings: Dict[str, List[List[int]]] = {}
+        self._keys_by_name: Dict[str, List[str]] = {}
+
+    def _intern(self, table: str, value: Any) -> int:
+        ids = self._tables[table]
+        value = "" if value is None else str(value)
+        if value not in ids:
+            ids[value] = len(ids)
+        return ids[value]
+
+    def add_food(self, food: Dict[str, Any]):
+        food_id = self._intern("foods", food.get("name"))
+        for correlation in food.get("correlations", []):
+            name = correlation.get("metabolite")
+            if not name:
+                continue
+            posting = [food_id,
+                       self._intern("correlation_types", correlation.get("correlationType")),
+                       self._intern("references", correlation.get("reference")),
+                       self._intern("metabolites", name)]
+            if name not in self._keys_by_name:
+                self._keys_by_name[name] = index_keys(name)
+            for key in self._keys_by_name[name]:
+                self._postings.setdefault(key, []).append(posting)
+
+    def finish(self) -> MetaboliteIndex:
+        return MetaboliteIndex(*(list(self._tables[table]) for table in ("foods", "correlation_types",
+                                                                         "references", "metabolites")),
+                               self._postings)
+
+def write_index(data: Dict[str, Any], interface_file: str) -> str:
+    """Build and save the index for interface data saved to interface_file"""
+    index_file = index_path_for(interface_file)
+    MetaboliteIndex.build(data).save(index_file)
+    return index_file
+
+def load_index(interface_file: str) -> MetaboliteIndex:
+    """Load the index of an interface data file, rebuilding it if it is missing or stale"""
+    index_file = index_path_for(interface_file)
+    if os.path.exists(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(interface_file):
+        try:
+            return MetaboliteIndex.load(index_file)
+        except ValueError:
+            pass  # Written by an older version, rebuilt below
+
+    # Imported here because interface_store builds this index when it saves
+    from interface_store import load_interface_file
+    data = load_interface_file(interface_file)
+    index = MetaboliteIndex.build(data)
+    index.save(index_file)
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description='Look up the foods linked to metabolites')
+    parser.add_argument('metabolites', nargs='*', help='Metabolite names to look up')
+    parser.add_argument('--data', default='expert_interface_data.json',
+                       help='Interface data file the index belongs to (default: expert_interface_data.json)')
+    parser.add_argument('--queries', help="File with one metabolite per line ('-' for stdin)")
+    parser.add_argument('--type', dest='correlation_type', help='Only this correlation type, e.g. Positive')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    args = parser.parse_args()
+
+    index = load_index(args.data)
+    queries = list(args.metabolites)
+    if args.queries:
+        with (sys.stdin if args.queries == '-' else open(args.queries, 'r')) as f:
+            queries.extend(line.strip() for line in f if line.strip())
+
+    start = time.perf_counter()
+    results = index.lookup_many(queries, args.correlation_type)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        json.dump({metabolite: [link._asdict() for link in links]
+                   for metabolite, links in results.items()}, sys.stdout, indent=2)
+        print()
+    else:
+        for metabolite, records in results.items():
+            for link in records:
+                print(f"{metabolite}\t{link.food}\t{link.correlation_type}\t{link.reference}")
+    print(f"{len(queries)} queries answered in {elapsed * 1000:.2f} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Metabolite name normalization
+Maps free-text metabolite names from different sources ("Vitamin C (Ascorbic
+Acid)", "ascorbate", "L-ascorbic acid", ...) to canonical metabolite IDs. A
+name is resolved by an exact match on the normalized name or one of its
+synonyms first, and otherwise by trigram similarity against every known name
+that carries the same distinguishing tokens (vitamin letters and numbers,
+isomer prefixes, lipoprotein classes), so "Vitamin K2" or "VLDL cholesterol"
+are never guessed as K1 or LDL cholesterol. Results are memoized, so batches
+with many repeated feature names stay cheap.
+"""
+
+import argparse
+import re
+import sys
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Iterable, NamedTuple, Optional, Set, Tuple
+
+_GREEK_LETTERS = {"α": "alpha", "β": "beta", "γ": "gamma", "δ": "delta", "ω": "omega"}
+_GREEK = re.compile("|".join(_GREEK_LETTERS))
+_NON_WORD = re.compile(r"[\W_]+")
+_PARENTHETICAL = re.compile(r"^(.*?)\s*\(([^()]*)\)\s*$")
+
+DEFAULT_MIN_SCORE = 0.85
+
+# Tokens that tell otherwise similar names apart; a fuzzy match must agree on them
+_ISOMER_PREFIXES = {"alpha", "beta", "gamma", "delta", "epsilon", "omega", "cis", "trans"}
+_LIPOPROTEIN_CLASSES = {"ldl", "hdl", "vldl", "idl"}
+
+# Marker groups used by the fallback generators that are not in METABOLITE_CATEGORIES
+ADDITIONAL_METABOLITES = [
+    "Oxidative stress markers", "Inflammatory cytokines", "Antioxidant capacity",
+    "Minerals (Potassium, Magnesium)", "Fiber metabolites", "Phytochemicals",
+    "Carotenoids", "Tocopherols", "Blood pressure markers", "Glucose metabolism markers",
+    "Homocysteine", "Uric acid", "Insulin resistance markers", "Endothelial dysfunction markers",
+    "Pro-inflammatory markers", "Oxidative DNA damage", "Lipid peroxidation",
+    "Nitric oxide inhibitors", "Adipokine imbalance", "Cellular stress markers",
+    "Metabolic endotoxemia"
+]
+
+# Canonical name -> other names the same metabolite goes by
+SYNONYMS = {
+    "Vitamin C (Ascorbic Acid)": ["Ascorbate", "L-ascorbic acid"],
+    "Vitamin E (Alpha-tocopherol)": ["Tocopherol, alpha", "RRR-alpha-tocopherol"],
+    "Vitamin K1 (Phylloquinone)": ["Phytonadione"],
+    "Vitamin A (Retinol)": ["All-trans-retinol"],
+    "Vitamin D (Cholecalciferol)": ["Vitamin D3"],
+    "Vitamin B12 (Cobalamin)": ["Cyanocobalamin", "Methylcobalamin"],
+    "Folate (Vitamin B9)": ["Folic acid", "5-Methyltetrahydrofolate", "5-MTHF"],
+    "Omega-3 (EPA)": ["Eicosapentaenoic acid", "20:5n3"],
+    "Omega-3 (DHA)": ["Docosahexaenoic acid", "22:6n3"],
+    "Omega-3 (ALA)": ["Alpha-linolenic acid", "18:3n3"],
+    "Omega-6 (LA)": ["Linoleic acid", "18:2n6"],
+    "Omega-6 (GLA)": ["Gamma-linolenic acid", "18:3n6"],
+    "Omega-6 (AA)": ["Arachidonic acid", "20:4n6"],
+    "Omega-9 (Oleic Acid)": ["Oleate", "18:1n9"],
+    "Palmitic Acid": ["Hexadecanoic acid", "Palmitate", "16:0"],
+    "Stearic Acid": ["Octadecanoic acid", "Stearate", "18:0"],
+    "Coenzyme Q10": ["Ubiquinone", "CoQ10"],
+    "Glutathione": ["GSH"],
+    "LDL Cholesterol": ["LDL-C", "Low-density lipoprotein cholesterol"],
+    "HDL Cholesterol": ["HDL-C", "High-density lipoprotein cholesterol"],
+    "Triglycerides": ["TG", "Triacylglycerols"],
+    "Free Fatty Acids": ["FFA", "Non-esterified fatty acids", "NEFA"],
+    "HbA1c": ["Glycated hemoglobin", "Hemoglobin A1c"],
+    "Fasting Glucose": ["Glucose, fasting", "FPG"],
+    "Uric acid": ["Urate"],
+    "Homocysteine": ["Hcy", "Total homocysteine"],
+    "Malondialdehyde (MDA)": ["Malonaldehyde"],
+    "Tumor Necrosis Factor-alpha (TNF-α)": ["TNF", "Cachectin"],
+    "Advanced glycation end products (AGEs)": ["Glycotoxins"],
+    "Curcumin": ["Diferuloylmethane"],
+    "Sulforaphane": ["SFN"],
+    "Resveratrol": ["Trans-resveratrol"],
+}
+
+# Class names that cover several metabolites or vitamers; like "Omega-3" they
+# resolve to no canonical ID instead of being folded into one member
+AMBIGUOUS_NAMES = ["Vitamin K", "Provitamin A"]
+
+def normalize_metabolite_name(name: str) -> str:
+    """
+    Case-fold the name, spell out Greek letters and reduce punctuation and
+    whitespace runs to single spaces
+    """
+    name = unicodedata.normalize("NFKC", name).casefold()
+    name = _GREEK.sub(lambda match: f" {_GREEK_LETTERS[match.group(0)]} ", name)
+    return _NON_WORD.sub(" ", name).strip()
+
+def name_variants(name: str) -> List[str]:
+    """
+    Normalized forms of a name: the full name, and for names such as
+    "Vitamin C (Ascorbic Acid)" also the part outside and inside the parentheses
+    """
+    variants = [normalize_metabolite_name(name)]
+    match = _PARENTHETICAL.match(name)
+    if match:
+        for part in match.groups():
+            variant = normalize_metabolite_name(part)
+            if variant and variant not in variants:
+                variants.append(variant)
+    return [variant for variant in variants if variant]
+
+def canonical_id_for(name: str) -> str:
+    """Stable ID derived from the canonical name, e.g. 'vitamin_c_ascorbic_acid'"""
+    return normalize_metabolite_name(name).replace(" ", "_")
+
+def distinguishing_tokens(text: str) -> str:
+    """
+    Digits, single letters, isomer prefixes and lipoprotein classes of a
+    normalized name, in order and run together so "q 10" and "q10" agree
+    """
+    return "".join(token for token in text.split()
+                   if len(token) == 1 or any(char.isdigit() for char in token)
+                   or token in _ISOMER_PREFIXES or token in _LIPOPROTEIN_CLASSES)
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class MetaboliteMatch(NamedTuple):
+    query: str
+    canonical_id: Optional[str]
+    canonical_name: Optional[str]
+    score: float
+    method: str  # 'exact', 'synonym', 'fuzzy', 'ambiguous' or 'none'
+
+    @property
+    def exact_id(self) -> Optional[str]:
+        """Canonical ID of an exact or synonym match; None for fuzzy guesses"""
+        return self.canonical_id if self.method in ("exact", "synonym") else None
+
+class MetaboliteNormalizer:
+    def __init__(self, canonical_names: Optional[Iterable[str]] = None,
+                 synonyms: Optional[Dict[str, List[str]]] = None,
+                 min_score: float = DEFAULT_MIN_SCORE, cache_size: int = 65536):
+        if canonical_names is None:
+            # The generator saves through interface_store, which indexes with
+            # this module, so its vocabulary is imported only when needed
+            from generate_comprehensive_correlations import METABOLITE_CATEGORIES
+            canonical_names = [name for names in METABOLITE_CATEGORIES.values() for name in names]
+            canonical_names += ADDITIONAL_METABOLITES
+        synonyms = SYNONYMS if synonyms is None else synonyms
+        self.min_score = min_score
+        self.names: Dict[str, str] = {}  # canonical ID -> canonical name
+
+        # Normalized name -> (canonical ID, method); a variant shared by several
+        # metabolites (e.g. "omega 3" for EPA, DHA and ALA) is ambiguous and dropped
+        candidates: Dict[str, Set[Tuple[str, str]]] = {}
+        for name in canonical_names:
+            canonical_id = canonical_id_for(name)
+            self.names.setdefault(canonical_id, name)
+            for i, variant in enumerate(name_variants(name)):
+                candidates.setdefault(variant, set()).add((canonical_id, "exact" if i == 0 else "synonym"))
+        for name, others in synonyms.items():
+            canonical_id = canonical_id_for(name)
+            if canonical_id not in self.names:
+                continue
+            for other in others:
+                for variant in name_variants(other):
+                    candidates.setdefault(variant, set()).add((canonical_id, "synonym"))
+
+        self.keys: Dict[str, Tuple[str, str]] = {}
+        self.ambiguous: Set[str] = set()
+        for variant, matches in candidates.items():
+            exact = {match for match in matches if match[1] == "exact"}
+            matches = exact or matches
+            if len({canonical_id for canonical_id, _ in matches}) == 1:
+                self.keys[variant] = min(matches)
+            else:
+                self.ambiguous.add(variant)
+        for name in AMBIGUOUS_NAMES:
+            variant = normalize_metabolite_name(name)
+            if variant not in self.keys or self.keys[variant][1] != "exact":
+                self.keys.pop(variant, None)
+                self.ambiguous.add(variant)
+
+        # Trigram postings over every unambiguous key, for fuzzy matching
+        self._key_list = list(self.keys)
+        self._key_trigram_counts = [len(trigrams(key)) for key in self._key_list]
+        self._key_tokens = [distinguishing_tokens(key) for key in self._key_list]
+        self._trigram_index: Dict[str, List[int]] = {}
+        for key_id, key in enumerate(self._key_list):
+            for trigram in trigrams(key):
+                self._trigram_index.setdefault(trigram, []).append(key_id)
+
+        self._normalize_cached = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def normalize(self, name: str) -> MetaboliteMatch:
+        """Map a free-text metabolite name to its canonical ID"""
+        return self._normalize_cached(name)
+
+    def normalize_many(self, names: Iterable[str]) -> List[MetaboliteMatch]:
+        """Normalize a batch of names; repeated names are resolved once"""
+        normalize = self._normalize_cached
+        return [normalize(name) for name in names]
+
+    def cache_info(self):
+        return self._normalize_cached.cache_info()
+
+    def _normalize(self, name: str) -> MetaboliteMatch:
+        variants = name_variants(name)
+        for variant in variants:
+            if variant in self.keys:
+                canonical_id, method = self.keys[variant]
+                return MetaboliteMatch(name, canonical_id, self.names[canonical_id], 1.0, method)
+        if variants and variants[0] in self.ambiguous:
+            # A group name such as "Omega-3" must not be guessed as one of its members
+            return MetaboliteMatch(name, None, None, 0.0, "ambiguous")
+
+        best_key, best_score = None, 0.0
+        for variant in variants:
+            key_id, score = self._best_trigram_match(variant)
+            if score > best_score:
+                best_key, best_score = key_id, score
+        if best_key is None or best_score < self.min_score:
+            return MetaboliteMatch(name, None, None, round(best_score, 3), "none")
+
+        canonical_id, _ = self.keys[self._key_list[best_key]]
+        return MetaboliteMatch(name, canonical_id, self.names[canonical_id], round(best_score, 3), "fuzzy")
+
+    def _best_trigram_match(self, text: str) -> Tuple[Optional[int], float]:
+        """
+        Key with the highest Dice coefficient over shared trigrams among the
+        keys with the same distinguishing tokens as the text
+        """
+        query = trigrams(text)
+        tokens = distinguishing_tokens(text)
+        shared = Counter()
+        for trigram in query:
+            shared.update(self._trigram_index.get(trigram, ()))
+        best_key, best_score = None, 0.0
+        for key_id, count in shared.items():
+            if self._key_tokens[key_id] != tokens:
+                continue
+            score = 2 * count / (len(query) + self._key_trigram_counts[key_id])
+            if score > best_score or (score == best_score and best_key is not None and key_id < best_key):
+                best_key, best_score = key_id, score
+        return best_key, best_score
+
+_default_normalizer: Optional[MetaboliteNormalizer] = None
+
+def default_normalizer() -> MetaboliteNormalizer:
+    """Shared normalizer over the built-in vocabulary, built on first use"""
+    global _default_normalizer
+    if _default_normalizer is None:
+        _default_normalizer = MetaboliteNormalizer()
+    return _default_normalizer
+
+def main():
+    parser = argparse.ArgumentParser(description='Map metabolite names to canonical metabolite IDs')
+    parser.add_argument('names', nargs='*', help='Metabolite names to normalize')
+    parser.add_argument('--input', help="File with one name per line ('-' for stdin)")
+    parser.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE,
+                       help=f'Minimum trigram similarity for a fuzzy match (default: {DEFAULT_MIN_SCORE})')
+
+    args = parser.parse_args()
+
+    names = list(args.names)
+    if args.input:
+        with (sys.stdin if args.input == '-' else open(args.input, 'r')) as f:
+            names.extend(line.rstrip('\n') for line in f if line.strip())
+
+    normalizer = MetaboliteNormalizer(min_score=args.min_score)
+    print("query\tcanonical_id\tcanonical_name\tscore\tmethod")
+    for match in normalizer.normalize_many(names):
+        print(f"{match.query}\t{match.canonical_id or ''}\t{match.canonical_name or ''}\t"
+              f"{match.score}\t{match.method}")
+
+    matched = sum(1 for match in normalizer.normalize_many(names) if match.canonical_id)
+    print(f"{matched}/{len(names)} names matched", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
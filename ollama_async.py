@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Asyncio client for the Ollama /api/generate endpoint
+Keeps a small pool of keep-alive HTTP/1.1 connections to base_url, limits the
+number of requests in flight with a semaphore, and yields streamed tokens as
+soon as Ollama sends them
+"""
+
+import asyncio
+import json
+import ssl
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from llama_backends import BackendError, BackendOverloaded
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+class AsyncOllamaClient:
+    def __init__(self, config: Dict[str, Any], max_in_flight: int = 4):
+        url = urlsplit(config.get("base_url", "http://localhost:11434"))
+        self.host = url.hostname or "localhost"
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.use_ssl = url.scheme == "https"
+        self.model = config.get("model", "llama2")
+        self.temperature = config.get("temperature", 0.7)
+        self.max_tokens = config.get("max_tokens", 2048)
+        self.timeout = config.get("timeout", 300)
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._idle: List[Connection] = []
+
+    @property
+    def model_id(self) -> str:
+        """Identifier of the model, matching OllamaBackend so cache entries are shared"""
+        return f"ollama:{self.model}"
+
+    def cache_identity(self) -> Tuple[str, float, int]:
+        """Return the (model, temperature, max_tokens) triple that shapes a response"""
+        return self.model_id, self.temperature, self.max_tokens
+
+    async def _acquire(self) -> Tuple[Connection, bool]:
+        """Reuse an idle keep-alive connection or open a new one"""
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+            writer.close()
+        ssl_context = ssl.create_default_context() if self.use_ssl else None
+        connection = await asyncio.open_connection(self.host, self.port, ssl=ssl_context)
+        return connection, False
+
+    def _release(self, connection: Connection, reusable: bool):
+        reader, writer = connection
+        if reusable and not writer.is_closing():
+            self._idle.append(connection)
+        else:
+            writer.close()
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """Send one prompt and yield the response tokens as they are generated"""
+        body = json.dumps({
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {
+                "temperature": self.temperature,
+                "num_predict": self.max_tokens
+            }
+        }).encode("utf-8")
+        request = (f"POST /api/generate HTTP/1.1\r\n"
+                   f"Host: {self.host}:{self.port}\r\n"
+                   f"Content-Type: application/json\r\n"
+                   f"Content-Length: {len(body)}\r\n"
+                   f"Connection: keep-alive\r\n\r\n").encode("ascii") + body
+
+        async with self._semaphore:
+            connection, reused = await self._acquire()
+            reader, writer = connection
+            try:
+                writer.write(request)
+                await writer.drain()
+                try:
+                    status, headers = await asyncio.wait_for(self._read_head(reader), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    if not reused:
+                        raise
+                    # The server closed an idle keep-alive connection; retry on a fresh one
+                    writer.close()
+                    connection, _ = await self._acquire()
+                    reader, writer = connection
+                    writer.write(request)
+                    await writer.drain()
+                    status, headers = await asyncio.wait_for(self._read_head(reader), self.timeout)
+
+                if status in (429, 503):
+                    retry_after = headers.get("retry-after", "")
+                    raise BackendOverloaded(f"Ollama is overloaded (HTTP {status})",
+                                            float(retry_after) if retry_after.isdigit() else None)
+                if status != 200:
+                    detail = b"".join([chunk async for chunk in self._read_body(reader, headers)])
+                    raise BackendError(f"Ollama returned HTTP {status}: {detail.decode('utf-8', 'replace')[:200]}")
+
+                pending = b""
+                async for chunk in self._read_body(reader, headers):
+                    pending += chunk
+                    *lines, pending = pending.split(b"\n")
+                    for line in lines:
+                        token = self._decode_line(line)
+                        if token:
+                            yield token
+                token = self._decode_line(pending)
+                if token:
+                    yield token
+            except BaseException:
+                self._release(connection, False)
+                raise
+            self._release(connection, headers.get("connection", "").lower() != "close")
+
+    async def _read_head(self, reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str]]:
+        """Read the status line and headers of a response"""
+        status_line = await reader.readuntil(b"\r\n")
+        parts = status_line.decode("latin-1").split(" ", 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise BackendError(f"Malformed HTTP status line: {status_line!r}")
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return int(parts[1]), headers
+
+    async def _read_body(self, reader: asyncio.StreamReader,
+                         headers: Dict[str, str]) -> AsyncIterator[bytes]:
+        """Yield body bytes, decoding chunked transfer encoding when used"""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await asyncio.wait_for(reader.readuntil(b"\r\n"), self.timeout)
+                size = int(size_line.split(b";")[0], 16)
+                if size == 0:
+                    # Skip optional trailers up to the final blank line
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    return
+                chunk = await asyncio.wait_for(reader.readexactly(size + 2), self.timeout)
+                yield chunk[:-2]
+        elif "content-length" in headers:
+            remaining = int(headers["content-length"])
+            while remaining > 0:
+                chunk = await asyncio.wait_for(reader.read(min(remaining, 65536)), self.timeout)
+                if not chunk:
+                    raise BackendError("Connection closed before the response was complete")
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            headers["connection"] = "close"
+            while True:
+                chunk = await asyncio.wait_for(reader.read(65536), self.timeout)
+                if not chunk:
+                    return
+                yield chunk
+
+    @staticmethod
+    def _decode_line(line: bytes) -> Optional[str]:
+        """Extract the token text from one NDJSON line of the stream"""
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BackendError(f"Malformed Ollama stream line: {line[:200]!r}") from e
+        if "error" in message:
+            raise BackendError(f"Ollama error: {message['error']}")
+        return message.get("response", "")
+
+    async def close(self):
+        """Close every pooled connection"""
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
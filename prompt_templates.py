@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Prompt templates for the Llama correlation search
+Templates are plain text files in prompts/ with {field} placeholders
+(the food prompt uses {food}). A template is read and split into its literal
+text and placeholders once, and each rendered prompt is cached per (template
+hash, food), so generating the prompts file, the interface data and the sample
+prompt renders every prompt a single time. The template hash is recorded in
+llama_prompts.json, so later steps can tell that prompts changed without
+comparing their text.
+"""
+
+import argparse
+import hashlib
+import os
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+DEFAULT_TEMPLATE = "food_metabolite_correlations"
+TEMPLATE_SUFFIX = ".txt"
+
+class PromptTemplate:
+    """A template split into (literal text, field) parts, ready to render"""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.hash = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, format_spec, conversion in Formatter().parse(text):
+            if field is not None and (not field.isidentifier() or format_spec or conversion):
+                raise ValueError(f"Template {name}: unsupported placeholder {{{field}}}; "
+                                 f"use {{name}}, and {{{{ }}}} for literal braces")
+            self._parts.append((literal, field))
+        self.fields = sorted({field for _, field in self._parts if field is not None})
+
+    @property
+    def version(self) -> str:
+        return f"{self.name}@{self.hash}"
+
+    def render(self, **values: str) -> str:
+        missing = [field for field in self.fields if field not in values]
+        if missing:
+            raise KeyError(f"Template {self.name} needs {', '.join(missing)}")
+        return "".join(literal + (str(values[field]) if field is not None else "")
+                       for literal, field in self._parts)
+
+    def metadata(self) -> Dict[str, str]:
+        """What llama_prompts.json records about the template"""
+        return {"name": self.name, "hash": self.hash}
+
+def template_path_for(name: str, template_dir: str = TEMPLATE_DIR) -> str:
+    """A template name resolves to <template_dir>/<name>.txt; a path is used as is"""
+    if os.sep in name or name.endswith(TEMPLATE_SUFFIX):
+        return name
+    return os.path.join(template_dir, name + TEMPLATE_SUFFIX)
+
+def load_template(name: str = DEFAULT_TEMPLATE, template_dir: str = TEMPLATE_DIR) -> PromptTemplate:
+    with open(template_path_for(name, template_dir), 'r', encoding='utf-8') as f:
+        text = f.read()
+    # The newline that ends the file is not part of the prompt
+    if text.endswith("\n"):
+        text = text[:-1]
+    return PromptTemplate(os.path.splitext(os.path.basename(name))[0], text)
+
+class PromptCache:
+    """Rendered food prompts, keyed by (template hash, food)"""
+
+    def __init__(self):
+        self._prompts: Dict[Tuple[str, str], str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def food_prompt(self, template: PromptTemplate, food: str) -> str:
+        key = (template.hash, food)
+        prompt = self._prompts.get(key)
+        if prompt is None:
+            self.misses += 1
+            prompt = self._prompts[key] = template.render(food=food)
+        else:
+            self.hits += 1
+        return prompt
+
+    def clear(self):
+        self._prompts.clear()
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a prompt template for one food')
+    parser.add_argument('food', help='Food to render the prompt for')
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE,
+                       help=f'Template name in prompts/ or a template file (default: {DEFAULT_TEMPLATE})')
+
+    args = parser.parse_args()
+
+    template = load_template(args.template)
+    print(template.render(food=args.food))
+    print(f"\n[{template.version}]")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Persistent response cache for Llama calls
+Responses are stored in a small SQLite database keyed by a hash of the prompt
+and the generation settings, and evicted least-recently-used once the cache
+grows past its size limit
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+DEFAULT_CACHE_FILE = ".llama_cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+def make_cache_key(prompt: str, model_path: str, temperature: float, max_tokens: int) -> str:
+    """Build the content-addressed key for a prompt and its generation settings"""
+    payload = json.dumps([prompt, model_path, temperature, max_tokens])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    def __init__(self, cache_file: str = DEFAULT_CACHE_FILE,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_file = cache_file
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # One connection is shared by the worker threads, so access is serialized
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access "
+                           "ON responses (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for a key, or None on a miss"""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?",
+                               (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """Store a response and evict the least recently used entries if needed"""
+        size = len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, response, size, last_access) "
+                               "VALUES (?, ?, ?, ?)", (key, response, size, time.time()))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop the oldest entries until the cache fits within max_bytes"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute("SELECT key, size FROM responses "
+                                  "ORDER BY last_access, rowid").fetchall()
+        for key, size in rows:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current cache size"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': entries,
+            'bytes': total
+        }
+
+    def close(self):
+        """Close the underlying database"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Incremental parser for Llama correlation responses
+Accepts the response in arbitrary chunks (single tokens, lines or the whole
+text), keeps only the current partial line and the record being built, and
+hands back each correlation as soon as the blank line closing its block
+arrives
+"""
+
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+# Line prefix -> correlation field, in the order the prompt asks for them
+FIELD_PREFIXES = (
+    ('Reference:', 'reference'),
+    ('Metabolite:', 'metabolite'),
+    ('Correlation Type:', 'correlationType'),
+    ('Finding Description:', 'finding'),
+    ('Relevant Quote:', 'relevantQuote'),
+)
+
+REQUIRED_FIELDS = ('reference', 'metabolite', 'correlationType')
+
+class CorrelationStreamParser:
+    """
+    Line-oriented state machine over a streamed response
+    The parser is either between blocks or inside one; a labelled line adds a
+    field to the open block and a blank line closes it. Closed blocks that
+    carry the required fields are returned as correlation records.
+    """
+
+    def __init__(self):
+        self._partial_line = ''
+        self._record: Dict[str, Any] = {}
+        self._in_block = False
+        self.records_parsed = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Consume the next chunk and return the records it completed"""
+        completed = []
+        end = chunk.find('\n')
+        if end == -1:
+            self._partial_line += chunk
+            return completed
+
+        # The first line continues whatever was left over from the last chunk
+        record = self._feed_line(self._partial_line + chunk[:end])
+        if record is not None:
+            completed.append(record)
+        start = end + 1
+
+        while True:
+            end = chunk.find('\n', start)
+            if end == -1:
+                break
+            record = self._feed_line(chunk[start:end])
+            if record is not None:
+                completed.append(record)
+            start = end + 1
+
+        self._partial_line = chunk[start:]
+        return completed
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Flush the last line and block once the response has ended"""
+        completed = []
+        if self._partial_line:
+            record = self._feed_line(self._partial_line)
+            self._partial_line = ''
+            if record is not None:
+                completed.append(record)
+        record = self._close_block()
+        if record is not None:
+            completed.append(record)
+        return completed
+
+    def _feed_line(self, line: str) -> Optional[Dict[str, Any]]:
+        line = line.strip()
+        if not line:
+            return self._close_block()
+
+        self._in_block = True
+        for prefix, field in FIELD_PREFIXES:
+            if line.startswith(prefix):
+                self._record[field] = line[len(prefix):].strip()
+                break
+        return None
+
+    def _close_block(self) -> Optional[Dict[str, Any]]:
+        if not self._in_block:
+            return None
+
+        record, self._record, self._in_block = self._record, {}, False
+        # Only keep blocks that have the essential fields
+        if not all(field in record for field in REQUIRED_FIELDS):
+            return None
+
+        record['verified'] = None  # Not yet verified by expert
+        record['expertNotes'] = ""
+        self.records_parsed += 1
+        return record
+
+def iter_correlations(chunks: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Yield correlation records from an iterable of response chunks"""
+    parser = CorrelationStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+def parse_correlations(response: str) -> List[Dict[str, Any]]:
+    """Parse a complete response in one pass"""
+    parser = CorrelationStreamParser()
+    return parser.feed(response) + parser.close()
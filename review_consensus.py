@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Consensus of several expert reviews
+Merges the review exports of any number of experts (verified_correlations.json,
+all_correlations.json or any interface data file) and, optionally, the
+correlation store the review server writes to, into one consensus dataset.
+Every input is read once, food by food, and each correlation's votes are
+tallied under its (food, metabolite, reference) key, so the work grows linearly
+with reviewers and correlations instead of comparing files pair by pair. The
+merge reports the correlations experts disagree on, plus agreement statistics
+(observed agreement and Fleiss' kappa over verified/rejected votes).
+"""
+
+import argparse
+import csv
+import os
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+from correlation_store import CorrelationStore
+from interface_store import STORE_EXTENSIONS, is_compact_path, load_interface_file, save_interface_file
+from json_index import IndexedJSON
+from json_stream import compression_for
+
+CorrelationKey = Tuple[str, str, str]
+
+def iter_review_foods(review_file: str) -> Iterator[Dict[str, Any]]:
+    """Yield the foods of a review export or correlation store one at a time"""
+    if review_file.endswith(STORE_EXTENSIONS):
+        store = CorrelationStore(review_file)
+        try:
+            yield from store.iter_foods()
+        finally:
+            store.close()
+    elif compression_for(review_file) is None and not is_compact_path(review_file):
+        # Foods are parsed one by one from their byte offsets
+        with IndexedJSON(review_file) as data:
+            if "foods" not in data:
+                raise ValueError(f"{review_file} has no 'foods' list")
+            yield from data["foods"]
+    else:
+        yield from load_interface_file(review_file).get("foods", [])
+
+def reviewer_name(review_file: str) -> str:
+    name = os.path.basename(review_file)
+    while os.path.splitext(name)[1]:
+        name = os.path.splitext(name)[0]
+    return name
+
+class _Tally:
+    """Votes on one correlation, plus the first record seen for it"""
+    __slots__ = ("record", "verified", "rejected", "pending", "notes")
+
+    def __init__(self, record: Dict[str, Any]):
+        self.record = record
+        self.verified: List[int] = []   # reviewer indexes
+        self.rejected: List[int] = []
+        self.pending = 0
+        self.notes: List[Tuple[int, str]] = []
+
+class ReviewConsensus:
+    """
+    Tallies review votes per (food, metabolite, reference)
+    A reviewer's vote is the correlation's verified value: True, False or None
+    (pending). With missing_as_rejected, a reviewer whose export lacks a
+    correlation someone else verified counts as rejecting it, which is how
+    verified-only exports record a rejection.
+    """
+
+    def __init__(self, missing_as_rejected: bool = False):
+        self.missing_as_rejected = missing_as_rejected
+        self.reviewers: List[str] = []
+        self.foods: Dict[str, Dict[Tuple[str, str], _Tally]] = {}
+
+    def add_review(self, review_file: str, name: Optional[str] = None):
+        reviewer = len(self.reviewers)
+        name = name or reviewer_name(review_file)
+        # Exports downloaded by different experts often share a file name
+        if name in self.reviewers:
+            name = f"{name}#{reviewer + 1}"
+        self.reviewers.append(name)
+        for food in iter_review_foods(review_file):
+            self.add_food(reviewer, food)
+
+    def add_food(self, reviewer: int, food: Dict[str, Any]):
+        correlations = self.foods.setdefault(food.get("name"), {})
+        seen = set()
+        for correlation in food.get("correlations") or []:
+            key = (correlation.get("metabolite"), correlation.get("reference"))
+            # A reviewer votes once per correlation, even if it is listed twice
+            if key in seen:
+                continue
+            seen.add(key)
+            tally = correlations.get(key)
+            if tally is None:
+                tally = correlations[key] = _Tally(correlation)
+            verified = correlation.get("verified")
+            if verified is True:
+                tally.verified.append(reviewer)
+            elif verified is False:
+                tally.rejected.append(reviewer)
+            else:
+                tally.pending += 1
+            if correlation.get("expertNotes"):
+                tally.notes.append((reviewer, correlation["expertNotes"]))
+
+    def _votes(self, tally: _Tally) -> Tuple[int, int]:
+        verified, rejected = len(tally.verified), len(tally.rejected)
+        if self.missing_as_rejected:
+            rejected += len(self.reviewers) - verified - rejected - tally.pending
+        return verified, rejected
+
+    @staticmethod
+    def decide(verified: int, rejected: int) -> Optional[bool]:
+        """Majority of the decided votes; None when undecided or tied"""
+        if verified == rejected:
+            return None
+        return verified > rejected
+
+    def iter_correlations(self) -> Iterator[Tuple[CorrelationKey, _Tally, int, int]]:
+        for food, correlations in self.foods.items():
+            for (metabolite, reference), tally in correlations.items():
+                verified, rejected = self._votes(tally)
+                yield (food, metabolite, reference), tally, verified, rejected
+
+    def consensus_data(self) -> Dict[str, Any]:
+        """The merged dataset in the interface data shape, with per-correlation vote counts"""
+        foods = []
+        for food, correlations in self.foods.items():
+            merged = []
+            for tally in correlations.values():
+                verified, rejected = self._votes(tally)
+                record = dict(tally.record)
+                record["verified"] = self.decide(verified, rejected)
+                record["expertNotes"] = "\n".join(f"{self.reviewers[reviewer]}: {note}"
+                                                  for reviewer, note in tally.notes)
+                record["reviews"] = {"verified": verified, "rejected": rejected,
+                                     "reviewers": len(self.reviewers)}
+                merged.append(record)
+            foods.append({"id": len(foods), "name": food, "correlations": merged,
+                          "verified": False, "expertNotes": ""})
+        return {"foods": foods, "metadata": {"reviewers": self.reviewers, "total_foods": len(foods),
+                                             "agreement": self.statistics()}}
+
+    def conflicts(self) -> Iterator[Dict[str, Any]]:
+        """Correlations that some reviewers verified and others rejected"""
+        for (food, metabolite, reference), tally, verified, rejected in self.iter_correlations():
+            if verified and rejected:
+                yield {"food": food, "metabolite": metabolite, "reference": reference,
+                       "verified": verified, "rejected": rejected,
+                       "verified_by": ";".join(self.reviewers[i] for i in tally.verified),
+                       "rejected_by": ";".join(self.reviewers[i] for i in tally.rejected)}
+
+    def statistics(self) -> Dict[str, Any]:
+        """
+        Vote counts plus agreement over correlations with at least two decided
+        votes: the mean share of agreeing reviewer pairs and Fleiss' kappa
+        """
+        stats = {"reviewers": len(self.reviewers), "correlations": 0, "unanimous": 0,
+                 "conflicts": 0, "undecided": 0, "consensus_verified": 0, "consensus_rejected": 0}
+        rated, agreement, verified_votes, decided_votes = 0, 0.0, 0, 0
+        for _, _, verified, rejected in self.iter_correlations():
+            stats["correlations"] += 1
+            decision = self.decide(verified, rejected)
+            if decision is None:
+                stats["undecided"] += 1
+            else:
+                stats["consensus_verified" if decision else "consensus_rejected"] += 1
+            if verified and rejected:
+                stats["conflicts"] += 1
+            elif verified + rejected:
+                stats["unanimous"] += 1
+
+            votes = verified + rejected
+            if votes >= 2:
+                rated += 1
+                agreement += (verified * (verified - 1) + rejected * (rejected - 1)) / (votes * (votes - 1))
+                verified_votes += verified
+                decided_votes += votes
+
+        observed = agreement / rated if rated else None
+        kappa = None
+        if rated:
+            share = verified_votes / decided_votes
+            expected = share * share + (1 - share) * (1 - share)
+            # With a single category in use (e.g. verified-only exports) kappa is undefined
+            if expected < 1:
+                kappa = (observed - expected) / (1 - expected)
+        stats["observed_agreement"] = round(observed, 4) if observed is not None else None
+        stats["fleiss_kappa"] = round(kappa, 4) if kappa is not None else None
+        return stats
+
+def merge_reviews(review_files: List[str], missing_as_rejected: bool = False) -> ReviewConsensus:
+    consensus = ReviewConsensus(missing_as_rejected)
+    for review_file in review_files:
+        consensus.add_review(review_file)
+    return consensus
+
+def write_conflicts(consensus: ReviewConsensus, output_file: str) -> int:
+    fields = ["food", "metabolite", "reference", "verified", "rejected", "verified_by", "rejected_by"]
+    count = 0
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for conflict in consensus.conflicts():
+            writer.writerow(conflict)
+            count += 1
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge several experts\' review exports into a consensus dataset')
+    parser.add_argument('reviews', nargs='+',
+                       help='Review exports (verified_correlations.json, all_correlations.json, ...) '
+                            'and/or the review server\'s .sqlite store')
+    parser.add_argument('--output', default='consensus_correlations.json',
+                       help='Consensus dataset to write (default: consensus_correlations.json)')
+    parser.add_argument('--conflicts', default='review_conflicts.csv',
+                       help='CSV of the correlations reviewers disagree on (default: review_conflicts.csv)')
+    parser.add_argument('--missing-as-rejected', action='store_true',
+                       help='Count a correlation missing from a reviewer\'s export as rejected by them '
+                            '(for verified-only exports)')
+
+    args = parser.parse_args()
+
+    consensus = merge_reviews(args.reviews, args.missing_as_rejected)
+    save_interface_file(consensus.consensus_data(), args.output)
+    conflicts = write_conflicts(consensus, args.conflicts)
+
+    stats = consensus.statistics()
+    print(f"Merged {stats['correlations']} correlations from {stats['reviewers']} reviewers into {args.output}")
+    print(f"  consensus verified: {stats['consensus_verified']}, rejected: {stats['consensus_rejected']}, "
+          f"undecided: {stats['undecided']}")
+    print(f"  unanimous: {stats['unanimous']}, conflicts: {conflicts} (listed in {args.conflicts})")
+    print(f"  observed agreement: {stats['observed_agreement']}, Fleiss' kappa: {stats['fleiss_kappa']}")
+
+if __name__ == "__main__":
+    main()
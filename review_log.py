@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Merge expert review logs into the interface data
+The review page appends every verification or note change to a log instead of
+saving the whole dataset, and "Export Review Log" downloads it as JSON Lines,
+one delta per line. This tool applies the logs of any number of experts to
+expert_interface_data.json. Deltas are applied in (time, expert, seq) order, so
+the result is the same whatever order the logs are given in, and the latest
+change to a field wins.
+"""
+
+import argparse
+import json
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+from correlation_store import REVIEW_FIELDS
+from interface_store import load_interface_file, save_interface_file
+
+DELTA_KEYS = ("expert", "seq", "time", "food", "correlation", "field", "value")
+
+def read_review_log(log_file: str) -> Iterator[Dict[str, Any]]:
+    """Deltas of one exported log (JSON Lines, or a JSON array of deltas)"""
+    with open(log_file, 'r', encoding='utf-8') as f:
+        is_array = f.read(64).lstrip().startswith("[")
+        f.seek(0)
+        deltas = json.load(f) if is_array else (json.loads(line) for line in f if line.strip())
+        for line_number, delta in enumerate(deltas, 1):
+            missing = [key for key in DELTA_KEYS if key not in delta]
+            if missing:
+                raise ValueError(f"{log_file}: delta {line_number} lacks {', '.join(missing)}")
+            if delta["field"] not in REVIEW_FIELDS:
+                raise ValueError(f"{log_file}: delta {line_number} changes unknown field {delta['field']!r}")
+            yield delta
+
+def delta_order(delta: Dict[str, Any]) -> Tuple[str, str, int]:
+    return delta["time"], delta["expert"], delta["seq"]
+
+def merge_review_logs(log_files: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    Deltas of all logs in application order; a delta present in several logs
+    (the same export given twice) is kept once
+    """
+    deltas = {}
+    for log_file in log_files:
+        for delta in read_review_log(log_file):
+            deltas.setdefault(delta_order(delta), delta)
+    return [deltas[key] for key in sorted(deltas)]
+
+class _Targets:
+    """Finds the correlation a delta was recorded against, as the review page does"""
+
+    def __init__(self, foods: List[Dict[str, Any]]):
+        self.foods = foods
+        self.by_id = {food.get("id"): food for food in foods}
+        self.by_name: Dict[str, Dict[str, Any]] = {}
+        for food in foods:
+            self.by_name.setdefault(food.get("name"), food)
+
+    def find(self, delta: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # The food by ID if the name still matches, else by name; the correlation by
+        # position if metabolite and reference still match, else by both
+        food = self.by_id.get(delta.get("foodId"))
+        if food is None or food.get("name") != delta["food"]:
+            food = self.by_name.get(delta["food"])
+        correlations = (food or {}).get("correlations") or []
+
+        def matches(correlation):
+            return correlation.get("metabolite") == delta.get("metabolite") and \
+                correlation.get("reference") == delta.get("reference")
+
+        position = delta["correlation"]
+        if isinstance(position, int) and 0 <= position < len(correlations) and matches(correlations[position]):
+            return correlations[position]
+        return next((correlation for correlation in correlations if matches(correlation)), None)
+
+def apply_review_deltas(data: Dict[str, Any], deltas: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Apply ordered deltas to interface data in place; returns counts of what happened"""
+    targets = _Targets(data.get("foods", []))
+    counts = {"applied": 0, "unmatched": 0}
+    experts = set()
+    for delta in deltas:
+        experts.add(delta["expert"])
+        correlation = targets.find(delta)
+        if correlation is None:
+            counts["unmatched"] += 1
+            continue
+        correlation[delta["field"]] = delta["value"]
+        counts["applied"] += 1
+    counts["experts"] = len(experts)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply exported expert review logs to the interface data')
+    parser.add_argument('logs', nargs='+', help='Review logs exported from the review page (.jsonl)')
+    parser.add_argument('--data', default='expert_interface_data.json',
+                       help='Interface data the logs were recorded against (default: expert_interface_data.json)')
+    parser.add_argument('--output', default=None,
+                       help='Where to write the merged data (default: replace --data)')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+
+    args = parser.parse_args()
+
+    deltas = merge_review_logs(args.logs)
+    data = load_interface_file(args.data)
+    counts = apply_review_deltas(data, deltas)
+    print(f"Applied {counts['applied']} of {len(deltas)} changes from {counts['experts']} experts "
+          f"({counts['unmatched']} matched no correlation)")
+    if not args.dry_run:
+        output_file = args.output or args.data
+        save_interface_file(data, output_file)
+        print(f"Saved merged interface data to {output_file}")
+
+if __name__ == "__main__":
+    main()
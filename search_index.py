@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Tokenized full-text search index for the expert interface
+Maps every token of the food names, metabolites, references and expert notes to
+the foods it occurs in, so the review page can answer a search without scanning
+every food. The index is written next to the interface data whenever it is saved
+as JSON, as <name>.search_index.json, and expert_interface.html loads it instead
+of building its own when the SHA-256 of the data file it loaded matches the one
+recorded in the index. Queries match every term as a token prefix, and a term
+can be limited to one field with food:, metabolite:, reference: or notes:.
+"""
+
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Any, Iterable, Optional, Set, Tuple
+
+from json_stream import strip_compression_suffix
+
+SEARCH_INDEX_SUFFIX = ".search_index.json"
+# Version 1 indexes identified their data file by its byte size only
+SEARCH_INDEX_VERSION = 2
+SEARCH_FIELDS = ("food", "metabolite", "reference", "notes")
+
+# Same token definition as tokenize() in expert_interface.html: runs of letters and digits
+_TOKEN = re.compile(r"[^\W_]+")
+
+def tokenize(text: Any) -> List[str]:
+    return _TOKEN.findall(str(text).lower()) if text else []
+
+def search_index_path_for(interface_file: str) -> str:
+    return os.path.splitext(strip_compression_suffix(interface_file))[0] + SEARCH_INDEX_SUFFIX
+
+def source_hash(interface_file: str) -> str:
+    """SHA-256 of the data file's bytes, which the page computes for the file it loaded"""
+    digest = hashlib.sha256()
+    with open(interface_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def food_field_texts(food: Dict[str, Any]) -> Iterable[Tuple[int, Any]]:
+    """(field, text) pairs of a food, in field order"""
+    yield 0, food.get("name")
+    correlations = food.get("correlations") or []
+    for correlation in correlations:
+        yield 1, correlation.get("metabolite")
+    for correlation in correlations:
+        yield 2, correlation.get("reference")
+    yield 3, food.get("expertNotes") or food.get("expert_notes")
+    for correlation in correlations:
+        yield 3, correlation.get("expertNotes")
+
+class SearchIndex:
+    """
+    Sorted token table plus postings
+    Each posting is an ascending list of food position * len(SEARCH_FIELDS) +
+    field, so one list answers both field-limited and unlimited queries.
+    """
+
+    def __init__(self, food_count: int, tokens: List[str], postings: List[List[int]],
+                 source_hash: Optional[str] = None):
+        self.food_count = food_count
+        self.tokens = tokens
+        self.postings = postings
+        self.source_hash = source_hash
+
+    @classmethod
+    def build(cls, data: Dict[str, Any]) -> "SearchIndex":
+        """Build the index from interface data ({'foods': [...]})"""
+        builder = SearchIndexBuilder()
+        for food in data.get("foods", []):
+            builder.add_food(food)
+        return builder.finish()
+
+    def save(self, index_file: str):
+        with open(index_file, 'w') as f:
+            json.dump({
+                "version": SEARCH_INDEX_VERSION,
+                "fields": list(SEARCH_FIELDS),
+                "foods": self.food_count,
+                "source_sha256": self.source_hash,
+                "tokens": self.tokens,
+                "postings": self.postings
+            }, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, index_file: str) -> "SearchIndex":
+        with open(index_file, 'r') as f:
+            data = json.load(f)
+        if data.get("version") != SEARCH_INDEX_VERSION or data.get("fields") != list(SEARCH_FIELDS):
+            raise ValueError(f"Unsupported search index version: {data.get('version')}")
+        return cls(data["foods"], data["tokens"], data["postings"], data.get("source_sha256"))
+
+    def _term_foods(self, prefix: str, field: Optional[int]) -> Set[int]:
+        width = len(SEARCH_FIELDS)
+        foods = set()
+        position = bisect.bisect_left(self.tokens, prefix)
+        while position < len(self.tokens) and self.tokens[position].startswith(prefix):
+            foods.update(code // width for code in self.postings[position]
+                         if field is None or code % width == field)
+            position += 1
+        return foods
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[int]:
+        """Positions of the foods matching every term of the query, in interface order"""
+        matches: Optional[Set[int]] = None
+        for term in query.split():
+            field = None
+            name, separator, rest = term.partition(":")
+            if separator and name.lower() in SEARCH_FIELDS:
+                field, term = SEARCH_FIELDS.index(name.lower()), rest
+            for token in tokenize(term):
+                foods = self._term_foods(token, field)
+                matches = foods if matches is None else matches & foods
+                if not matches:
+                    return []
+        return sorted(matches)[:limit] if matches else []
+
+class SearchIndexBuilder:
+    """Builds a SearchIndex one food at a time, e.g. while the foods are streamed to disk"""
+
+    def __init__(self):
+        self._postings: Dict[str, List[int]] = {}
+        self._food_count = 0
+
+    def add_food(self, food: Dict[str, Any]):
+        base = self._food_count * len(SEARCH_FIELDS)
+        self._food_count += 1
+        for field, text in food_field_texts(food):
+            code = base + field
+            for token in tokenize(text):
+                postings = self._postings.setdefault(token, [])
+                # Fields come in order, so a code already added is the last one
+                if not postings or postings[-1] != code:
+                    postings.append(code)
+
+    def finish(self, source_hash: Optional[str] = None) -> SearchIndex:
+        tokens = sorted(self._postings)
+        return SearchIndex(self._food_count, tokens, [self._postings[token] for token in tokens], source_hash)
+
+def write_search_index(data: Dict[str, Any], interface_file: str) -> SearchIndex:
+    """Build and save the search index for interface data saved to interface_file"""
+    index = SearchIndex.build(data)
+    index.source_hash = source_hash(interface_file)
+    index.save(search_index_path_for(interface_file))
+    return index
+
+def load_search_index(interface_file: str) -> SearchIndex:
+    """Load the search index of an interface data file, rebuilding it if it is missing or stale"""
+    try:
+        index = SearchIndex.load(search_index_path_for(interface_file))
+        if index.source_hash == source_hash(interface_file):
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # Imported here because interface_store builds this index when it saves
+    from interface_store import load_interface_file
+    return write_search_index(load_interface_file(interface_file), interface_file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Search the foods of an interface data file')
+    parser.add_argument('query', nargs='+',
+                       help='Search terms; prefix a term with food:, metabolite:, reference: or notes: '
+                            'to search one field')
+    parser.add_argument('--data', default='expert_interface_data.json',
+                       help='Interface data file the index belongs to (default: expert_interface_data.json)')
+    parser.add_argument('--limit', type=int, default=50, help='Maximum foods to print (default: 50)')
+
+    args = parser.parse_args()
+
+    index = load_search_index(args.data)
+    from interface_store import load_interface_file
+    foods = load_interface_file(args.data).get("foods", [])
+
+    start = time.perf_counter()
+    positions = index.search(" ".join(args.query), args.limit)
+    elapsed = time.perf_counter() - start
+
+    for position in positions:
+        print(foods[position]["name"])
+    print(f"{len(positions)} foods found in {elapsed * 1000:.2f} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
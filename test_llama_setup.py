@@ -49,7 +49,7 @@ def test_llama_setup():
     
     # Test Llama call
     print(f"\nCalling Llama for {first_food}...")
-    response = integration.call_llama(first_prompt, first_food)
+    response = integration.call_llama(first_food, first_prompt)
     
     if response:
         print("✅ Llama responded successfully!")
@@ -3,11 +3,39 @@
 Test script for the Food-Metabolite Correlation Analysis System
 """
 
+import csv
 import json
 import os
+import shutil
 import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 from food_metabolite_analyzer import FoodMetaboliteAnalyzer
+from prompt_templates import load_template
 from llama_integration import LlamaIntegration
+from execution_policy import CircuitOpenError, ExecutionPolicy
+from llama_backends import BackendError, BackendOverloaded, CommandLineBackend, OllamaBackend, PythonBindingsBackend
+from response_cache import ResponseCache, make_cache_key
+from response_parser import CorrelationStreamParser, parse_correlations
+from benchmark_pipeline import FakeBackend, run_size
+from interface_store import load_interface_file, save_interface_file
+from correlation_store import CorrelationStore
+from expert_server import create_server
+from metabolite_index import MetaboliteIndex, index_path_for
+from metabolite_normalizer import MetaboliteNormalizer
+from search_index import SearchIndex, load_search_index, search_index_path_for
+from review_log import apply_review_deltas, merge_review_logs
+from review_consensus import merge_reviews
+from dietary_exposure import score_feature_table
+from association_matrix import AssociationMatrix, load_association_matrix
+from generate_comprehensive_correlations import write_synthetic_dataset
+from json_stream import JSONObjectStream, write_json_stream
+from json_index import IndexedJSON, LazyJSONArray, LazyJSONObject, offsets_path_for
 
 def test_food_analyzer():
     """Test the food analyzer component"""
@@ -55,6 +83,61 @@ def test_food_analyzer():
         print(f"❌ ERROR in food analyzer: {e}")
         return False
 
+def test_prompt_templates():
+    """Test template rendering, prompt memoization and stale checkpoint detection"""
+    print("\nTesting Prompt Templates...")
+    
+    try:
+        analyzer = FoodMetaboliteAnalyzer()
+        if not analyzer.foods:
+            print("❌ ERROR: No foods loaded from foods.csv")
+            return False
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            prompts_file = os.path.join(tmpdir, "prompts.json")
+            analyzer.save_prompts_to_file(prompts_file)
+            analyzer.save_interface_data(os.path.join(tmpdir, "interface.json"))
+            analyzer.generate_llama_prompt(analyzer.foods[0])
+            
+            # Each distinct food is rendered once, whatever asks for its prompt
+            if analyzer.prompt_cache.misses != len(set(analyzer.foods)):
+                print(f"❌ ERROR: {analyzer.prompt_cache.misses} prompts rendered for "
+                      f"{len(set(analyzer.foods))} foods")
+                return False
+            
+            with open(prompts_file, 'r') as f:
+                recorded = json.load(f)["template"]
+            if recorded != analyzer.prompt_template.metadata() or \
+               "broccoli" not in load_template().render(food="broccoli"):
+                print("❌ ERROR: Prompts file does not record the template")
+                return False
+            
+            template_file = os.path.join(tmpdir, "short.txt")
+            with open(template_file, 'w') as f:
+                f.write("List blood metabolites linked to {food}.\n")
+            template = load_template(template_file)
+            if template.render(food="kale") != "List blood metabolites linked to kale." or \
+               template.hash == recorded["hash"]:
+                print("❌ ERROR: Template file was not rendered or hashed correctly")
+                return False
+            
+            # Checkpointed foods from another template version are processed again
+            integration = LlamaIntegration(prompts_file, os.path.join(tmpdir, "correlations.json"))
+            integration.process_all_foods(max_foods=2)
+            processed = integration.checkpointed_foods()
+            integration.template_hash = template.hash
+            if len(processed) != 2 or integration.checkpointed_foods():
+                print("❌ ERROR: Checkpoint entries of a changed template were reused")
+                return False
+        
+        print(f"✅ Rendered {analyzer.prompt_cache.misses} prompts once each "
+              f"({analyzer.prompt_cache.hits} cache hits), template {analyzer.prompt_template.version}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in prompt templates: {e}")
+        return False
+
 def test_llama_integration():
     """Test the Llama integration component"""
     print("\nTesting Llama Integration...")
@@ -102,12 +185,1181 @@ def test_llama_integration():
         
         print(f"✅ Created interface data structure with {len(interface_data['foods'])} foods")
         
+        # Reloading and closing release the open prompts file
+        first_view = integration._prompts_view
+        integration.load_prompts()
+        second_view = integration._prompts_view
+        integration.close()
+        if not first_view._slices._file.closed or not second_view._slices._file.closed:
+            print("❌ ERROR: Prompts file handle was left open")
+            return False
+        
         return True
         
     except Exception as e:
         print(f"❌ ERROR in Llama integration: {e}")
         return False
 
+def test_concurrent_processing():
+    """Test concurrent processing order and resuming from the checkpoint"""
+    print("\nTesting Concurrent Processing...")
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            integration = LlamaIntegration(output_file=os.path.join(tmpdir, "correlations.json"))
+            if not integration.prompts:
+                print("⚠️  No prompts loaded (run food analyzer first)")
+                return True
+            
+            expected_order = list(integration.prompts.keys())[:4]
+            correlations = integration.process_all_foods(max_foods=4, workers=4)
+            
+            if list(correlations.keys()) != expected_order:
+                print("❌ ERROR: Concurrent results are not in prompt order")
+                return False
+            
+            print(f"✅ Processed {len(correlations)} foods with 4 workers in prompt order")
+            
+            if integration.checkpointed_foods() != set(expected_order):
+                print("❌ ERROR: Checkpoint does not contain the processed foods")
+                return False
+            
+            resumed = integration.process_all_foods(max_foods=4, workers=4, resume=True)
+            if resumed != correlations:
+                print("❌ ERROR: Resumed run did not reproduce the checkpointed results")
+                return False
+            
+            # The merged entries are streamed from the checkpoint into the output
+            integration.save_correlations(resumed)
+            with open(integration.output_file) as f:
+                saved = json.load(f)
+            if list(saved['correlations'].items()) != list(correlations.items()):
+                print("❌ ERROR: Saved correlations do not match the checkpointed results")
+                return False
+            
+            print("✅ Resumed run reused all checkpointed foods")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in concurrent processing: {e}")
+        return False
+
+def test_response_cache():
+    """Test response cache hits, misses and LRU eviction"""
+    print("\nTesting Response Cache...")
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ResponseCache(os.path.join(tmpdir, "cache.sqlite"), max_bytes=250)
+            key_a = make_cache_key("prompt a", "model.gguf", 0.7, 2048)
+            key_b = make_cache_key("prompt b", "model.gguf", 0.7, 2048)
+            
+            if key_a == make_cache_key("prompt a", "model.gguf", 0.2, 2048):
+                print("❌ ERROR: Cache key ignores the generation settings")
+                return False
+            
+            cache.put(key_a, "a" * 200)
+            if cache.get(key_a) != "a" * 200 or cache.get(key_b) is not None:
+                print("❌ ERROR: Cache lookup returned the wrong response")
+                return False
+            
+            # Adding a second large entry must evict the least recently used one
+            cache.put(key_b, "b" * 200)
+            if cache.get(key_a) is not None or cache.get(key_b) != "b" * 200:
+                print("❌ ERROR: Cache did not evict the least recently used entry")
+                return False
+            
+            stats = cache.stats()
+            cache.close()
+        
+        print(f"✅ Response cache recorded {stats['hits']} hits and {stats['misses']} misses")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in response cache: {e}")
+        return False
+
+STUB_RESPONSE = "Reference: Stub et al. (2024) - Stub Journal\nMetabolite: Stubonine\n" * 5
+
+class StubLlamaHandler(BaseHTTPRequestHandler):
+    """Answers Ollama and llama.cpp server requests with a fixed response"""
+    protocol_version = "HTTP/1.1"
+    stream_text = STUB_RESPONSE
+    
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+    
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if request.get("stream"):
+            # Ollama streams NDJSON lines over chunked transfer encoding
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            text = self.stream_text
+            for i in range(0, len(text), 7):
+                line = json.dumps({"response": text[i:i + 7], "done": False}).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            line = json.dumps({"response": "", "done": True}).encode() + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(line), line))
+            return
+        key = "response" if self.path == "/api/generate" else "content"
+        body = json.dumps({key: STUB_RESPONSE, "prompt": request["prompt"]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+def test_batched_generation():
+    """Test that batches skip cached prompts and fall back per item"""
+    print("\nTesting Batched Generation...")
+    
+    try:
+        class BatchBackend(FakeBackend):
+            def __init__(self, fail=False):
+                super().__init__()
+                self.fail = fail
+                self.batches = []
+            
+            def generate_batch(self, prompts, timeout=None):
+                self.batches.append(list(prompts))
+                if self.fail:
+                    raise BackendError("batch decode failed")
+                # One full response, one too short to use, and nothing for the rest
+                return [self.generate(prompts[0]), "too short"]
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ResponseCache(os.path.join(tmpdir, "cache.sqlite"))
+            backend = BatchBackend()
+            integration = LlamaIntegration(output_file=os.path.join(tmpdir, "correlations.json"),
+                                           cache=cache, backend=backend,
+                                           policy=ExecutionPolicy(timeout=5, retry_attempts=0))
+            items = [(f"food {i}", f'the food item "food {i}" in blood, prompt {i}') for i in range(4)]
+            cache.put(make_cache_key(items[0][1], *backend.cache_identity()), "cached " * 20)
+            
+            responses = integration.call_llama_batch(items)
+            if backend.batches != [[prompt for _, prompt in items[1:]]]:
+                print(f"❌ ERROR: Batch held {backend.batches} instead of the cache misses")
+                return False
+            
+            fallback = [integration._generate_comprehensive_correlations(food) for food, _ in items]
+            if responses != ["cached " * 20, backend.generate(items[1][1]), fallback[2], fallback[3]] or \
+               cache.get(make_cache_key(items[1][1], *backend.cache_identity())) != responses[1]:
+                print("❌ ERROR: Short batch responses did not fall back per item")
+                return False
+            
+            print(f"✅ Batched {len(backend.batches[0])} cache misses and fell back for 2 of them")
+            
+            integration.backend = BatchBackend(fail=True)
+            entries = integration.process_all_foods(max_foods=3, batch_size=3) if integration.prompts else {}
+            # Entries are read from the checkpoint, so they are checked before it is removed
+            all_fallback = all(entry.get('fallback') for entry in entries.values())
+            cache.close()
+        
+        if integration.prompts and (len(integration.backend.batches) != 1 or len(entries) != 3 or
+                                    not all_fallback):
+            print("❌ ERROR: Failed batch did not fall back for every food")
+            return False
+        
+        print("✅ Failed batch fell back for every food")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in batched generation: {e}")
+        return False
+
+class FakeLlamaState:
+    def __init__(self, input_ids, n_tokens):
+        self.input_ids = list(input_ids)
+        self.n_tokens = n_tokens
+
+class FakeLlama:
+    """
+    Just enough of llama_cpp.Llama for the prefix state handling: like the
+    real one, reset() keeps the old input_ids and only clears n_tokens
+    """
+    def __init__(self, n_ctx=4096):
+        self.input_ids = [0] * n_ctx
+        self.n_tokens = 0
+        self.evaluated = 0
+        self.loads = 0
+    
+    def tokenize(self, text, add_bos=True):
+        return ([1] if add_bos else []) + list(text)
+    
+    def reset(self):
+        self.n_tokens = 0
+    
+    def eval(self, tokens):
+        self.input_ids[self.n_tokens:self.n_tokens + len(tokens)] = tokens
+        self.n_tokens += len(tokens)
+        self.evaluated += len(tokens)
+    
+    def save_state(self):
+        return FakeLlamaState(self.input_ids, self.n_tokens)
+    
+    def load_state(self, state):
+        self.input_ids = list(state.input_ids)
+        self.n_tokens = state.n_tokens
+        self.loads += 1
+
+def test_prompt_prefix_state():
+    """Test that the shared prompt prefix is evaluated once, saved and restored"""
+    print("\nTesting Prompt Prefix State...")
+    
+    try:
+        analyzer = FoodMetaboliteAnalyzer()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            prompts_file = os.path.join(tmpdir, "prompts.json")
+            analyzer.save_prompts_to_file(prompts_file)
+            integration = LlamaIntegration(prompts_file, os.path.join(tmpdir, "correlations.json"))
+            prefix = integration.shared_prompt_prefix()
+            prompt = next(iter(integration.prompts.values()))
+            
+            # The food-specific task comes last, so the general instructions are shared
+            if len(prefix) < 0.6 * len(prompt):
+                print(f"❌ ERROR: Shared prefix covers only {len(prefix)} of {len(prompt)} characters")
+                return False
+            
+            config = {"model_path": "fake.gguf", "prefix_cache_dir": os.path.join(tmpdir, "prefixes")}
+            backend = PythonBindingsBackend(config)
+            backend.set_shared_prefix(prefix)
+            llm = FakeLlama()
+            backend._restore_prefix(llm, prompt)
+            evaluated = llm.evaluated
+            backend._restore_prefix(llm, prompt)
+            if not evaluated or llm.evaluated != evaluated or llm.loads:
+                print("❌ ERROR: Prefix was not evaluated exactly once")
+                return False
+            
+            # After a reset the stale input_ids still match, but nothing is evaluated
+            llm.reset()
+            backend._restore_prefix(llm, prompt)
+            if llm.loads != 1 or llm.n_tokens != evaluated:
+                print("❌ ERROR: Prefix state was not reloaded after the context was reset")
+                return False
+            
+            restarted = PythonBindingsBackend(config)
+            restarted.set_shared_prefix(prefix)
+            fresh = FakeLlama()
+            restarted._restore_prefix(fresh, prompt)
+            restarted._restore_prefix(fresh, "an unrelated prompt")
+            if fresh.evaluated or fresh.loads != 1 or fresh.input_ids[:evaluated] != llm.input_ids[:evaluated]:
+                print("❌ ERROR: Prefix state was not restored from the prefix cache")
+                return False
+        
+        print(f"✅ Evaluated a {evaluated}-token prefix once and restored it from disk")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in prompt prefix state: {e}")
+        return False
+
+def test_response_parser():
+    """Test that streamed chunks parse the same as the whole response"""
+    print("\nTesting Response Parser...")
+    
+    try:
+        integration = LlamaIntegration()
+        response = integration._generate_comprehensive_correlations("apple")
+        expected = parse_correlations(response)
+        
+        # Feed the response in small uneven chunks, as tokens arrive from a stream
+        parser = CorrelationStreamParser()
+        streamed = []
+        first_record_at = None
+        for start in range(0, len(response), 7):
+            streamed.extend(parser.feed(response[start:start + 7]))
+            if streamed and first_record_at is None:
+                first_record_at = start
+        streamed.extend(parser.close())
+        
+        if len(expected) < 15 or streamed != expected:
+            print("❌ ERROR: Streamed parse differs from the whole-response parse")
+            return False
+        
+        if first_record_at is None or first_record_at > len(response) // 2:
+            print("❌ ERROR: Parser held back records until the end of the response")
+            return False
+        
+        print(f"✅ Parsed {len(streamed)} correlations incrementally")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in response parser: {e}")
+        return False
+
+def test_llama_backends():
+    """Test the Ollama and llama.cpp server backends against local stubs"""
+    print("\nTesting Llama Backends...")
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLlamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            backend = OllamaBackend({"base_url": f"http://127.0.0.1:{server.server_port}", "model": "stub"})
+            integration = LlamaIntegration(output_file=os.path.join(tmpdir, "correlations.json"),
+                                           backend=backend)
+            
+            responses = [integration.call_llama("broccoli", f"prompt {i}") for i in range(3)]
+            if responses != [STUB_RESPONSE] * 3:
+                print("❌ ERROR: Ollama backend did not return the stub response")
+                return False
+            integration.close()
+            
+            print("✅ Ollama backend answered 3 prompts over one pooled session")
+            
+            StubLlamaHandler.stream_text = integration._generate_comprehensive_correlations("streamed food")
+            integration.ollama_config = {"base_url": f"http://127.0.0.1:{server.server_port}", "model": "stub"}
+            correlations = integration.process_all_foods(max_foods=3, workers=2, async_mode=True)
+            if len(correlations) != 3 or any(
+                    food_data['total_correlations'] != 20
+                    or "streamed food" not in food_data['correlations'][0]['finding']
+                    for food_data in correlations.values()):
+                print("❌ ERROR: Async Ollama mode did not parse the streamed responses")
+                return False
+            
+            print("✅ Async Ollama mode parsed 3 streamed responses")
+            
+            # A fake llama-server that simply runs the stub handler on the requested port
+            fake_server = os.path.join(tmpdir, "fake-llama-server")
+            with open(fake_server, "w") as f:
+                f.write(f"#!{sys.executable}\n"
+                        "import sys\n"
+                        f"sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})\n"
+                        "from http.server import ThreadingHTTPServer\n"
+                        "from test_system import StubLlamaHandler\n"
+                        "port = int(sys.argv[sys.argv.index('--port') + 1])\n"
+                        "ThreadingHTTPServer(('127.0.0.1', port), StubLlamaHandler).serve_forever()\n")
+            os.chmod(fake_server, 0o755)
+            
+            probe = ThreadingHTTPServer(("127.0.0.1", 0), StubLlamaHandler)
+            port = probe.server_port
+            probe.server_close()
+            
+            backend = CommandLineBackend({"server_executable": fake_server, "model_path": "stub.gguf",
+                                          "server_port": port, "startup_timeout": 20})
+            responses = [backend.generate(f"prompt {i}") for i in range(3)]
+            process = backend._process
+            backend.close()
+            
+            if responses != [STUB_RESPONSE] * 3 or process.poll() is None:
+                print("❌ ERROR: llama.cpp server backend did not reuse one warm process")
+                return False
+            
+            print("✅ llama.cpp server backend answered 3 prompts from one warm process")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in Llama backends: {e}")
+        return False
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_compact_interface_data():
+    """Test that the compact interface format round-trips the JSON data"""
+    print("\nTesting Compact Interface Data...")
+    
+    try:
+        with open("expert_interface_data.json", 'r') as f:
+            data = json.load(f)
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            compact_file = os.path.join(tmpdir, "interface.fmcol")
+            save_interface_file(data, compact_file)
+            if load_interface_file(compact_file) != data:
+                print("❌ ERROR: Compact file did not decode to the original data")
+                return False
+            
+            ratio = os.path.getsize("expert_interface_data.json") / os.path.getsize(compact_file)
+        
+        print(f"✅ Compact file round-trips {len(data['foods'])} foods at 1/{ratio:.0f} of the JSON size")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in compact interface data: {e}")
+        return False
+
+def test_metabolite_index():
+    """Test the reverse metabolite -> food index written with the interface data"""
+    print("\nTesting Metabolite Index...")
+    
+    try:
+        data = {'foods': [
+            {'name': "kale", 'correlations': [
+                {'metabolite': "Vitamin C (Ascorbic Acid)", 'correlationType': "Positive", 'reference': "Ref A"},
+                {'metabolite': "LDL Cholesterol", 'correlationType': "Negative", 'reference': "Ref B"},
+                {'metabolite': "Curcumin", 'correlationType': "Positive", 'reference': "Ref D"}]},
+            {'name': "tea", 'correlations': [
+                {'metabolite': "vitamin c", 'correlationType': "Negative", 'reference': "Ref C"},
+                {'metabolite': "Diferuloylmethanes", 'correlationType': "Positive", 'reference': "Ref E"}]}
+        ]}
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            interface_file = os.path.join(tmpdir, "interface.json")
+            save_interface_file(data, interface_file)
+            index = MetaboliteIndex.load(index_path_for(interface_file))
+        
+        if index.foods_for("Vitamin C") != ["kale", "tea"] or \
+           index.foods_for("L-ascorbic acid") != ["kale", "tea"] or \
+           index.foods_for("ascorbic-acid", "Positive") != ["kale"] or \
+           index.lookup("LDL cholesterol")[0].reference != "Ref B":
+            print("❌ ERROR: Metabolite index returned the wrong foods")
+            return False
+        
+        # Fuzzy matches are neither posted nor looked up under a canonical ID
+        if index.lookup("cholesterol") or index.foods_for("Curcumin") != ["kale"] or \
+           index.foods_for("Diferuloylmethanes") != ["tea"]:
+            print("❌ ERROR: Metabolite index followed a fuzzy match")
+            return False
+        
+        results = index.lookup_many(["Vitamin C", "unknown metabolite"] * 1000)
+        if len(results["Vitamin C"]) != 2 or results["unknown metabolite"]:
+            print("❌ ERROR: Batch lookup returned the wrong links")
+            return False
+        
+        print(f"✅ Metabolite index answered a batch of {len(results)} distinct queries")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in metabolite index: {e}")
+        return False
+
+def test_search_index():
+    """Test the tokenized search index written with the interface data"""
+    print("\nTesting Search Index...")
+    
+    try:
+        data = {'foods': [
+            {'name': "Green tea", 'correlations': [
+                {'metabolite': "Epigallocatechin gallate", 'reference': "Lee K (2019). Tea study", 'expertNotes': ""}]},
+            {'name': "kale", 'expertNotes': "check tea overlap", 'correlations': [
+                {'metabolite': "Lutein", 'reference': "Doe J (2020). Carotenoids", 'expertNotes': "dose-dependent"}]}
+        ]}
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            interface_file = os.path.join(tmpdir, "interface.json")
+            save_interface_file(data, interface_file)
+            index = SearchIndex.load(search_index_path_for(interface_file))
+            
+            # A changed data file makes the saved index stale
+            data['foods'].append({'name': "teff", 'correlations': []})
+            with open(interface_file, 'w') as f:
+                json.dump(data, f)
+            rebuilt = load_search_index(interface_file)
+            
+            # So does an edit that keeps the file's size
+            with open(interface_file) as f:
+                text = f.read()
+            with open(interface_file, 'w') as f:
+                f.write(text.replace('"kale"', '"leaf"'))
+            renamed = load_search_index(interface_file)
+        
+        if index.search("tea") != [0, 1] or index.search("food:tea") != [0] or \
+           index.search("notes:dose") != [1] or index.search("epigallo lee") != [0] or \
+           index.search("reference:carotenoids lutein") != [1] or index.search("tea lutein kale") != [1]:
+            print("❌ ERROR: Search index returned the wrong foods")
+            return False
+        
+        if index.search("coffee") or rebuilt.food_count != 3 or rebuilt.search("food:te") != [0, 2] or \
+           renamed.search("food:kale") or renamed.search("food:leaf") != [1]:
+            print("❌ ERROR: Search index was not rebuilt for the changed file")
+            return False
+        
+        print(f"✅ Search index holds {len(index.tokens)} tokens and was rebuilt when stale")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in search index: {e}")
+        return False
+
+def test_metabolite_normalizer():
+    """Test exact, synonym and fuzzy metabolite name matching"""
+    print("\nTesting Metabolite Normalizer...")
+    
+    try:
+        normalizer = MetaboliteNormalizer()
+        expected = {
+            "Vitamin C (Ascorbic Acid)": "vitamin_c_ascorbic_acid",
+            "L-ascorbic acid": "vitamin_c_ascorbic_acid",
+            "MDA": "malondialdehyde_mda",
+            "β-carotene": "beta_carotene",
+            "oxidative-stress marker": "oxidative_stress_markers",
+            "Omega-3": None,  # Ambiguous between EPA, DHA and ALA
+            "Vitamin K": None,  # Class name covering K1 and K2
+            "Provitamin A": None,
+            "Pyridoxal 5'-phosphate": None,  # Another B6 vitamer than pyridoxine
+            "M123.0456T7.8": None
+        }
+        
+        matches = normalizer.normalize_many(list(expected) * 100)
+        for match in matches[:len(expected)]:
+            if match.canonical_id != expected[match.query]:
+                print(f"❌ ERROR: {match.query!r} normalized to {match.canonical_id!r}")
+                return False
+        
+        if normalizer.cache_info().misses != len(expected):
+            print("❌ ERROR: Repeated names were not served from the cache")
+            return False
+        
+        # Near misses that differ in a vitamin number, isomer or lipoprotein class
+        near_misses = ["VLDL cholesterol", "Cholesterol", "Vitamin K2", "Vitamin D2",
+                       "gamma-tocopherol", "Antioxidants"]
+        for match in normalizer.normalize_many(near_misses):
+            if match.canonical_id is not None:
+                print(f"❌ ERROR: Near miss {match.query!r} matched {match.canonical_id!r} ({match.score})")
+                return False
+        
+        print(f"✅ Normalized {len(matches)} names with {normalizer.cache_info().hits} cache hits")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in metabolite normalizer: {e}")
+        return False
+
+def test_dietary_exposure():
+    """Test chunked, vectorized exposure scoring of a feature table"""
+    print("\nTesting Dietary Exposure Scoring...")
+    
+    try:
+        def correlation(metabolite, correlation_type, verified=None):
+            return {'reference': "Doe J (2020). Feeding study", 'metabolite': metabolite,
+                    'correlationType': correlation_type, 'verified': verified}
+        
+        data = {'foods': [
+            {'name': "kale", 'correlations': [correlation("Vitamin C (Ascorbic Acid)", "Positive"),
+                                              correlation("LDL Cholesterol", "Negative")]},
+            {'name': "bacon", 'correlations': [correlation("LDL Cholesterol", "Positive"),
+                                               correlation("Vitamin C (Ascorbic Acid)", "Positive", False)]},
+            {'name': "tea", 'correlations': [correlation("Curcumin", "Positive")]}
+        ]}
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data_file = os.path.join(tmpdir, "interface.json")
+            features_file = os.path.join(tmpdir, "features.csv")
+            output_file = os.path.join(tmpdir, "scores.csv")
+            save_interface_file(data, data_file, build_index=False)
+            with open(features_file, 'w') as f:
+                f.write("sample,ascorbate,LDL-C,M123.0456T7.8,Diferuloylmethanes\n")
+                f.write("high_kale,3,1,5,\nhigh_bacon,1,3,,\nmissing,,,1,2\n")
+            
+            summary = score_feature_table(features_file, output_file, data_file, chunk_size=2)
+            with open(output_file, 'r') as f:
+                rows = {row[0]: row[1:] for row in csv.reader(f)}
+            
+            # Fuzzy matches are opt-in and recorded in the feature mapping
+            mapping_file = os.path.join(tmpdir, "mapping.csv")
+            fuzzy_summary = score_feature_table(features_file, output_file, data_file,
+                                                fuzzy=True, mapping_file=mapping_file)
+            with open(mapping_file, 'r') as f:
+                mapping = {row['feature']: row for row in csv.DictReader(f)}
+        
+        if summary['samples'] != 3 or summary['matched_features'] != 2:
+            print(f"❌ ERROR: Unexpected scoring summary {summary}")
+            return False
+        
+        fuzzy_row = mapping['Diferuloylmethanes']
+        if fuzzy_summary['matched_features'] != 3 or fuzzy_summary['fuzzy_features'] != 1 or \
+           (fuzzy_row['canonical_id'], fuzzy_row['method'], fuzzy_row['used']) != ("curcumin", "fuzzy", "True") or \
+           mapping['ascorbate']['method'] != "synonym" or mapping['M123.0456T7.8']['used'] != "False":
+            print(f"❌ ERROR: Unexpected fuzzy scoring {fuzzy_summary} / mapping {mapping}")
+            return False
+        
+        if rows['sample'] != ["kale", "bacon", "tea"]:
+            print(f"❌ ERROR: Unexpected food columns {rows['sample']}")
+            return False
+        
+        kale, bacon, tea = (float(value) if value else None for value in rows['high_kale'])
+        if not kale > 0 > bacon or tea is not None:
+            print(f"❌ ERROR: Unexpected scores for high_kale: {rows['high_kale']}")
+            return False
+        
+        if float(rows['high_bacon'][1]) <= 0 or float(rows['missing'][0]) != 0:
+            print(f"❌ ERROR: Unexpected scores {rows['high_bacon']} / {rows['missing']}")
+            return False
+        
+        print(f"✅ Scored {summary['samples']} samples against {summary['scored_foods']} foods")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in dietary exposure scoring: {e}")
+        return False
+
+def test_association_matrix():
+    """Test building, saving and memory-mapping the food x metabolite matrix"""
+    print("\nTesting Association Matrix...")
+    
+    try:
+        def correlation(metabolite, correlation_type):
+            return {'reference': "Doe J (2020). Feeding study", 'metabolite': metabolite,
+                    'correlationType': correlation_type, 'verified': None}
+        
+        data = {'foods': [
+            {'name': "kale", 'correlations': [correlation("Vitamin C (Ascorbic Acid)", "Positive"),
+                                              correlation("ascorbate", "Positive"),
+                                              correlation("LDL-C", "Negative")]},
+            {'name': "bacon", 'correlations': [correlation("LDL Cholesterol", "Positive"),
+                                               correlation("VLDL cholesterol", "Positive"),
+                                               correlation("Mystery marker", "Negative")]},
+            {'name': "turmeric", 'correlations': [correlation("Curcumin", "Positive"),
+                                                  correlation("Diferuloylmethanes", "Positive")]}
+        ]}
+        matrix = AssociationMatrix.build(data)
+        
+        # Names without an exact or synonym match keep their own column, fuzzy or not
+        if matrix.row("turmeric") != {'curcumin': {'signed': 1, 'evidence': 1},
+                                      'diferuloylmethanes': {'signed': 1, 'evidence': 1}} or \
+           'vldl_cholesterol' not in matrix.metabolites:
+            print(f"❌ ERROR: Fuzzy matches were merged into columns {matrix.metabolites}")
+            return False
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for matrix_format in ("csr", "dense"):
+                manifest_file = matrix.save(os.path.join(tmpdir, matrix_format), matrix_format)
+                loaded = load_association_matrix(manifest_file)
+                
+                if loaded.format != matrix_format or not isinstance(loaded.signed, np.memmap):
+                    print(f"❌ ERROR: {matrix_format} matrix was not memory-mapped")
+                    return False
+                
+                if loaded.row("kale") != {'vitamin_c_ascorbic_acid': {'signed': 2, 'evidence': 2},
+                                          'ldl_cholesterol': {'signed': -1, 'evidence': 1}}:
+                    print(f"❌ ERROR: Unexpected kale row {loaded.row('kale')}")
+                    return False
+                
+                if loaded.column("ldl_cholesterol") != {'kale': {'signed': -1, 'evidence': 1},
+                                                        'bacon': {'signed': 1, 'evidence': 1}}:
+                    print(f"❌ ERROR: Unexpected LDL column {loaded.column('ldl_cholesterol')}")
+                    return False
+        
+        print(f"✅ Saved and memory-mapped a {matrix.shape[0]}x{matrix.shape[1]} matrix as CSR and dense")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in association matrix: {e}")
+        return False
+
+def test_synthetic_dataset():
+    """Test that seeded synthetic datasets are valid and reproducible"""
+    print("\nTesting Synthetic Dataset Generator...")
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = [os.path.join(tmpdir, f"synthetic_{i}.json") for i in range(3)]
+            for path, seed in zip(paths, (7, 7, 8)):
+                write_synthetic_dataset(path, 1500, correlations_per_food=20, seed=seed)
+            contents = []
+            for path in paths:
+                with open(path, 'rb') as f:
+                    contents.append(f.read())
+            data = load_interface_file(paths[0])
+        
+        if contents[0] != contents[1] or contents[0] == contents[2]:
+            print("❌ ERROR: Output does not depend on the seed alone")
+            return False
+        
+        foods = data['foods']
+        if len(foods) != 1500 or len({food['name'] for food in foods}) != 1500:
+            print("❌ ERROR: Expected 1500 distinct foods")
+            return False
+        
+        correlations = foods[-1]['correlations']
+        if len(correlations) != 20 or len({c['metabolite'] for c in correlations}) != 20 or \
+                foods[-1]['name'] not in correlations[0]['finding']:
+            print(f"❌ ERROR: Unexpected correlations {correlations[:1]}")
+            return False
+        
+        print(f"✅ Generated {data['metadata']['total_correlations']} reproducible synthetic correlations")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in synthetic dataset generator: {e}")
+        return False
+
+def test_streaming_json():
+    """Test streamed JSON output: indented, compact and gzip-compressed"""
+    print("\nTesting Streaming JSON Writer...")
+    
+    try:
+        correlations = {f"food {i}": {'prompt': f"food {i}?", 'correlations': [
+            {'metabolite': "Lutein", 'correlationType': "Positive", 'reference': f"Doe J ({2000 + i})"}]}
+            for i in range(50)}
+        data = {'foods': [{'id': i, 'name': name, 'correlations': food['correlations']}
+                          for i, (name, food) in enumerate(correlations.items())],
+                'metadata': {'total_foods': 50}}
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "correlations.json")
+            write_json_stream(path, {'total_foods': 50, 'correlations': JSONObjectStream(correlations.items())})
+            with open(path, 'r') as f:
+                if f.read() != json.dumps({'total_foods': 50, 'correlations': correlations}, indent=2):
+                    print("❌ ERROR: Indented stream differs from json.dump output")
+                    return False
+            
+            for name, indent in (("interface.json", None), ("interface.json.gz", 2)):
+                path = os.path.join(tmpdir, name)
+                # Foods are passed as a one-shot generator, as the pipeline does
+                save_interface_file(dict(data, foods=iter(data['foods'])), path, indent=indent)
+                if load_interface_file(path) != data:
+                    print(f"❌ ERROR: {name} did not round-trip")
+                    return False
+                if MetaboliteIndex.load(index_path_for(path)).foods_for("Lutein") != list(correlations):
+                    print(f"❌ ERROR: Index for {name} was not built while streaming")
+                    return False
+            
+            leftovers = [name for name in os.listdir(tmpdir) if name.endswith(".tmp")]
+            if leftovers:
+                print(f"❌ ERROR: Temporary files left behind: {leftovers}")
+                return False
+        
+        print("✅ Streamed indented, compact and gzip JSON output")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in streaming JSON writer: {e}")
+        return False
+
+def test_json_index():
+    """Test random access through the byte-offset sidecar index"""
+    print("\nTesting Indexed JSON Reader...")
+    
+    try:
+        data = {'generated_at': "2025-01-01", 'total_foods': 3,
+                'correlations': {name: {'prompt': f"{name}? [x]", 'correlations': [{'metabolite': "Lutein, {free}"}]}
+                                 for name in ("kale", "tea \"green\"", "beef")},
+                'foods': [{'id': i, 'name': f"food {i}"} for i in range(3)]}
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "data.json")
+            with open(path, 'w') as f:
+                json.dump(data, f, indent=2)
+            
+            with IndexedJSON(path) as indexed:
+                if indexed['correlations']['tea "green"'] != data['correlations']['tea "green"'] or \
+                        indexed['foods'][2] != data['foods'][2] or indexed['total_foods'] != 3:
+                    print("❌ ERROR: Random access returned the wrong entry")
+                    return False
+            
+            if not os.path.exists(offsets_path_for(path)):
+                print("❌ ERROR: Offset sidecar was not written")
+                return False
+            
+            # A rewritten file must not be read through stale offsets
+            data['foods'].insert(0, {'id': -1, 'name': "new food"})
+            with open(path, 'w') as f:
+                json.dump(data, f)
+            os.utime(path, ns=(0, 0))
+            with IndexedJSON(path) as indexed:
+                if list(indexed['foods']) != data['foods'] or list(indexed['correlations']) != list(data['correlations']):
+                    print("❌ ERROR: Stale offsets were used after the file changed")
+                    return False
+        
+        print("✅ Read single entries through the offset index")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in indexed JSON reader: {e}")
+        return False
+
+def test_correlation_store():
+    """Test per-food upserts, metabolite queries and JSON export of the store"""
+    print("\nTesting Correlation Store...")
+    
+    try:
+        def correlation(metabolite, correlation_type):
+            return {'reference': f"Doe J (2020). {metabolite} study", 'metabolite': metabolite,
+                    'correlationType': correlation_type, 'finding': f"{metabolite} changed",
+                    'relevantQuote': "p<0.05", 'verified': None, 'expertNotes': "", 'doi': None}
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = CorrelationStore(os.path.join(tmpdir, "store.sqlite"))
+            store.upsert_food("kale", {'prompt': "kale?", 'correlations': [
+                correlation("Lutein", "Positive"), correlation("LDL Cholesterol", "Negative")]})
+            store.upsert_food("tea", {'prompt': "tea?", 'correlations': [
+                correlation("Lutein", "Negative")]})
+            
+            if store.foods_for_metabolite("Lutein", "Positive") != ["kale"] or \
+               store.foods_for_metabolite("Lutein") != ["kale", "tea"]:
+                print("❌ ERROR: Metabolite query returned the wrong foods")
+                return False
+            
+            # Replacing one food must leave the others untouched
+            store.upsert_food("kale", {'prompt': "kale?", 'correlations': [correlation("Folate", "Positive")]})
+            exported = store.export_correlations()
+            if list(exported) != ["kale", "tea"] or \
+               exported["kale"]['correlations'] != [correlation("Folate", "Positive")] or \
+               exported["tea"]['correlations'] != [correlation("Lutein", "Negative")]:
+                print("❌ ERROR: Upsert did not replace exactly one food")
+                return False
+            
+            store.set_verification("tea", 0, True, "confirmed")
+            verified = store.get_food("tea")['correlations'][0]
+            stats = store.stats()
+            store.close()
+        
+        if verified['verified'] is not True or verified['expertNotes'] != "confirmed":
+            print("❌ ERROR: Verification was not recorded")
+            return False
+        
+        print(f"✅ Correlation store holds {stats['foods']} foods and {stats['correlations']} correlations")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in correlation store: {e}")
+        return False
+
+def test_expert_server():
+    """Test paging, search and review updates through the expert interface API"""
+    print("\nTesting Expert Server...")
+    
+    try:
+        foods = [{'name': f"food {i}", 'prompt': "", 'verified': False, 'expertNotes': "",
+                  'correlations': [{'reference': f"Ref {i}", 'metabolite': "Hippurate" if i == 7 else "Lutein",
+                                    'correlationType': "Positive", 'finding': "", 'relevantQuote': "",
+                                    'verified': None, 'expertNotes': ""}]}
+                 for i in range(25)]
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = CorrelationStore(os.path.join(tmpdir, "store.sqlite"))
+            store.import_interface_data({'foods': foods})
+            server, _ = create_server(store, port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base = f"http://127.0.0.1:{server.server_address[1]}"
+            
+            def request(path, changes=None):
+                data = json.dumps(changes).encode() if changes is not None else None
+                with urlopen(Request(base + path, data=data, method="PATCH" if data else "GET"), timeout=5) as response:
+                    return json.loads(response.read())
+            
+            try:
+                page = request("/foods?offset=20&limit=10")
+                found = request("/search?q=hippur")
+                food_id = found['foods'][0]['id'] if found['foods'] else None
+                request(f"/foods/{food_id}/correlations/0", {'verified': True, 'expertNotes': "checked"})
+                correlations = request(f"/foods/{food_id}/correlations")
+                stats = request("/stats")
+                exported = request("/export?verified=1")
+                try:
+                    request("/foods/999/correlations/0", {'verified': True})
+                    missing_status = 200
+                except HTTPError as e:
+                    missing_status = e.code
+                
+                # Empty updates of missing records and ill-typed values are answered, not dropped
+                error_statuses = []
+                for path, changes in [("/foods/999", {}), ("/foods/999/correlations/0", {}),
+                                      (f"/foods/{food_id}/correlations/5", {}),
+                                      (f"/foods/{food_id}", {'verified': "no"}),
+                                      (f"/foods/{food_id}/correlations/0", {'expertNotes': 5})]:
+                    try:
+                        request(path, changes)
+                        error_statuses.append(200)
+                    except HTTPError as e:
+                        error_statuses.append(e.code)
+            finally:
+                server.shutdown()
+                server.server_close()
+                store.close()
+        
+        if page['total'] != 25 or [food['name'] for food in page['foods']] != [f"food {i}" for i in range(20, 25)]:
+            print("❌ ERROR: Food page has the wrong foods")
+            return False
+        
+        if [food['name'] for food in found['foods']] != ["food 7"]:
+            print("❌ ERROR: Search did not find the food by metabolite")
+            return False
+        
+        if correlations[0]['verified'] is not True or correlations[0]['expertNotes'] != "checked" or \
+           stats['verified'] != 1 or stats['pending'] != 24:
+            print("❌ ERROR: Review update was not saved")
+            return False
+        
+        if [food['name'] for food in exported['foods']] != ["food 7"] or missing_status != 404:
+            print("❌ ERROR: Verified export or missing-food error is wrong")
+            return False
+        
+        if error_statuses != [404, 404, 404, 400, 400]:
+            print(f"❌ ERROR: Invalid updates were answered with {error_statuses}")
+            return False
+        
+        print(f"✅ Expert API paged {page['total']} foods and saved a review")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in expert server: {e}")
+        return False
+
+def test_review_log():
+    """Test merging several experts' review logs into the interface data"""
+    print("\nTesting Review Log Merge...")
+    
+    try:
+        def delta(expert, seq, time, position, field, value, metabolite=None):
+            return {'expert': expert, 'seq': seq, 'time': f"2024-05-01T10:00:0{time}.000Z", 'food': "kale",
+                    'foodId': 0, 'correlation': position, 'metabolite': metabolite or f"M{position}",
+                    'reference': f"R{position}", 'field': field, 'value': value}
+        
+        logs = {
+            "a.jsonl": [delta("a", 0, 1, 0, "verified", True), delta("a", 1, 3, 1, "expertNotes", "from a")],
+            "b.jsonl": [delta("b", 0, 2, 0, "verified", False), delta("b", 1, 4, 5, "verified", True, "gone")]
+        }
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for name, deltas in logs.items():
+                paths.append(os.path.join(tmpdir, name))
+                with open(paths[-1], 'w') as f:
+                    f.writelines(json.dumps(d) + "\n" for d in deltas)
+            merged = merge_review_logs(paths)
+            # Order of the logs and repeated logs must not change the result
+            reordered = merge_review_logs(list(reversed(paths)) + paths)
+            
+            # A line without its value is rejected with the file and line, not mid-merge
+            truncated = os.path.join(tmpdir, "truncated.jsonl")
+            with open(truncated, 'w') as f:
+                f.write(json.dumps({key: value for key, value in delta("c", 0, 5, 0, "verified", True).items()
+                                    if key != 'value'}) + "\n")
+            try:
+                merge_review_logs([truncated])
+                print("❌ ERROR: Delta without a value was accepted")
+                return False
+            except ValueError as e:
+                if "truncated.jsonl: delta 1 lacks value" not in str(e):
+                    print(f"❌ ERROR: Unexpected error for a delta without a value: {e}")
+                    return False
+        
+        if merged != reordered or len(merged) != 4:
+            print("❌ ERROR: Merged log depends on the order of the logs")
+            return False
+        
+        # The correlations were reordered since the deltas were recorded
+        data = {'foods': [{'id': 0, 'name': "kale", 'correlations': [
+            {'metabolite': "M1", 'reference': "R1", 'verified': None, 'expertNotes': ""},
+            {'metabolite': "M0", 'reference': "R0", 'verified': None, 'expertNotes': ""}]}]}
+        counts = apply_review_deltas(data, merged)
+        correlations = data['foods'][0]['correlations']
+        
+        if correlations[1]['verified'] is not False or correlations[0]['expertNotes'] != "from a" or \
+           counts != {'applied': 3, 'unmatched': 1, 'experts': 2}:
+            print("❌ ERROR: Review deltas were applied to the wrong correlations")
+            return False
+        
+        print(f"✅ Merged {len(merged)} changes from {counts['experts']} experts deterministically")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in review log merge: {e}")
+        return False
+
+def test_review_consensus():
+    """Test the consensus merge of several reviewers' exports and the review store"""
+    print("\nTesting Review Consensus...")
+    
+    try:
+        def correlation(metabolite, verified, notes=""):
+            return {'metabolite': metabolite, 'reference': f"{metabolite} study", 'correlationType': "Positive",
+                    'verified': verified, 'expertNotes': notes}
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # A full export, a verified-only export and the review server's store
+            first = os.path.join(tmpdir, "alice", "all_correlations.json")
+            second = os.path.join(tmpdir, "bob", "verified_correlations.json")
+            store_file = os.path.join(tmpdir, "server.sqlite")
+            os.makedirs(os.path.dirname(first))
+            os.makedirs(os.path.dirname(second))
+            with open(first, 'w') as f:
+                json.dump({'foods': [{'name': "kale", 'correlations': [
+                    correlation("Lutein", True), correlation("Folate", False, "weak study"),
+                    correlation("Nitrate", None)]}]}, f)
+            with open(second, 'w') as f:
+                json.dump({'foods': [{'name': "kale", 'correlations': [
+                    correlation("Lutein", True), correlation("Folate", True)]}]}, f)
+            store = CorrelationStore(store_file)
+            store.upsert_food("kale", {'correlations': [correlation("Folate", True), correlation("Lutein", False)]})
+            store.close()
+            
+            consensus = merge_reviews([first, second, store_file])
+            data = consensus.consensus_data()
+            conflicts = list(consensus.conflicts())
+            stats = consensus.statistics()
+            strict = merge_reviews([first, second], missing_as_rejected=True).statistics()
+        
+        correlations = {c['metabolite']: c for c in data['foods'][0]['correlations']}
+        if correlations['Folate']['verified'] is not True or correlations['Lutein']['verified'] is not True or \
+           correlations['Nitrate']['verified'] is not None or \
+           correlations['Folate']['expertNotes'] != "all_correlations: weak study":
+            print("❌ ERROR: Consensus decisions are wrong")
+            return False
+        
+        if [c['metabolite'] for c in conflicts] != ["Lutein", "Folate"] or \
+           conflicts[1]['rejected_by'] != "all_correlations" or stats['conflicts'] != 2 or \
+           stats['observed_agreement'] != 0.3333 or strict['conflicts'] != 1 or strict['undecided'] != 1 or strict['consensus_rejected'] != 1:
+            print("❌ ERROR: Conflicts or agreement statistics are wrong")
+            return False
+        
+        print(f"✅ Merged {stats['correlations']} correlations from {stats['reviewers']} reviewers "
+              f"with {stats['conflicts']} conflicts")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in review consensus: {e}")
+        return False
+
+def test_execution_policy():
+    """Test retries, overload pacing and the circuit breaker"""
+    print("\nTesting Execution Policy...")
+    
+    try:
+        policy = ExecutionPolicy(timeout=5, retry_attempts=3, base_delay=0.01, max_delay=0.05,
+                                 failure_threshold=3, reset_timeout=60)
+        attempts = []
+        
+        def flaky(timeout):
+            attempts.append(timeout)
+            if len(attempts) == 1:
+                raise BackendOverloaded("busy", retry_after=None)
+            if len(attempts) == 2:
+                raise BackendError("connection reset")
+            return "ok"
+        
+        if policy.call(flaky) != "ok" or attempts != [5, 5, 5]:
+            print("❌ ERROR: Policy did not retry failed calls with the deadline")
+            return False
+        
+        print(f"✅ Call succeeded after {len(attempts) - 1} retries")
+        
+        def dead(timeout):
+            raise BackendError("backend is down")
+        
+        for _ in range(2):
+            try:
+                policy.call(dead)
+            except CircuitOpenError:
+                break
+            except BackendError:
+                continue
+        
+        if not policy.breaker.is_open:
+            print("❌ ERROR: Circuit breaker did not open for a dead backend")
+            return False
+        
+        try:
+            policy.call(lambda timeout: "should not run")
+            print("❌ ERROR: Open circuit breaker let a call through")
+            return False
+        except CircuitOpenError:
+            pass
+        
+        print("✅ Circuit breaker stopped calls to a dead backend")
+        
+        # A trial call that fails with a non-backend error must not leave the breaker stuck open
+        recovering = ExecutionPolicy(timeout=5, retry_attempts=0, failure_threshold=1, reset_timeout=0.05)
+        def malformed(timeout):
+            raise ValueError("malformed response")
+        for fn in (dead, malformed):
+            time.sleep(0.06)
+            try:
+                recovering.call(fn)
+            except (BackendError, ValueError):
+                pass
+        time.sleep(0.06)
+        if recovering.breaker.failures != 2 or recovering.call(lambda timeout: "ok") != "ok" or \
+           recovering.breaker.is_open:
+            print("❌ ERROR: Circuit breaker did not recover after a malformed trial response")
+            return False
+        
+        print("✅ Circuit breaker recovered after a malformed trial response")
+        
+        class DeadBackend(FakeBackend):
+            def generate(self, prompt, timeout=None):
+                raise BackendError("backend is down")
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            integration = LlamaIntegration(output_file=os.path.join(tmpdir, "correlations.json"),
+                                           backend=DeadBackend(), policy=policy)
+            if integration.prompts:
+                failed = integration.process_all_foods(max_foods=2)
+                if len(failed) != 2 or not all(entry.get('fallback') for entry in failed.values()) or \
+                   integration.checkpointed_foods():
+                    print("❌ ERROR: Fallback results of a dead backend were checkpointed as done")
+                    return False
+                
+                # A resumed run with a working backend retries the failed foods
+                integration.backend = FakeBackend()
+                integration.policy = ExecutionPolicy(timeout=5, retry_attempts=1)
+                resumed = integration.process_all_foods(max_foods=2, resume=True)
+                if any(entry.get('fallback') for entry in resumed.values()) or \
+                   integration.checkpointed_foods() != set(resumed):
+                    print("❌ ERROR: Resumed run did not retry the fallback foods")
+                    return False
+                
+                print("✅ Fallback results were marked and retried on resume")
+                
+                # A food whose processing raised is retried on resume as well
+                first_food = next(iter(resumed))
+                process_food = integration.process_food
+                def broken(food_name, prompt, response=None):
+                    if food_name == first_food:
+                        raise ValueError("unparseable response")
+                    return process_food(food_name, prompt, response)
+                integration.process_food = broken
+                errored = integration.process_all_foods(max_foods=2)
+                if 'error' not in errored[first_food] or integration.checkpointed_foods() == set(errored):
+                    print("❌ ERROR: Errored food was checkpointed as done")
+                    return False
+                
+                integration.process_food = process_food
+                retried = integration.process_all_foods(max_foods=2, resume=True)
+                if 'error' in retried[first_food] or integration.checkpointed_foods() != set(retried):
+                    print("❌ ERROR: Resumed run did not retry the errored food")
+                    return False
+                
+                print("✅ Errored foods were retried on resume")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in execution policy: {e}")
+        return False
+
+def test_benchmark_pipeline():
+    """Test the pipeline benchmark on a small food count"""
+    print("\nTesting Pipeline Benchmark...")
+    
+    try:
+        prompt = 'the food item "apple" in blood'
+        if FakeBackend().generate(prompt) != FakeBackend().generate(prompt):
+            print("❌ ERROR: Fake backend responses are not deterministic")
+            return False
+        
+        result = run_size(20, repeats=1)
+        expected = ["generate_all_prompts", "generate_all_prompts_cached", "call_llama", "parse_llama_response",
+                    "save_correlations", "create_expert_interface_data"]
+        if list(result["stages"]) != expected or result["peak_rss_mb"] <= 0:
+            print("❌ ERROR: Benchmark did not report every pipeline stage")
+            return False
+        
+        if result["stages"]["call_llama"]["samples"] != 20:
+            print("❌ ERROR: Benchmark did not time every food")
+            return False
+        
+        print(f"✅ Benchmarked {len(expected)} stages at {result['foods']} foods")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ERROR in pipeline benchmark: {e}")
+        return False
+
 def test_file_structure():
     """Test that all required files exist"""
     print("\nTesting File Structure...")
@@ -145,10 +1397,18 @@ def test_json_files():
     for file in json_files:
         if os.path.exists(file):
             try:
-                with open(file, 'r') as f:
-                    data = json.load(f)
+                # Indexed from a copy so the offsets sidecar is not left in the working tree
+                with tempfile.TemporaryDirectory() as tmpdir, \
+                     IndexedJSON(shutil.copy(file, tmpdir)) as data:
+                    # Parse every entry through the offset index
+                    for key in data:
+                        value = data[key]
+                        if isinstance(value, LazyJSONArray):
+                            list(value)
+                        elif isinstance(value, LazyJSONObject):
+                            value.items()
                 print(f"✅ {file} is valid JSON")
-            except json.JSONDecodeError as e:
+            except (json.JSONDecodeError, ValueError) as e:
                 print(f"❌ ERROR: {file} contains invalid JSON: {e}")
                 return False
         else:
@@ -165,6 +1425,28 @@ def main():
         test_file_structure,
         test_food_analyzer,
         test_llama_integration,
+        test_concurrent_processing,
+        test_response_cache,
+        test_batched_generation,
+        test_prompt_prefix_state,
+        test_response_parser,
+        test_llama_backends,
+        test_compact_interface_data,
+        test_metabolite_index,
+        test_search_index,
+        test_metabolite_normalizer,
+        test_dietary_exposure,
+        test_association_matrix,
+        test_synthetic_dataset,
+        test_streaming_json,
+        test_json_index,
+        test_correlation_store,
+        test_expert_server,
+        test_review_log,
+        test_review_consensus,
+        test_prompt_templates,
+        test_execution_policy,
+        test_benchmark_pipeline,
         test_json_files
     ]
     